@@ -0,0 +1,262 @@
+from contextlib import redirect_stdout
+from datetime import datetime
+import argparse
+import io
+import json
+import os
+import pickle
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+"""
+Benchmarks of the hot paths against generated data.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --compare results.json
+
+Everything runs against a temporary data directory (or --data to keep and reuse one),
+tim's own files are never touched. The results are written as json so runs of different
+versions can be compared with --compare.
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ran in a fresh interpreter for the end to end timings
+CLI = "import sys; from tim.main import main; sys.argv[0] = 'tim'; main()"
+
+
+def isolate(directory):
+    """Point tim's data and config at directory, has to happen before tim is imported"""
+    os.environ["XDG_DATA_HOME"] = os.path.join(directory, "data")
+    os.environ["XDG_CONFIG_HOME"] = os.path.join(directory, "config")
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+class Runner:
+    def __init__(self, repeat, only=None):
+        self.repeat = repeat
+        self.only = only
+        self.results = {}
+
+    def bench(self, name, function, setup=None, repeat=None):
+        """Time function(setup()) repeat times, setup not being timed"""
+        if self.only is not None and self.only not in name:
+            return
+        runs = []
+        for _ in range(repeat or self.repeat):
+            value = None if setup is None else setup()
+            start = time.perf_counter()
+            function(value)
+            runs.append(time.perf_counter() - start)
+        self.results[name] = {
+            "runs": runs,
+            "min": min(runs),
+            "median": statistics.median(runs),
+        }
+        print(f"{name:40} {min(runs) * 1000:10.2f} ms", file=sys.stderr)
+
+    def cli(self, argv, repeat=None):
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        command = [sys.executable, "-c", CLI, *argv]
+
+        def run(_):
+            subprocess.run(command, env=env, stdout=subprocess.DEVNULL, check=True)
+
+        self.bench(f"cli {' '.join(argv)}", run, repeat=repeat)
+
+
+def quiet(function):
+    def run(value):
+        with redirect_stdout(io.StringIO()):
+            function(value)
+
+    return run
+
+
+def benchmarks(runner: Runner, storage):
+    from tim.tim import TimManager
+    from tim.render import RenderCache
+    from tim.report import report, ReportCache
+    from tim.export import iter_entries, iter_rows
+    from tim.search import SearchIndex
+    from tim import serialize
+
+    projects = storage.load_projects()
+    events = storage.load_events()
+    manager = TimManager.load(storage=storage)
+    log = manager.latest()
+    names = [project.name for _, project in projects.list_projects()]
+    # the same number of lookups whatever the sizes so runs stay comparable
+    names = names[:: max(len(names) // 100, 1)][:100]
+    prefixes = [name[:4] for name in names]
+
+    runner.bench("load projects", lambda _: storage.load_projects())
+    runner.bench("load events", lambda _: storage.load_events())
+    # the tables read from memory, against the pickles they used to be
+    for name, table in (("projects", projects), ("events", events)):
+        written, pickled = serialize.dumps(table), pickle.dumps(table)
+        runner.bench(f"serialize.loads {name}", lambda _: serialize.loads(written))
+        runner.bench(
+            f"serialize.loads {name} (pickle)", lambda _: pickle.loads(pickled)
+        )
+    runner.bench("TimManager.load", lambda _: TimManager.load(storage=storage))
+    runner.bench(
+        "TimManager.latest",
+        lambda m: m.latest(),
+        setup=lambda: TimManager.load(storage=storage),
+    )
+    runner.bench("Tim.show", quiet(lambda _: log.show(projects, events)))
+    render = RenderCache(projects, events)
+    runner.bench(
+        "Tim.show (warm render cache)",
+        quiet(lambda _: log.show(projects, events, render)),
+    )
+    runner.bench("Tim.export", lambda _: log.export(events))
+    runner.bench(
+        f"ProjectTable.find_project x{len(names)}",
+        lambda _: [projects.find_project(name) for name in names],
+    )
+    runner.bench(
+        f"ProjectTable.resolve_project prefix x{len(prefixes)}",
+        lambda _: [projects.resolve_project(prefix) for prefix in prefixes],
+    )
+    def build(index):
+        index.build_events(events, None)
+        index.build_names(projects, None)
+
+    runner.bench("SearchIndex build", build, setup=lambda: SearchIndex(""))
+    index = SearchIndex("")
+    index.build_events(events, None)
+    index.build_names(projects, None)
+    runner.bench(
+        f"SearchIndex.search x{len(prefixes)}",
+        lambda _: [index.search(prefix, 20) for prefix in prefixes],
+    )
+    runner.bench(
+        "save log (one entry)",
+        lambda _: storage.save_log(log, log.update_event(0, log.events[0].id)),
+    )
+    runner.bench(
+        "export all days", lambda _: sum(1 for _ in iter_rows(manager, events))
+    )
+    runner.bench(
+        "export all entries (columns)",
+        lambda _: sum(len(batch["date"]) for batch in iter_entries(manager, events)),
+    )
+    def monthly(cache=None):
+        logs = TimManager.load(storage=storage)
+        return report(logs, events, by="task", group="month", cache=cache)
+
+    runner.bench("report (cold)", lambda _: monthly())
+    cache = ReportCache(storage.identity())
+    report(manager, events, cache=cache)
+    runner.bench("report (warm cache)", lambda _: monthly(cache))
+
+    runner.cli(["--help"])
+    runner.cli(["log", "show"])
+    runner.cli(["project", "find", names[0][:4]])
+    runner.cli(["event", "search", names[0][:4]])
+    runner.cli(["report", "--by", "task"])
+    runner.cli(["event", "list"], repeat=max(runner.repeat // 2, 1))
+
+
+def metadata(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "tasks": args.tasks,
+        "events": args.events,
+        "days": args.days,
+        "entries": args.entries,
+        "repeat": args.repeat,
+    }
+
+
+def compare(old, new):
+    sizes = ["tasks", "events", "days", "entries"]
+    if any(old["meta"].get(size) != new["meta"][size] for size in sizes):
+        print("The data sizes differ between the runs, the timings aren't comparable.")
+    print(f"{'':40} {'before':>10} {'after':>10}")
+    for name, result in new["results"].items():
+        before = old["results"].get(name)
+        if before is None:
+            print(f"{name:40} {'':>10} {result['median'] * 1000:8.2f}ms")
+            continue
+        ratio = result["median"] / before["median"]
+        print(
+            f"{name:40} {before['median'] * 1000:8.2f}ms "
+            f"{result['median'] * 1000:8.2f}ms  x{ratio:.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark tim against generated data."
+    )
+    parser.add_argument(
+        "--tasks", type=int, default=10_000, help="Tasks in total (10 a project)."
+    )
+    parser.add_argument("--events", type=int, default=50_000, help="Event definitions.")
+    parser.add_argument(
+        "--days", type=int, default=3 * 365, help="Days of logs up to today."
+    )
+    parser.add_argument("--entries", type=int, default=20, help="Entries per day.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each benchmark.")
+    parser.add_argument(
+        "--only", type=str, help="Only the benchmarks with this in their name."
+    )
+    parser.add_argument(
+        "--data",
+        type=str,
+        help="Directory to generate the data in (reused when it's there).",
+    )
+    parser.add_argument(
+        "--output", type=str, help="Write the results to this json file."
+    )
+    parser.add_argument(
+        "--compare", type=str, help="Results of an earlier run to compare to."
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp:
+        directory = temp if args.data is None else os.path.abspath(args.data)
+        isolate(directory)
+        from tim.storage import open_storage
+        from synthetic import generate
+
+        storage = open_storage()
+        if len(storage.list_logs()) == 0:
+            start = time.perf_counter()
+            generate(storage, 0, args.tasks, args.events, args.days, args.entries)
+            print(f"generated in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+        runner = Runner(args.repeat, args.only)
+        benchmarks(runner, storage)
+
+    results = {"meta": metadata(args), "results": runner.results}
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
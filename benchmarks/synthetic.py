@@ -0,0 +1,92 @@
+from tim.project import ProjectTable, Project, Task
+from tim.event import EventTable, EventDefinition, EventID, EventEmpty
+from tim.time import TimeSet, TimeFloat, local_tz
+from tim.tim import Tim
+
+from datetime import datetime, timedelta
+import random
+
+"""
+Made up projects, events and logs of a realistic shape for the benchmarks.
+
+Everything comes from a seeded random.Random so two runs with the same sizes benchmark
+the same data.
+"""
+
+WORDS = [
+    "billing",
+    "review",
+    "meeting",
+    "support",
+    "design",
+    "deploy",
+    "planning",
+    "research",
+    "testing",
+    "docs",
+    "hiring",
+    "migration",
+    "cleanup",
+    "onboarding",
+    "reporting",
+    "travel",
+]
+
+
+def name(rng, words=2):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).title()
+
+
+def make_projects(rng, tasks=10_000, tasks_per_project=10):
+    projects = ProjectTable()
+    for project_id in range(tasks // tasks_per_project):
+        project = Project(project_id, f"{name(rng)} {project_id}")
+        for task_id in range(tasks_per_project):
+            project.add_task(Task(task_id, name(rng)))
+        projects.add_project(project)
+    return projects
+
+
+def make_events(rng, projects: ProjectTable, count=50_000):
+    events = EventTable()
+    ids = [(project.id, len(project.tasks)) for _, project in projects.list_projects()]
+    for _ in range(count):
+        project_id, tasks = rng.choice(ids)
+        events.add_event(
+            EventDefinition(project_id, rng.randrange(tasks), name(rng, words=4))
+        )
+    return events
+
+
+def make_log(rng, day: datetime, event_ids, entries=20, open=False):
+    """A working day from 8:00 in entries of 5 to 45 minutes, a few of them empty"""
+    time = day.replace(hour=8, minute=0, second=0, microsecond=0, tzinfo=local_tz())
+    times = [TimeSet(time)]
+    events = []
+    for _ in range(entries):
+        time += timedelta(minutes=rng.randrange(5, 46))
+        times.append(TimeSet(time))
+        if rng.random() < 0.05:
+            events.append(EventEmpty())
+        else:
+            # days mostly reuse a handful of events
+            events.append(EventID(rng.choice(event_ids)))
+    if open:
+        times[-1] = TimeFloat()
+    return Tim(times, events, day)
+
+
+def generate(storage, seed=0, tasks=10_000, events=50_000, days=3 * 365, entries=20):
+    """Fill storage with the tables and a log for every day up to today"""
+    rng = random.Random(seed)
+    projects = make_projects(rng, tasks)
+    storage.save_projects(projects)
+    event_table = make_events(rng, projects, events)
+    storage.save_events(event_table)
+    all_ids = list(event_table.table)
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for age in range(days, -1, -1):
+        favourites = rng.sample(all_ids, 8)
+        start = today - timedelta(days=age)
+        storage.save_log(make_log(rng, start, favourites, entries, open=age == 0))
+    return projects, event_table
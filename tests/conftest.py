@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+# tim.constants works out where everything goes when it's imported, so this has to happen
+# before any test imports tim
+_home = tempfile.mkdtemp(prefix="tim-tests-")
+os.environ["XDG_DATA_HOME"] = os.path.join(_home, "data")
+os.environ["XDG_CONFIG_HOME"] = os.path.join(_home, "config")
+
+import pytest  # noqa: E402
+
+
+def file_storage(directory):
+    from tim.storage import FileStorage
+
+    return FileStorage(
+        os.path.join(directory, "project_definitions.pkl"),
+        os.path.join(directory, "event_definitions.pkl"),
+        os.path.join(directory, "logs"),
+    )
+
+
+def sqlite_storage(directory):
+    from tim.storage import SqliteStorage
+
+    return SqliteStorage(os.path.join(directory, "tim.sqlite3"))
+
+
+@pytest.fixture(params=["file", "sqlite"])
+def open_store(request, tmp_path):
+    """A function opening (again) a storage of each backend in tmp_path"""
+    directory = str(tmp_path / "store")
+    return lambda: (file_storage if request.param == "file" else sqlite_storage)(directory)
@@ -0,0 +1,83 @@
+from tim import fileio
+from tim.batch import BatchError, run_batch
+from tim.event import EventDefinition
+from tim.project import Project
+from tim.session import Session
+from tim.storage import StaleError
+
+from conftest import file_storage
+
+import os
+
+import pytest
+
+
+def test_a_failed_lookup_saves_nothing(open_store):
+    session = Session(open_store())
+    run_batch(["project new 1 work", "project add work 1 dev"], session)
+    with pytest.raises(BatchError, match="Line 2"):
+        run_batch(["event add 1 1 shouldnotstay", "project add nosuchproject 1 x"], session)
+    with pytest.raises(BatchError, match="Line 1"):
+        run_batch(["event add work nosuchtask x"], session)
+    with pytest.raises(BatchError, match="Line 2"):
+        run_batch(["event add work dev y", "event delete 7"], session)
+    assert list(Session(open_store()).events.list_events()) == []
+
+
+def add_project(session, project_id, name):
+    session.projects.add_project(Project(project_id, name))
+    session.save_project(project_id)
+
+
+def test_batch_failing_midway_saves_nothing(open_store):
+    session = Session(open_store())
+    with pytest.raises(RuntimeError):
+        with session.batch():
+            add_project(session, 1, "work")
+            session.events.add_event(EventDefinition(1, 1, "coding"))
+            session.save_event(1)
+            raise RuntimeError("midway")
+    # the session dropped the changes it couldn't save
+    assert session.projects.get_project(1) is None
+    again = Session(open_store())
+    assert again.projects.get_project(1) is None
+    assert list(again.events.list_events()) == []
+
+
+def test_conflicting_save_rolls_back_the_batch(open_store):
+    ours, theirs = Session(open_store()), Session(open_store())
+    # loaded before theirs is saved
+    ours.projects, ours.events
+    add_project(theirs, 2, "home")
+    with pytest.raises(StaleError):
+        with ours.batch():
+            ours.events.add_event(EventDefinition(1, 1, "coding"))
+            ours.save_event(1)
+            add_project(ours, 1, "work")
+    again = Session(open_store())
+    assert sorted(id for id, _ in again.projects.list_projects()) == [2]
+    assert list(again.events.list_events()) == []
+    # started over, the batch goes through
+    with ours.batch():
+        add_project(ours, 1, "work")
+    assert sorted(id for id, _ in Session(open_store()).projects.list_projects()) == [1, 2]
+
+
+def test_interrupted_batch_is_finished_when_opened_again(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    session = Session(file_storage(directory))
+
+    def crash(plan):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(fileio, "_apply", crash)
+    with pytest.raises(KeyboardInterrupt):
+        with session.batch():
+            add_project(session, 1, "work")
+            session.save_log(session.logs.start())
+    monkeypatch.undo()
+    # nothing was moved into place yet
+    assert not os.path.exists(os.path.join(directory, "project_definitions.pkl"))
+    again = Session(file_storage(directory))
+    assert again.projects.get_project(1).name == "work"
+    assert len(again.logs.list_dates()) == 1
@@ -0,0 +1,24 @@
+from tim import daemon
+
+import socket
+import threading
+
+
+def test_closed_without_an_answer_is_no_daemon(tmp_path):
+    path = str(tmp_path / "daemon.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+
+    def hang_up():
+        connection, _ = server.accept()
+        connection.recv(65536)
+        connection.close()
+
+    thread = threading.Thread(target=hang_up)
+    thread.start()
+    try:
+        assert daemon.request(["log", "show"], path) is None
+    finally:
+        thread.join()
+        server.close()
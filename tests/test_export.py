@@ -0,0 +1,125 @@
+from tim import parallel
+from tim.event import EventDefinition, EventEmpty, EventID, EventTable
+from tim.export import ENTRY_COLUMNS, iter_entries, iter_rows, write_arrow, write_jsonl
+from tim.main import run
+from tim.project import Project, ProjectTable, Task
+from tim.session import Session
+from tim.tim import Tim, TimManager
+from tim.time import TimeFloat, TimeSet, local_tz
+
+from conftest import file_storage
+
+from datetime import datetime, timedelta
+import io
+import json
+
+import pytest
+
+DAYS = 10
+
+
+@pytest.fixture
+def storage(tmp_path):
+    """DAYS days of event 1 at 9:00, nothing at 10:00, event 2 from 11:00 to 12:00 or on"""
+    storage = file_storage(str(tmp_path))
+    projects = ProjectTable()
+    projects.add_project(Project(1, "work", {1: Task(1, "dev"), 2: Task(2, "review")}))
+    storage.save_projects(projects)
+    events = EventTable()
+    events.add_event(EventDefinition(1, 1, "parser"))
+    events.add_event(EventDefinition(1, 2, "pr"))
+    storage.save_events(events)
+    for day in range(DAYS):
+        start = datetime(2024, 3, 1, 9, tzinfo=local_tz()) + timedelta(days=day)
+        times = [TimeSet(start + timedelta(hours=hours)) for hours in range(4)]
+        if day == DAYS - 1:
+            times[-1] = TimeFloat()
+        storage.save_log(Tim(times, [EventID(1), EventEmpty(), EventID(2)], start))
+    return storage
+
+
+def entries(storage, jobs=1, **filters):
+    logs = TimManager.load(storage=storage)
+    events = storage.load_events()
+    batches = list(iter_entries(logs, events, jobs=jobs, **filters))
+    return {
+        name: [value for batch in batches for value in batch[name]]
+        for name in ENTRY_COLUMNS
+    }
+
+
+def test_entries(storage):
+    found = entries(storage, start="2024-03-09")
+    assert found["position"] == [0, 1, 2] * 2
+    assert found["duration"] == [3600, 3600, 3600, 3600, 3600, None]
+    assert found["end"][-1] is None
+    assert found["event_id"] == [1, None, 2] * 2
+    assert found["description"] == ["parser", None, "pr"] * 2
+    only = entries(storage, project=1, task=2)
+    assert only["event_id"] == [2] * DAYS
+
+
+def test_more_jobs_give_the_same(storage, monkeypatch):
+    monkeypatch.setattr(parallel, "MIN_DAYS_PER_JOB", 1)
+    logs = TimManager.load(storage=storage)
+    events = storage.load_events()
+    assert list(iter_rows(logs, events, jobs=2)) == list(iter_rows(logs, events))
+    assert entries(storage, jobs=2) == entries(storage)
+
+
+def test_batches_hold_whole_days(storage, monkeypatch):
+    monkeypatch.setattr("tim.export.BATCH_SIZE", 4)
+    logs = TimManager.load(storage=storage)
+    batches = iter_entries(logs, storage.load_events())
+    sizes = [len(batch["date"]) for batch in batches]
+    assert sizes == [6] * (DAYS // 2)
+
+
+def test_jsonl(storage):
+    out = io.StringIO()
+    logs = TimManager.load(storage=storage)
+    write_jsonl(iter_entries(logs, storage.load_events()), out)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert len(lines) == DAYS * 3
+    assert lines[0]["date"] == "2024-03-01"
+    assert datetime.fromisoformat(lines[0]["start"]) == datetime(
+        2024, 3, 1, 9, tzinfo=local_tz()
+    )
+    assert lines[1]["event_id"] is None and lines[-1]["end"] is None
+
+
+@pytest.mark.parametrize("format", ["arrow", "parquet"])
+def test_arrow(storage, tmp_path, format):
+    pyarrow = pytest.importorskip("pyarrow")
+    path = str(tmp_path / f"entries.{format}")
+    logs = TimManager.load(storage=storage)
+    write_arrow(iter_entries(logs, storage.load_events()), path, format)
+    if format == "parquet":
+        import pyarrow.parquet
+
+        table = pyarrow.parquet.read_table(path)
+    else:
+        import pyarrow.ipc
+
+        table = pyarrow.ipc.open_file(path).read_all()
+    assert table.column_names == ENTRY_COLUMNS
+    assert table.num_rows == DAYS * 3
+    assert table.column("duration").null_count == 1
+    assert table.column("description").to_pylist()[:3] == ["parser", None, "pr"]
+
+
+def test_all(storage, tmp_path):
+    path = str(tmp_path / "export.jsonl")
+
+    def exported(*argv):
+        argv = ["log", "export", "--format", "jsonl", "--output", path, *argv]
+        run(argv, Session(storage))
+        with open(path) as f:
+            return [json.loads(line)["date"] for line in f]
+
+    assert set(exported()) == {"2024-03-10"}
+    assert len(set(exported("--all"))) == DAYS
+    assert set(exported("--from", "2024-03-02", "--to", "2024-03-03")) == {
+        "2024-03-02",
+        "2024-03-03",
+    }
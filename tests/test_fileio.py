@@ -0,0 +1,83 @@
+from tim import fileio
+from tim.fileio import Transaction, atomic_write, lock_path, locked, recover
+
+import os
+import threading
+
+import pytest
+
+
+def test_lock_files_are_removed(tmp_path):
+    path = str(tmp_path / "table.pkl")
+    with locked(path):
+        assert os.path.exists(lock_path(path))
+        with locked(path, shared=True):
+            pass
+        assert os.path.exists(lock_path(path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_locked_takes_turns(tmp_path):
+    path = str(tmp_path / "counter")
+    atomic_write(path, b"0")
+
+    def add():
+        for _ in range(50):
+            with locked(path):
+                with open(path, "rb") as f:
+                    count = int(f.read())
+                atomic_write(path, str(count + 1).encode())
+
+    threads = [threading.Thread(target=add) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with open(path, "rb") as f:
+        assert int(f.read()) == 400
+    assert os.listdir(tmp_path) == ["counter"]
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_transaction_abort_changes_nothing(tmp_path):
+    path = str(tmp_path / "a")
+    atomic_write(path, b"old")
+    transaction = Transaction(str(tmp_path / ".transaction"))
+    transaction.write(path, b"new")
+    transaction.write(str(tmp_path / "b"), b"new")
+    transaction.abort()
+    assert read(path) == b"old"
+    assert os.listdir(tmp_path) == ["a"]
+
+
+def test_interrupted_commit_is_finished_by_recover(tmp_path, monkeypatch):
+    intent = str(tmp_path / ".transaction")
+    a, b, c = (str(tmp_path / name) for name in "abc")
+    atomic_write(a, b"old a")
+    atomic_write(c, b"old c")
+    transaction = Transaction(intent)
+    transaction.write(a, b"new a")
+    transaction.write(b, b"new b")
+    transaction.remove(c)
+
+    def crash(plan):
+        # the first rename made it, then the power went
+        path, temp = plan["renames"][0]
+        os.replace(temp, path)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(fileio, "_apply", crash)
+    with pytest.raises(KeyboardInterrupt):
+        transaction.commit()
+    monkeypatch.undo()
+    assert os.path.exists(intent)
+    assert read(a) == b"new a" and not os.path.exists(b) and read(c) == b"old c"
+
+    assert recover(intent)
+    assert read(a) == b"new a" and read(b) == b"new b" and not os.path.exists(c)
+    assert sorted(os.listdir(tmp_path)) == ["a", "b"]
+    assert not recover(intent)
@@ -0,0 +1,134 @@
+from tim.event import EventDefinition, EventEmpty, EventID, EventTable
+from tim.fsck import check_day, check_tables, fsck, repair
+from tim.project import Project, ProjectTable, Task
+from tim.session import Session
+from tim.storage import FileStorage, SqliteStorage
+from tim.tim import Tim
+from tim.time import TimeFloat, TimeSet, local_tz
+
+from datetime import datetime, timedelta
+import os
+import sqlite3
+
+
+def log(key, hours, events):
+    """A log of key, hours after 9:00 for the times (None floating), event ids (None empty)"""
+    start = datetime.fromisoformat(f"{key}T09:00").replace(tzinfo=local_tz())
+    times = [
+        TimeFloat() if hour is None else TimeSet(start + timedelta(hours=hour))
+        for hour in hours
+    ]
+    events = [EventEmpty() if id is None else EventID(id) for id in events]
+    return Tim(times, events, start)
+
+
+def tables():
+    projects = ProjectTable()
+    projects.add_project(Project(1, "work", {1: Task(1, "dev")}))
+    events = EventTable()
+    events.add_event(EventDefinition(1, 1, "fine"))
+    return projects, events
+
+
+def fill(storage):
+    projects, events = tables()
+    storage.save_projects(projects)
+    storage.save_events(events)
+    storage.save_log(log("2024-03-01", [0, 1, 2, None], [1, 9, None]))
+    # one event too many, with an entry ending before it starts
+    storage.save_log(log("2024-03-02", [0, -1], [1, 1]))
+    # 1 ends before it starts, 2 overlaps 0
+    storage.save_log(log("2024-03-03", [0, 2, 1, 3], [1, 1, 1]))
+    storage.save_log(log("2024-03-04", [0, None, 2], [1, 1]))
+    # starts before the day before ends
+    storage.save_log(log("2024-03-05", [-23, -22], [1]))
+    return storage
+
+
+def kinds(problems):
+    return [(problem.kind, problem.target) for problem in problems]
+
+
+def test_check_day(open_store):
+    storage = fill(open_store())
+    ids = frozenset([1])
+    found, first, last = check_day(storage, "2024-03-01", ids)
+    assert kinds(found) == [("missing event", 1)]
+    assert (last - first) == 120
+    found, _, _ = check_day(storage, "2024-03-02", ids)
+    assert kinds(found) == [("lengths", None), ("negative", 0)]
+    found, _, _ = check_day(storage, "2024-03-03", ids)
+    assert kinds(found) == [("negative", 1), ("overlap", 2)]
+    found, _, _ = check_day(storage, "2024-03-04", ids)
+    assert kinds(found) == [("floating", 1)]
+
+
+def test_check_tables():
+    projects, events = tables()
+    assert check_tables(projects, events) == []
+    events.set_event(2, EventDefinition(1, 5, "no such task"))
+    events.set_event(3, EventDefinition(7, 1, "no such project"))
+    events.last_key = 2
+    assert kinds(check_tables(projects, events)) == [
+        ("missing task", 2),
+        ("missing project", 3),
+        ("last key", None),
+    ]
+
+
+def test_fsck_across_days(open_store):
+    problems, days = fsck(Session(fill(open_store())))
+    assert days == 5
+    [across] = [problem for problem in problems if problem.name == "2024-03-05"]
+    assert across.kind == "overlap" and "2024-03-04" in across.message
+
+
+def test_repair(open_store):
+    storage = fill(open_store())
+    events = storage.load_events()
+    events.set_event(2, EventDefinition(7, 3, "no such project"))
+    events.set_event(3, EventDefinition(1, 4, "no such task"))
+    storage.save_events(events)
+    session = Session(storage)
+    problems, _ = fsck(session)
+    repaired = repair(session, problems)
+    assert {problem.kind for problem in repaired} == {
+        "lengths",
+        "missing event",
+        "missing project",
+        "missing task",
+    }
+    assert all(problem.repairable(storage) for problem in repaired)
+
+    storage = open_store()
+    left, _ = fsck(Session(storage))
+    assert {problem.kind for problem in left} == {"negative", "overlap", "floating"}
+    assert not any(problem.repairable(storage) for problem in left)
+    projects = storage.load_projects()
+    assert projects.get_project(7).get_task(3).name == "missing task 3"
+    assert projects.get_project(1).get_task(4).name == "missing task 4"
+    assert storage.load_log("2024-03-01").events[1].is_empty()
+    assert len(storage.load_log("2024-03-02").events) == 1
+
+
+def test_unreadable_log(open_store):
+    storage = fill(open_store())
+    if isinstance(storage, FileStorage):
+        with open(storage.log_path("2024-03-01"), "wb") as f:
+            f.write(b"garbage")
+    else:
+        with sqlite3.connect(storage.path) as conn:
+            conn.execute("UPDATE logs SET start_date = 'x' WHERE date = '2024-03-01'")
+    session = Session(storage)
+    problems, _ = fsck(session)
+    [unreadable] = [problem for problem in problems if problem.kind == "unreadable log"]
+    # only a file of its own can be set aside
+    assert unreadable.repairable(storage) == isinstance(storage, FileStorage)
+    repaired = repair(session, problems)
+    assert (unreadable in repaired) == isinstance(storage, FileStorage)
+    if isinstance(storage, FileStorage):
+        assert os.path.exists(os.path.join(storage.log_dir, ".2024-03-01.pkl.corrupt"))
+        assert "2024-03-01" not in open_store().list_logs()
+    else:
+        assert isinstance(storage, SqliteStorage)
+        assert "2024-03-01" in open_store().list_logs()
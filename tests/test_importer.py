@@ -0,0 +1,62 @@
+from tim.event import EventDefinition, EventTable
+from tim.importer import Importer
+from tim.project import Project, ProjectTable, Task
+
+
+def tables():
+    projects = ProjectTable()
+    projects.add_project(Project(1, "work"))
+    projects.get_project(1).add_task(Task(1, "dev"))
+    events = EventTable()
+    events.add_event(EventDefinition(1, 1, "coding"))
+    return projects, events
+
+
+def test_rows_with_a_conflict_change_nothing():
+    projects, events = tables()
+    result = Importer(projects, events, update=False).apply(
+        [
+            # a new project whose task has no name
+            {"project_id": "2", "project_name": "new", "task_id": "1"},
+            # a new task whose event is already something else
+            {
+                "project_id": "1",
+                "task_id": "2",
+                "task_name": "review",
+                "event_id": "1",
+                "description": "reviewing",
+            },
+            # a new project with an unreadable event id
+            {
+                "project_id": "3",
+                "project_name": "other",
+                "task_id": "1",
+                "task_name": "x",
+                "event_id": "one",
+                "description": "y",
+            },
+        ]
+    )
+    assert [number for number, _ in result.conflicts] == [1, 2, 3]
+    assert sorted(id for id, _ in projects.list_projects()) == [1]
+    assert projects.get_task(1, 2) is None
+    assert events.get_event(1) == EventDefinition(1, 1, "coding")
+    assert sum(result.counts.values()) == 0
+
+
+def test_a_whole_row_is_added():
+    projects, events = tables()
+    result = Importer(projects, events).apply(
+        [
+            {
+                "project_id": "2",
+                "project_name": "new",
+                "task_id": "1",
+                "task_name": "dev",
+                "description": "planning",
+            }
+        ]
+    )
+    assert result.conflicts == []
+    assert projects.get_task(2, 1).name == "dev"
+    assert events.get_event(2) == EventDefinition(2, 1, "planning")
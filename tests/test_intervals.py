@@ -0,0 +1,106 @@
+from tim.columnar import to_minute
+from tim.intervals import LONG, OPEN, Interval, IntervalIndex, closed, end_of
+from tim.time import local_tz
+
+from datetime import datetime
+import random
+
+
+def minute(text):
+    return to_minute(datetime.fromisoformat(text).replace(tzinfo=local_tz()))
+
+
+def entries(key, *times):
+    """Intervals of a day's times, None being the floating last one"""
+    ends = [OPEN if time is None else minute(time) for time in times[1:]]
+    return [
+        Interval(minute(start), end, key, i, i)
+        for i, (start, end) in enumerate(zip(times, ends))
+    ]
+
+
+NOW = minute("2024-03-05T12:00")
+
+
+def test_past_day_never_stopped_ends_with_its_day():
+    index = IntervalIndex("test")
+    index.set_day("2024-03-01", 1, entries("2024-03-01", "2024-03-01T09:00", None))
+    index.set_day(
+        "2024-03-02", 1, entries("2024-03-02", "2024-03-02T09:00", "2024-03-02T10:00")
+    )
+    [found] = index.at(minute("2024-03-01T23:00"), NOW)
+    assert found.end == minute("2024-03-02T00:00")
+    assert index.at(minute("2024-03-04T09:00"), NOW) == []
+    assert all(interval.end != OPEN for interval in index.intervals + index.long)
+
+
+def test_removing_the_latest_day_opens_the_one_before():
+    index = IntervalIndex("test")
+    index.set_day("2024-03-01", 1, entries("2024-03-01", "2024-03-01T09:00", None))
+    index.set_day("2024-03-02", 1, entries("2024-03-02", "2024-03-02T09:00", None))
+    assert [interval.key for interval in index.at(minute("2024-03-04T09:00"), NOW)] == [
+        "2024-03-02"
+    ]
+    index.set_day("2024-03-02", None, None)
+    [found] = index.at(minute("2024-03-04T09:00"), NOW)
+    assert found.key == "2024-03-01" and found.end == OPEN
+
+
+def test_past_day_closes_at_its_last_time():
+    index = IntervalIndex("test")
+    # past midnight, then an entry that was never stopped
+    index.set_day(
+        "2024-03-01",
+        1,
+        entries("2024-03-01", "2024-03-01T22:00", "2024-03-02T01:00", None),
+    )
+    index.set_day("2024-03-03", 1, entries("2024-03-03", "2024-03-03T09:00", None))
+    found = index.between(minute("2024-03-01T00:00"), minute("2024-03-03T00:00"), NOW)
+    assert [interval.end for interval in found] == [minute("2024-03-02T01:00")] * 2
+
+
+def test_between_matches_going_over_everything():
+    rng = random.Random(1)
+    index = IntervalIndex("test")
+    days = {}
+    for day in range(1, 29):
+        key = f"2024-02-{day:02}"
+        start = minute(f"{key}T08:00") + rng.randrange(120)
+        times = [start]
+        for _ in range(rng.randrange(1, 6)):
+            times.append(times[-1] + rng.randrange(-30, 300))
+        intervals = [
+            Interval(min(a, b), max(a, b), key, i, i, b < a)
+            for i, (a, b) in enumerate(zip(times, times[1:]))
+        ]
+        if rng.random() < 0.1:
+            # a time typed days wrong
+            end = times[-1] + rng.randrange(2, 5) * 24 * 60
+            intervals.append(Interval(times[-1], end, key, len(intervals), 0))
+        elif rng.random() < 0.3:
+            intervals.append(Interval(times[-1], OPEN, key, len(intervals), 0))
+        days[key] = intervals
+        index.set_day(key, 1, intervals)
+    # one changed and one removed out of order
+    index.set_day("2024-02-10", 2, days["2024-02-10"][:1])
+    days["2024-02-10"] = days["2024-02-10"][:1]
+    index.set_day("2024-02-28", None, None)
+    del days["2024-02-28"]
+
+    latest = max(days)
+    everything = sorted(
+        interval
+        for key, intervals in days.items()
+        for interval in (intervals if key == latest else closed(key, intervals))
+    )
+    for _ in range(200):
+        start = minute("2024-02-01T00:00") + rng.randrange(40 * 24 * 60)
+        end = start + rng.randrange(1, 600)
+        expected = [
+            interval
+            for interval in everything
+            if interval.start < end and end_of(interval, NOW) > start
+        ]
+        assert index.between(start, end, NOW) == expected
+    assert index.long
+    assert all(interval.end - interval.start <= LONG for interval in index.intervals)
@@ -0,0 +1,77 @@
+from tim import daemon, main
+from tim.trace import from_environment
+
+import pytest
+
+
+@pytest.fixture
+def routed(monkeypatch):
+    """The argv main() hands to the daemon, running nothing here"""
+    sent = []
+
+    def request(argv):
+        sent.append(argv)
+        return 0
+
+    monkeypatch.setattr(daemon, "request", request)
+    monkeypatch.setattr(main, "run", lambda argv: None)
+    return sent
+
+
+def run_main(monkeypatch, argv):
+    monkeypatch.setattr(main.sys, "argv", ["tim", *argv])
+    try:
+        main.main()
+    except SystemExit:
+        pass
+
+
+@pytest.mark.parametrize("command", ["daemon", "batch", "sync"])
+def test_local_commands_run_here_with_timings(monkeypatch, routed, command):
+    monkeypatch.delenv("TIM_TRACE", raising=False)
+    run_main(monkeypatch, ["--timings", command, "stop"])
+    run_main(monkeypatch, ["--timings-output", "t.json", command, "stop"])
+    assert routed == []
+
+
+@pytest.mark.parametrize("trace", ["1", "trace.json"])
+def test_local_commands_run_here_with_tim_trace(monkeypatch, routed, trace):
+    monkeypatch.setenv("TIM_TRACE", trace)
+    run_main(monkeypatch, ["daemon", "stop"])
+    run_main(monkeypatch, ["batch"])
+    assert routed == []
+
+
+def test_other_commands_go_to_the_daemon(monkeypatch, routed):
+    monkeypatch.setenv("TIM_TRACE", "1")
+    run_main(monkeypatch, ["log", "show"])
+    assert routed == [["--timings", "log", "show"]]
+
+
+def test_command_of():
+    assert main.command_of(["--timings-output", "x", "log", "show"]) == ("log", ["show"])
+    assert main.command_of(from_environment(["daemon", "stop"], {"TIM_TRACE": "1"})) == (
+        "daemon",
+        ["stop"],
+    )
+    assert main.command_of(["--timings"]) == (None, [])
+
+
+def test_import_from_stdin_runs_here(monkeypatch, routed):
+    monkeypatch.delenv("TIM_TRACE", raising=False)
+    run_main(monkeypatch, ["import", "-", "--format", "json"])
+    assert routed == []
+    run_main(monkeypatch, ["import", "projects.csv"])
+    assert routed == [["import", "projects.csv"]]
+
+
+def test_report_choices_are_those_of_report():
+    from tim import report
+
+    parser = main.build_parser()
+    for by in report.BY:
+        assert parser.parse_args(["report", "--by", by]).by == by
+    for group in report.GROUPS:
+        assert parser.parse_args(["report", "--group", group]).group == group
+    with pytest.raises(SystemExit):
+        parser.parse_args(["report", "--by", "nothing"])
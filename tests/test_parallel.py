@@ -0,0 +1,34 @@
+from tim import parallel
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+def double(storage, key, offset):
+    return storage + key * 2 + offset
+
+
+def test_results_come_in_the_order_of_the_keys():
+    keys = list(range(100))
+    results = list(parallel.map_days(1000, keys, double, (1,), jobs=3))
+    assert results == [(key, 1001 + key * 2) for key in keys]
+
+
+class Counting(ThreadPoolExecutor):
+    """Threads instead of processes, counting the days sent out"""
+
+    submitted = 0
+
+    def submit(self, function, *args):
+        Counting.submitted += len(args[-1])
+        return super().submit(function, *args)
+
+
+def test_days_are_sent_out_as_the_results_are_taken(monkeypatch):
+    monkeypatch.setattr(parallel, "ProcessPoolExecutor", Counting)
+    monkeypatch.setattr(parallel, "MAX_CHUNK", 2)
+    days = parallel.map_days(0, range(1000), double, (0,), jobs=2)
+    assert next(days) == (0, 0)
+    window = 2 * parallel.WINDOW * parallel.MAX_CHUNK
+    assert Counting.submitted <= window
+    assert [key for key, _ in days][-1] == 999
+    assert Counting.submitted == 1000
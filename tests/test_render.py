@@ -0,0 +1,20 @@
+from tim.event import EventDefinition, EventTable
+from tim.project import Project, ProjectTable, Task
+from tim.render import RenderCache
+
+
+def test_find_follows_the_event_table():
+    projects = ProjectTable()
+    projects.add_project(Project(1, "work", {1: Task(1, "dev")}))
+    events = EventTable()
+    events.add_event(EventDefinition(1, 1, "parser"))
+    events.add_event(EventDefinition(1, 1, "parser"))
+    render = RenderCache(projects, events)
+    assert render.find(EventDefinition(1, 1, "parser")) == 1
+    assert render.find(EventDefinition(1, 1, "review")) is None
+
+    event_id = events.add_event(EventDefinition(1, 1, "review"))
+    assert render.find(EventDefinition(1, 1, "review")) == event_id
+    events.delete_event(1)
+    assert render.find(EventDefinition(1, 1, "parser")) == 2
+    assert render.show_id(2) == "work - dev | parser"
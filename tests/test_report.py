@@ -0,0 +1,37 @@
+from tim.columnar import EMPTY, ColumnarLog
+from tim.report import ReportCache, summarize_columns
+
+from array import array
+import pickle
+
+
+def test_entries_ending_before_they_start_count_for_nothing():
+    columns = ColumnarLog(array("q", [0, 60, 30, 90]), array("i", [1, 2, EMPTY]))
+    assert list(columns.durations()) == [60, 0, 60]
+    assert summarize_columns(columns) == {1: 3600.0, 2: 0.0, None: 3600.0}
+
+
+def test_report_cache_of_another_version_is_started_over(tmp_path):
+    cache = ReportCache("test")
+    cache.put("2024-03-01", 1, {1: -60.0})
+    del cache.version
+    (tmp_path / "report.pkl").write_bytes(pickle.dumps(cache))
+    assert ReportCache.load("test", tmp_path / "report.pkl").days == {}
+
+
+def test_report_cache_saves_and_loads(tmp_path):
+    cache = ReportCache("test")
+    cache.put("2024-03-01", 1, {1: 60.0})
+    cache.save(tmp_path / "cache" / "report.pkl")
+    loaded = ReportCache.load("test", tmp_path / "cache" / "report.pkl")
+    assert loaded.get("2024-03-01", 1) == {1: 60.0}
+    assert [path.name for path in (tmp_path / "cache").iterdir()] == ["report.pkl"]
+
+
+def test_report_cache_of_a_class_that_is_gone(tmp_path):
+    # a pickle of tim.gone.ReportCache
+    (tmp_path / "report.pkl").write_bytes(
+        b"\x80\x04\x95\x1d\x00\x00\x00\x00\x00\x00\x00\x8c\x08tim.gone\x94\x8c\x0bReportCache"
+        b"\x94\x93\x94)\x81\x94."
+    )
+    assert ReportCache.load("test", tmp_path / "report.pkl").days == {}
@@ -0,0 +1,211 @@
+from tim import search
+from tim.constants import SEARCH_INDEX_LOCATION
+from tim.event import EventDefinition, EventTable
+from tim.project import Project, ProjectTable, Task
+from tim.search import SearchIndex, SearchJournal
+from tim.session import Session
+
+from conftest import file_storage
+
+import os
+import random
+
+import pytest
+
+WORDS = ["parser", "review", "meeting", "planning", "release", "bug", "docs", "deploy"]
+
+
+def tables(rng, count=200):
+    projects = ProjectTable()
+    for project_id in range(1, 6):
+        tasks = {task_id: Task(task_id, rng.choice(WORDS)) for task_id in range(1, 4)}
+        name = f"{rng.choice(WORDS)} {project_id}"
+        projects.add_project(Project(project_id, name, tasks))
+    events = EventTable()
+    for _ in range(count):
+        events.add_event(random_event(rng))
+    return projects, events
+
+
+def random_event(rng):
+    description = " ".join(rng.choice(WORDS) for _ in range(rng.randrange(4)))
+    return EventDefinition(rng.randrange(1, 6), rng.randrange(1, 4), description)
+
+
+def built(projects, events, signature="sig"):
+    index = SearchIndex("test")
+    index.build_events(events, signature)
+    index.build_names(projects, signature)
+    return index
+
+
+def contents(index):
+    return (
+        {word: list(ids) for word, ids in index.postings.items()},
+        list(index.events),
+        {
+            project_id: {task_id: list(ids) for task_id, ids in tasks.items() if len(ids)}
+            for project_id, tasks in index.tasks.items()
+        },
+        index.names,
+        index.vocabulary,
+        index.name_vocabulary,
+        index.signatures,
+    )
+
+
+def test_search_ranks_descriptions_over_names():
+    projects = ProjectTable()
+    projects.add_project(Project(1, "parser work", {1: Task(1, "dev")}))
+    projects.add_project(Project(2, "home", {1: Task(1, "chores")}))
+    events = EventTable()
+    events.add_event(EventDefinition(1, 1, "tokens"))
+    events.add_event(EventDefinition(2, 1, "fix the parser"))
+    events.add_event(EventDefinition(2, 1, "dishes"))
+    index = built(projects, events)
+    assert [event_id for event_id, _ in index.search("parser")] == [2, 1]
+    assert [event_id for event_id, _ in index.search("pars chores")] == [2]
+    assert index.search("nothing") == []
+
+
+def test_changes_match_building_again():
+    rng = random.Random(3)
+    projects, events = tables(rng)
+    index = built(projects, events)
+    for step in range(300):
+        event_id = rng.randrange(1, 260)
+        if rng.random() < 0.3:
+            events.delete_event(event_id)
+        else:
+            events.set_event(event_id, random_event(rng))
+        index.set_event(event_id, events.get_event(event_id), "sig")
+        if step % 20 == 0:
+            project_id = rng.randrange(1, 7)
+            project = projects.get_project(project_id)
+            if project is None:
+                projects.add_project(Project(project_id, "new project"))
+            elif rng.random() < 0.3:
+                projects.remove_project(project_id)
+            else:
+                project.add_task(Task(1, rng.choice(WORDS)))
+            index.set_project(projects, project_id, "sig")
+    assert contents(index) == contents(built(projects, events))
+
+
+def test_saves_append_to_the_journal(tmp_path):
+    file = str(tmp_path / "search.pkl")
+    projects, events = tables(random.Random(1))
+    index = built(projects, events, "one")
+    index.save(file)
+    assert not os.path.exists(f"{file}.journal")
+    written = os.stat(file)
+
+    event_id = events.add_event(EventDefinition(1, 1, "brand new words"))
+    index.set_event(event_id, events.get_event(event_id), "two")
+    projects.get_project(2).rename_task(3, "renamed")
+    index.set_project(projects, 2, ("three", 3))
+    index.save(file)
+    # only the journal was written
+    assert os.stat(file).st_ino == written.st_ino
+    with open(f"{file}.journal") as f:
+        assert len(f.readlines()) == 2
+
+    loaded = SearchIndex.load("test", file)
+    assert contents(loaded) == contents(index)
+    assert loaded.is_current("projects", ("three", 3))
+    assert loaded.search("brand")[0][0] == event_id
+    assert SearchIndex.load("another store", file).signatures == {}
+
+
+def test_journal_without_loading_the_index(tmp_path):
+    file = str(tmp_path / "search.pkl")
+    projects, events = tables(random.Random(2))
+    built(projects, events, "one").save(file)
+    journal = SearchJournal.open("test", file)
+    assert journal.is_current("events", "one")
+    event_id = events.add_event(EventDefinition(3, 2, "journaled"))
+    journal.set_event(event_id, events.get_event(event_id), "two")
+    journal.save()
+
+    journal = SearchJournal.open("test", file)
+    assert journal.is_current("events", "two") and not journal.is_current("events", "one")
+    # a rebuild can't be journaled, the next search has to build it again
+    journal.build_events(events, "three")
+    journal.set_event(event_id, None, "four")
+    journal.save()
+    assert SearchJournal.open("test", file).is_current("events", "two")
+    loaded = SearchIndex.load("test", file)
+    assert loaded.signatures == {"events": "two", "projects": "one"}
+    assert [found for found, _ in loaded.search("journaled")] == [event_id]
+    assert SearchJournal.open("another store", file) is None
+    assert SearchJournal.open("test", str(tmp_path / "nothing")) is None
+
+
+def test_journal_is_folded_back_in(tmp_path, monkeypatch):
+    monkeypatch.setattr(search, "JOURNAL_LIMIT", 3)
+    file = str(tmp_path / "search.pkl")
+    projects, events = tables(random.Random(4))
+    index = built(projects, events)
+    index.save(file)
+    stale = SearchJournal.open("test", file)
+    for i in range(5):
+        event_id = events.add_event(EventDefinition(1, 1, f"event {i}"))
+        index.set_event(event_id, events.get_event(event_id), f"sig {i}")
+        index.save(file)
+    # written whole on the fourth, the journal then has the fifth
+    with open(f"{file}.journal") as f:
+        assert len(f.readlines()) == 1
+    # lines appended for the index it replaced are skipped
+    stale.set_event(1, None, "stale")
+    stale.save()
+    loaded = SearchIndex.load("test", file)
+    assert contents(loaded) == contents(index)
+
+
+def test_damaged_journal_lines_are_skipped(tmp_path):
+    file = str(tmp_path / "search.pkl")
+    projects, events = tables(random.Random(5))
+    index = built(projects, events)
+    index.save(file)
+    index.set_event(1, None, "two")
+    index.save(file)
+    with open(f"{file}.journal", "a") as f:
+        f.write('["cut sh')
+    index.set_event(2, None, "three")
+    index.save(file)
+    assert contents(SearchIndex.load("test", file)) == contents(index)
+
+
+@pytest.fixture
+def index_file():
+    """Where sessions keep the index (in the tests' data directory), empty to start with"""
+
+    def clear():
+        for path in [SEARCH_INDEX_LOCATION, f"{SEARCH_INDEX_LOCATION}.journal"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    clear()
+    yield SEARCH_INDEX_LOCATION
+    clear()
+
+
+def test_sessions_keep_the_index_in_step(tmp_path, index_file):
+    storage = file_storage(str(tmp_path))
+    session = Session(storage)
+    session.projects.add_project(Project(1, "work", {1: Task(1, "dev")}))
+    session.save_project(1)
+    session.search.save()
+
+    # saving without searching only appends
+    session = Session(file_storage(str(tmp_path)))
+    event_id = session.events.add_event(EventDefinition(1, 1, "appended"))
+    session.save_event(event_id)
+    assert session._search is None
+    with open(f"{index_file}.journal") as f:
+        assert len(f.readlines()) == 1
+
+    session = Session(file_storage(str(tmp_path)))
+    index = SearchIndex.load(storage.identity())
+    assert index.is_current("events", storage.table_signature("events"))
+    assert [found for found, _ in session.search.search("appended")] == [event_id]
@@ -0,0 +1,169 @@
+from tim import serialize
+from tim.event import EventDefinition, EventEmpty, EventID, EventTable
+from tim.project import Project, ProjectTable, Task
+from tim.tim import Tim
+from tim.time import TimeFloat, TimeSet, local_tz
+
+from conftest import file_storage
+
+from datetime import datetime
+import os
+import pickle
+
+import pytest
+
+
+def tables():
+    projects = ProjectTable()
+    projects.add_project(Project(1, "work", {1: Task(1, "dev"), 2: Task(2, "réunion")}))
+    projects.add_project(Project(2, "home"))
+    events = EventTable()
+    events.add_event(EventDefinition(1, 1, "the parser"))
+    events.add_event(EventDefinition(1, 2, ""))
+    start = datetime(2024, 3, 1, 9, tzinfo=local_tz())
+    log = Tim(
+        [TimeSet(start), TimeSet(start.replace(hour=10)), TimeFloat()],
+        [EventID(1), EventEmpty()],
+        start,
+    )
+    return [projects, events, log]
+
+
+@pytest.mark.parametrize("format", serialize.FORMATS)
+def test_round_trip(format):
+    for obj in tables():
+        loaded = serialize.loads(serialize.dumps(obj, format))
+        assert type(loaded) is type(obj)
+        assert serialize.to_document(loaded) == serialize.to_document(obj)
+
+
+def test_round_trip_keeps_the_task_index():
+    [projects, _, _] = tables()
+    loaded = serialize.loads(serialize.dumps(projects))
+    project = loaded.get_project(1)
+    project.add_task(Task(3, "dev"))
+    assert project.index.find("réunion") == [2]
+    assert project.find_task("dev") in (1, 3) and len(project.index.find("dev")) == 2
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        None,
+        True,
+        0,
+        -(2**63),
+        2**63 - 1,
+        1.5,
+        "",
+        "ünïcode ✓",
+        [],
+        [1, "a", None],
+        [True, False],
+        ["a", "", "bc"],
+        [[1, "a"], [2, "b"]],
+        [[1], [2, 3]],
+        [[]],
+        {"": {"nested": [[None, 1.0]]}},
+    ],
+)
+def test_encoding(value):
+    assert serialize.decode(serialize.encode(value)) == value
+
+
+def test_encoding_refuses_what_it_cant_read_back():
+    with pytest.raises(TypeError):
+        serialize.encode({1: "a"})
+    with pytest.raises(ValueError):
+        serialize.encode(2**64)
+
+
+def test_damaged_files_are_value_errors():
+    data = serialize.dumps(tables()[1])
+    for damaged in [data[:-1], data[: len(data) // 2], data + b"N", data[:4] + b"?"]:
+        with pytest.raises(ValueError):
+            serialize.loads(damaged)
+    with pytest.raises(ValueError):
+        serialize.loads(b"nothing tim wrote")
+
+
+def test_older_schema_versions_are_migrated(monkeypatch):
+    document = serialize.to_document(tables()[1])
+    data = document["data"]
+    document["data"] = {"last": data["last_key"], "rows": data["events"]}
+    data = serialize.encode(document)
+
+    def upgrade(data):
+        return {"last_key": data["last"], "events": data["rows"]}
+
+    monkeypatch.setattr(serialize, "SCHEMA_VERSION", 2)
+    monkeypatch.setitem(serialize.MIGRATIONS, "events", {1: upgrade})
+    events = serialize.loads(data)
+    assert events.get_event(1).description == "the parser"
+    assert serialize.to_document(events)["version"] == 2
+
+
+def test_newer_schema_versions_are_refused():
+    document = serialize.to_document(tables()[0])
+    document["version"] = serialize.SCHEMA_VERSION + 1
+    with pytest.raises(ValueError, match="newer"):
+        serialize.loads(serialize.encode(document))
+
+
+def test_pickles_are_only_read_for_migrating():
+    for obj in tables():
+        data = pickle.dumps(obj)
+        with pytest.raises(serialize.LegacyError, match="tim migrate"):
+            serialize.loads(data)
+        loaded = serialize.loads(data, legacy=True)
+        assert serialize.to_document(loaded) == serialize.to_document(obj)
+
+
+class Exploit:
+    def __reduce__(self):
+        return os.system, ("echo you have been had",)
+
+
+def test_legacy_pickles_only_make_tims_classes():
+    with pytest.raises(pickle.UnpicklingError, match="system"):
+        serialize.loads(pickle.dumps(Exploit()), legacy=True)
+
+
+def test_migrate_rewrites_the_pickles(tmp_path):
+    storage = file_storage(str(tmp_path))
+    [projects, events, log] = tables()
+    os.makedirs(storage.log_dir)
+    for obj, path in [
+        (projects, storage.project_file),
+        (events, storage.event_file),
+        (log, storage.log_path("2024-03-01")),
+    ]:
+        with open(path, "wb") as f:
+            pickle.dump(obj, f)
+    with pytest.raises(serialize.LegacyError, match="tim migrate"):
+        storage.load_projects()
+
+    storage.legacy = True
+    assert storage.rewrite() == 3
+    storage = file_storage(str(tmp_path))
+    assert serialize.file_format(storage.event_file) == "binary"
+    assert storage.load_projects().get_project(1).get_task(2).name == "réunion"
+    assert storage.load_events().get_event(1).description == "the parser"
+    assert serialize.to_document(storage.load_log("2024-03-01")) == serialize.to_document(log)
+    assert storage.rewrite() == 0
+
+
+def test_commands_ask_for_tim_migrate(tmp_path, capsys):
+    from tim.main import run
+    from tim.session import Session
+
+    storage = file_storage(str(tmp_path))
+    with open(storage.project_file, "wb") as f:
+        pickle.dump(tables()[0], f)
+    with pytest.raises(SystemExit) as exit:
+        run(["project", "list"], Session(storage))
+    assert exit.value.code == 1
+    assert "run tim migrate" in capsys.readouterr().err
+    run(["migrate"], Session(storage))
+    run(["project", "list"], Session(file_storage(str(tmp_path))))
+    assert "work" in capsys.readouterr().out
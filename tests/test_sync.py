@@ -0,0 +1,278 @@
+from tim import serialize
+from tim.event import EventDefinition, EventID
+from tim.project import Project, ProjectTable, Task
+from tim.session import Session
+from tim.sync import (
+    Directory,
+    Ssh,
+    SyncError,
+    SyncState,
+    merge_day,
+    merge_rows,
+    new_on_both,
+    sync,
+)
+from tim.tim import Tim
+from tim.time import TimeSet, local_tz
+
+from conftest import file_storage, sqlite_storage
+
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def day(times, events, start_date="2024-03-01T09:00:00"):
+    return {
+        "kind": "tim",
+        "version": serialize.SCHEMA_VERSION,
+        "data": {"start_date": start_date, "times": times, "events": events},
+    }
+
+
+def test_merge_rows_takes_the_changes_of_both_sides():
+    base = {"1": [1, 1, "a"], "2": [1, 1, "b"]}
+    local = {"1": [1, 1, "a, edited"], "2": [1, 1, "b"]}
+    remote = {"1": [1, 1, "a"], "2": [1, 1, "b"], "3": [1, 2, "c"]}
+    merged, conflicts = merge_rows("events", base, local, remote)
+    assert merged == {"1": [1, 1, "a, edited"], "2": [1, 1, "b"], "3": [1, 2, "c"]}
+    assert conflicts == []
+
+
+def test_merge_rows_deletes():
+    base = {"1": [1, 1, "a"], "2": [1, 1, "b"]}
+    merged, conflicts = merge_rows("events", base, {"1": [1, 1, "a"]}, base)
+    assert merged == {"1": [1, 1, "a"]}
+    assert conflicts == []
+
+
+def test_merge_rows_conflicts_leave_the_row_out():
+    base = {"1": [1, 1, "a"]}
+    merged, conflicts = merge_rows("events", base, {"1": [1, 1, "x"]}, {"1": [1, 1, "y"]})
+    assert merged == {}
+    assert conflicts == ["1"]
+
+
+def test_merge_rows_keeps_a_project_given_a_task():
+    base = {"1": "work"}
+    local = {}
+    remote = {"1": "work", "1/1": "dev"}
+    merged, conflicts = merge_rows("projects", base, local, remote)
+    assert merged == {"1": "work", "1/1": "dev"}
+    assert conflicts == []
+
+
+def test_merge_day_edit_and_append():
+    base = day([0, 600, None], [1, 2])
+    # a time edited here, an entry added there
+    local = day([0, 900, None], [1, 2])
+    remote = day([0, 600, 1200, None], [1, 2, 3])
+    assert merge_day(base, local, remote) == day([0, 900, 1200, None], [1, 2, 3])
+
+
+def test_merge_day_same_time_changed_differently():
+    base = day([0, 600, None], [1, 2])
+    assert merge_day(base, day([0, 900, None], [1, 2]), day([0, 1200, None], [1, 2])) is None
+    assert merge_day(base, day([0, 600, None], [1, 3]), day([0, 600, None], [1, 4])) is None
+
+
+def test_merge_day_both_appending_conflicts():
+    base = day([0, None], [1])
+    local = day([0, 600, None], [1, 2])
+    remote = day([0, 600, None], [1, 3])
+    assert merge_day(base, local, remote) is None
+
+
+def test_merge_day_removed_times_conflict():
+    base = day([0, 600, 1200], [1, 2])
+    local = day([0, 600], [1])
+    remote = day([0, 900, 1200], [1, 2])
+    assert merge_day(base, local, remote) is None
+
+
+def test_merge_day_other_start_date_conflicts():
+    assert merge_day(None, day([0], []), day([0], [], "2024-03-02T09:00:00")) is None
+
+
+def test_new_on_both():
+    base = {"1": [1, 1, "a"]}
+    local = {"1": [1, 1, "a"], "2": [1, 1, "b"], "3": [1, 1, "same"], "4": [1, 1, "d"]}
+    remote = {"1": [1, 1, "x"], "2": [1, 1, "c"], "3": [1, 1, "same"]}
+    # 1 is an edit (a conflict if anything), 3 was added the same on both
+    assert new_on_both(base, local, remote) == ["2"]
+
+
+def test_sync_state_is_json(tmp_path):
+    state = SyncState("file:/data")
+    state.days["2024-03-01"] = (((1, 2, 3), None), "digest")
+    state.tables["events"] = (4, {"events/0": "digest"}, 7)
+    state.save(tmp_path / "sync_cache.json", tmp_path / "sync_bases.json")
+    loaded = SyncState.load(
+        "file:/data", tmp_path / "sync_cache.json", tmp_path / "sync_bases.json"
+    )
+    # the signatures compare equal to the storage's again
+    assert loaded.days == state.days and loaded.tables == state.tables
+    other = SyncState.load(
+        "file:/other", tmp_path / "sync_cache.json", tmp_path / "sync_bases.json"
+    )
+    assert other.days == {}
+
+
+def test_sync_state_bases_are_json(tmp_path):
+    state = SyncState("file:/data")
+    state.days["2024-03-01"] = ("signature", "digest")
+    state.bases["dir:/sync"] = {"day/2024-03-01": "digest"}
+    state.save(tmp_path / "sync_cache.json", tmp_path / "sync_bases.json")
+    (tmp_path / "sync_cache.json").write_bytes(b"{")
+    loaded = SyncState.load(
+        "file:/data", tmp_path / "sync_cache.json", tmp_path / "sync_bases.json"
+    )
+    assert loaded.days == {}
+    assert loaded.bases == {"dir:/sync": {"day/2024-03-01": "digest"}}
+    other = SyncState.load("file:/other", tmp_path / "x", tmp_path / "sync_bases.json")
+    assert other.bases == {}
+
+
+def test_sync_state_unreadable_bases(tmp_path):
+    (tmp_path / "sync_bases.json").write_text("{")
+    with pytest.raises(SyncError):
+        SyncState.load("file:/data", tmp_path / "x", tmp_path / "sync_bases.json")
+
+
+@pytest.fixture(params=["directory", "ssh"])
+def remote(request, tmp_path, monkeypatch):
+    """The sync directory, local or through a TIM_SSH running the command right here"""
+    path = str(tmp_path / "remote")
+    if request.param == "directory":
+        return Directory(path)
+    # like ssh, the host is $1 and the command $2
+    monkeypatch.setenv("TIM_SSH", "sh -c 'exec sh -c \"$2\"' fake-ssh")
+    return Ssh("elsewhere", path)
+
+
+class Machine:
+    """A store with its own sync state, a file one or sqlite"""
+
+    def __init__(self, directory, backend):
+        self.directory = directory
+        self.open = file_storage if backend == "file" else sqlite_storage
+
+    def storage(self):
+        return self.open(str(self.directory))
+
+    def sync(self, remote, prefer=None):
+        return sync(
+            Session(self.storage()),
+            remote,
+            prefer,
+            state_file=self.directory / "sync_cache.json",
+            bases_file=self.directory / "sync_bases.json",
+        )
+
+    def add_event(self, description):
+        storage = self.storage()
+        events = storage.load_events()
+        event_id = events.add_event(EventDefinition(1, 1, description))
+        storage.save_events(events)
+        return event_id
+
+    def save_day(self, key, hours, event_ids):
+        start = datetime.fromisoformat(f"{key}T09:00").replace(tzinfo=local_tz())
+        times = [TimeSet(start + timedelta(hours=hour)) for hour in hours]
+        self.storage().save_log(Tim(times, [EventID(id) for id in event_ids], start))
+
+    def day(self, key):
+        return serialize.to_document(self.storage().load_log(key))["data"]
+
+    def events(self):
+        return {
+            event_id: event.description
+            for event_id, event in self.storage().load_events().list_events()
+        }
+
+
+@pytest.fixture
+def machines(tmp_path):
+    here = Machine(tmp_path / "here", "file")
+    there = Machine(tmp_path / "there", "sqlite")
+    projects = ProjectTable()
+    projects.add_project(Project(1, "work", {1: Task(1, "dev")}))
+    here.storage().save_projects(projects)
+    here.add_event("parser")
+    here.save_day("2024-03-01", [0, 1, 2], [1, 1])
+    return here, there
+
+
+def test_sync_both_ways(machines, remote):
+    here, there = machines
+    result = here.sync(remote)
+    assert result.sent == ["2024-03-01"] and result.conflicts == []
+    result = there.sync(remote)
+    assert result.received == ["2024-03-01"]
+    assert there.day("2024-03-01") == here.day("2024-03-01")
+    assert there.storage().load_projects().get_project(1).get_task(1).name == "dev"
+
+    # different entries of the same day changed on each side come together
+    here.save_day("2024-03-01", [0, 1.5, 2], [1, 1])
+    there.save_day("2024-03-01", [0, 1, 2, 3], [1, 1, 1])
+    assert here.sync(remote).sent == ["2024-03-01"]
+    result = there.sync(remote)
+    assert result.conflicts == []
+    assert here.sync(remote).received == ["2024-03-01"]
+    assert here.day("2024-03-01") == there.day("2024-03-01")
+    assert len(here.day("2024-03-01")["times"]) == 4
+
+    # nothing changed, nothing to do
+    result = there.sync(remote)
+    assert result.received == result.sent == result.conflicts == []
+
+
+def test_sync_renumbers_colliding_events(machines, remote):
+    here, there = machines
+    here.sync(remote)
+    there.sync(remote)
+    # both give out id 2
+    assert here.add_event("review") == there.add_event("tests") == 2
+    here.save_day("2024-03-02", [0, 1], [2])
+    there.save_day("2024-03-03", [0, 1], [2])
+    here.sync(remote)
+    result = there.sync(remote)
+    assert result.renumbered == [(2, 3)] and result.conflicts == []
+    here.sync(remote)
+    for machine in (here, there):
+        assert machine.events() == {1: "parser", 2: "review", 3: "tests"}
+        assert machine.day("2024-03-02")["events"] == [2]
+        assert machine.day("2024-03-03")["events"] == [3]
+    # and the next one given out is past both
+    assert there.add_event("next") == 4
+
+
+def test_sync_conflicts(machines, remote):
+    here, there = machines
+    here.sync(remote)
+    there.sync(remote)
+    here.save_day("2024-03-01", [0, 1.5, 2], [1, 1])
+    there.save_day("2024-03-01", [0, 1.25, 2], [1, 1])
+    here.sync(remote)
+    result = there.sync(remote)
+    assert result.conflicts == ["2024-03-01: changed differently on both sides"]
+    # left as it is on each side until it's settled
+    assert here.day("2024-03-01") != there.day("2024-03-01")
+    assert there.sync(remote).conflicts != []
+    assert there.sync(remote, prefer="remote").conflicts == []
+    assert here.sync(remote).received == []
+    assert there.day("2024-03-01") == here.day("2024-03-01")
+
+
+def test_ssh_lock_keeps_the_error_of_the_sync(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("TIM_SSH", "sh -c 'exec sh -c \"$2\"' fake-ssh")
+    remote = Ssh("elsewhere", str(tmp_path))
+    with pytest.raises(RuntimeError, match="the sync"):
+        with remote.locked():
+            # so removing it fails
+            (tmp_path / ".lock").rmdir()
+            raise RuntimeError("the sync went wrong")
+    assert "Couldn't remove the .lock" in capsys.readouterr().err
+    with remote.locked():
+        pass
+    assert not (tmp_path / ".lock").exists()
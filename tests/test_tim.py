@@ -0,0 +1,25 @@
+from tim.event import EventDefinition, EventEmpty, EventID, EventTable
+from tim.project import Project, ProjectTable, Task
+from tim.render import RenderCache
+from tim.tim import Tim
+from tim.time import TimeFloat, TimeSet, local_tz
+
+from datetime import datetime
+
+
+def test_show_with_and_without_a_render_cache(capsys):
+    projects = ProjectTable()
+    projects.add_project(Project(1, "work", {1: Task(1, "dev")}))
+    events = EventTable()
+    events.add_event(EventDefinition(1, 1, "parser"))
+    start = datetime(2024, 3, 1, 9, tzinfo=local_tz())
+    log = Tim(
+        [TimeSet(start), TimeSet(start.replace(hour=10)), TimeFloat()],
+        [EventID(1), EventEmpty()],
+        start,
+    )
+    log.show(projects, events)
+    shown = capsys.readouterr().out
+    assert "0) work - dev | parser" in shown and "1) Nothing" in shown
+    log.show(projects, events, RenderCache(projects, events))
+    assert capsys.readouterr().out == shown
@@ -1,4 +1,10 @@
-from . import tim
-from . import time
-from . import event
-from . import constants
+import importlib
+
+# submodules are imported on first use so `import tim` stays cheap for the command line
+__all__ = ["tim", "time", "event", "constants"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,252 @@
+from tim.columnar import ColumnarLog, FLOATING, EMPTY
+from tim.event import EventID, EventEmpty
+from tim.fileio import atomic_write, locked
+from tim.time import TimeSet, local_tz
+from tim.tim import Tim
+
+from bisect import bisect_left
+from datetime import date, datetime, timedelta, timezone
+import mmap
+import os
+import struct
+
+"""
+Closed days packed into one read only file, for history that isn't going to change anymore.
+
+archive.dat is a header followed by a fixed size record per time of every archived day
+
+    minute (int64), event id (int32), microseconds within the minute (int32)
+
+the last time of a day having NO_EVENT since a log has one more time than it has events. It
+is only ever appended to and is read through mmap, the columns of a day being strided views
+of the mapping so nothing is copied and no object is made per entry.
+
+archive.idx is the date offset index, a header followed by a record per day sorted by date
+
+    date ordinal, first record, number of records, start date (see _wall), utc offset
+
+which is small and replaced as a whole (atomically) whenever days are added or removed.
+Archiving a day again (it was edited and archived once more) appends it anew and the index
+points at the new records, the old ones are left as garbage.
+
+A day that also has a live file is the live file, see FileStorage.
+"""
+
+DATA_FILE = "archive.dat"
+INDEX_FILE = "archive.idx"
+# 16 bytes so the records stay aligned
+DATA_MAGIC = b"TIMARCHIVE\x00\x00\x00\x00\x00\x01"
+INDEX_MAGIC = b"TIMARCHIVEIDX\x00\x00\x01"
+RECORD = struct.Struct("<qii")
+DAY = struct.Struct("<5q")
+DAY_FIELDS = 5
+# event column of a day's last time
+NO_EVENT = -2
+# utc offset of a naive start date
+NAIVE = -(2**63)
+EPOCH = datetime(1970, 1, 1)
+EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECONDS = timedelta(microseconds=1)
+
+
+def _wall(start_date: datetime):
+    # the wall clock time as microseconds, the offset is kept separately
+    return (start_date.replace(tzinfo=None) - EPOCH) // MICROSECONDS
+
+
+def _offset(start_date: datetime):
+    offset = start_date.utcoffset()
+    return NAIVE if offset is None else offset // timedelta(seconds=1)
+
+
+def _start_date(wall, offset):
+    start_date = EPOCH + wall * MICROSECONDS
+    if offset != NAIVE:
+        start_date = start_date.replace(tzinfo=timezone(timedelta(seconds=offset)))
+    return start_date
+
+
+def is_closed(log: Tim):
+    """Every time is set, nothing is still running"""
+    return not ColumnarLog.from_tim(log).is_open()
+
+
+def records(log: Tim):
+    data = bytearray()
+    for i, time in enumerate(log.times):
+        microseconds = round(time.time.timestamp() * 1_000_000)
+        minute = microseconds // 60_000_000
+        if i == len(log.events):
+            event_id = NO_EVENT
+        elif log.events[i].is_empty():
+            event_id = EMPTY
+        else:
+            event_id = log.events[i].id
+        data += RECORD.pack(minute, event_id, microseconds - minute * 60_000_000)
+    return data
+
+
+class Archive:
+    def __init__(self, directory):
+        self.directory = directory
+        self.data_path = os.path.join(directory, DATA_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self._signature = None
+        # the index as int64s, DAY_FIELDS per day, and the ordinals to bisect
+        self._days = memoryview(b"").cast("q")
+        self._ordinals = self._days
+        # the mapped records as int64s and as int32s
+        self._wide = None
+        self._narrow = None
+
+    # pickled as just the directory (e.g. for tim.parallel), mapping it again on the other side
+    def __getstate__(self):
+        return {"directory": self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state["directory"])
+
+    def _refresh(self):
+        """Pick up days archived or removed by someone else since"""
+        try:
+            stat = os.stat(self.index_path)
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        if signature == self._signature:
+            return
+        self._signature = signature
+        days = b""
+        if signature is not None:
+            with open(self.index_path, "rb") as f:
+                days = f.read()
+            if not days.startswith(INDEX_MAGIC):
+                raise ValueError(f"{self.index_path} isn't an archive index.")
+            days = days[len(INDEX_MAGIC) :]
+        self._days = memoryview(days).cast("q")
+        self._ordinals = self._days[::DAY_FIELDS]
+        self._map()
+
+    def _map(self):
+        # the data file is only appended to so a mapping stays valid, it just has to be
+        # made again once the index points past its end
+        if len(self._days) == 0:
+            self._wide = self._narrow = None
+            return
+        with open(self.data_path, "rb") as f:
+            if f.read(len(DATA_MAGIC)) != DATA_MAGIC:
+                raise ValueError(f"{self.data_path} isn't an archive.")
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapping)[len(DATA_MAGIC) :]
+        view = view[: len(view) - len(view) % RECORD.size]
+        self._wide = view.cast("q")
+        self._narrow = view.cast("i")
+
+    def _find(self, key):
+        ordinal = date.fromisoformat(key).toordinal()
+        i = bisect_left(self._ordinals, ordinal)
+        if i < len(self._ordinals) and self._ordinals[i] == ordinal:
+            return self._days[i * DAY_FIELDS : (i + 1) * DAY_FIELDS]
+        return None
+
+    def keys(self):
+        self._refresh()
+        return [date.fromordinal(ordinal).isoformat() for ordinal in self._ordinals]
+
+    def __contains__(self, key):
+        self._refresh()
+        return self._find(key) is not None
+
+    def signature(self, key):
+        """Changes when the day is archived again, None when it isn't archived"""
+        self._refresh()
+        day = self._find(key)
+        return None if day is None else ("archive", day[1])
+
+    def _views(self, day):
+        first, count = day[1], day[2]
+        times = self._wide[first * 2 : (first + count) * 2 : 2]
+        events = self._narrow[first * 4 + 2 : (first + count - 1) * 4 + 2 : 4]
+        microseconds = self._narrow[first * 4 + 3 : (first + count) * 4 + 3 : 4]
+        return times, events, microseconds
+
+    def columns(self, key):
+        """The day as a ColumnarLog of views into the archive, None when it isn't archived"""
+        self._refresh()
+        day = self._find(key)
+        if day is None:
+            return None
+        times, events, _ = self._views(day)
+        return ColumnarLog(times, events, _start_date(day[3], day[4]))
+
+    def load_log(self, key):
+        """The day as a Tim, to the microsecond, None when it isn't archived"""
+        self._refresh()
+        day = self._find(key)
+        if day is None:
+            return None
+        times, events, microseconds = self._views(day)
+        tz = local_tz()
+        return Tim(
+            [
+                TimeSet(
+                    (EPOCH_UTC + (minute * 60_000_000 + rest) * MICROSECONDS).astimezone(tz)
+                )
+                for minute, rest in zip(times, microseconds)
+            ],
+            [EventEmpty() if id == EMPTY else EventID(id) for id in events],
+            _start_date(day[3], day[4]),
+        )
+
+    def add(self, logs: list[Tim]):
+        """Append closed logs, replacing the days already in the archive"""
+        for log in logs:
+            if FLOATING in ColumnarLog.from_tim(log).times:
+                raise ValueError(f"{log.start_date:%Y-%m-%d} is still running.")
+        with locked(self.data_path):
+            self._refresh()
+            days = {
+                self._days[i] : tuple(self._days[i : i + DAY_FIELDS])
+                for i in range(0, len(self._days), DAY_FIELDS)
+            }
+            data = bytearray()
+            with open(self.data_path, "ab") as f:
+                if f.tell() == 0:
+                    f.write(DATA_MAGIC)
+                first = (f.tell() - len(DATA_MAGIC)) // RECORD.size
+                for log in logs:
+                    ordinal = log.start_date.toordinal()
+                    day = records(log)
+                    count = len(day) // RECORD.size
+                    days[ordinal] = (
+                        ordinal,
+                        first,
+                        count,
+                        _wall(log.start_date),
+                        _offset(log.start_date),
+                    )
+                    data += day
+                    first += count
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._write_index(days)
+
+    def remove(self, keys):
+        ordinals = {date.fromisoformat(key).toordinal() for key in keys}
+        with locked(self.data_path):
+            self._refresh()
+            days = {
+                self._days[i] : tuple(self._days[i : i + DAY_FIELDS])
+                for i in range(0, len(self._days), DAY_FIELDS)
+                if self._days[i] not in ordinals
+            }
+            if len(days) < len(self._ordinals):
+                self._write_index(days)
+
+    def _write_index(self, days):
+        index = bytearray(INDEX_MAGIC)
+        for ordinal in sorted(days):
+            index += DAY.pack(*days[ordinal])
+        atomic_write(self.index_path, bytes(index))
+        self._signature = None
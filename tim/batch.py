@@ -0,0 +1,99 @@
+from contextlib import redirect_stderr
+import io
+import shlex
+
+"""
+Running many commands against one session, loading everything once and saving once.
+
+    tim batch fixes.txt
+    printf 'log edit time 3 --hour 9\nlog edit event 3 12\n' | tim batch
+
+Each line is a command as it would be given to tim (without the tim), blank lines and
+# comments are skipped. From python
+
+    from tim.batch import run_batch
+    run_batch(["log edit time 3 --hour 9", ["log", "edit", "event", "3", "12"]])
+
+The commands see each other's changes as they go, what they save is held back until the last
+one is done and then saved in one transaction of the storage (see Session.batch). When a line
+doesn't parse nothing is run, when a command fails nothing is saved.
+"""
+
+# commands that change the storage behind the session's back or don't make sense in a batch
+NOT_IN_BATCH = ["batch", "daemon", "migrate", "archive", "sync", "fsck"]
+
+
+class BatchError(Exception):
+    """A line of a batch that couldn't be parsed or run, nothing was saved"""
+
+    def __init__(self, number, line, reason):
+        super().__init__(f"Line {number} ({line}): {reason}")
+        self.number = number
+        self.line = line
+
+
+def read(lines):
+    """(line number, argv) of every command in lines"""
+    commands = []
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, str):
+            try:
+                argv = shlex.split(line, comments=True)
+            except ValueError as e:
+                raise BatchError(number, line.strip(), e) from None
+        else:
+            argv = list(line)
+        if len(argv) > 0:
+            commands.append((number, argv))
+    return commands
+
+
+def parse(commands):
+    """argparse namespaces of the (number, argv) commands, checking all of them first"""
+    from tim.main import build_parser
+
+    parser = build_parser()
+    parsed = []
+    for number, argv in commands:
+        line = shlex.join(argv)
+        if argv[0] in NOT_IN_BATCH:
+            raise BatchError(number, line, f"{argv[0]} can't be run in a batch.")
+        errors = io.StringIO()
+        try:
+            with redirect_stderr(errors):
+                args = parser.parse_args(argv)
+        except SystemExit:
+            reason = errors.getvalue().strip().splitlines()[-1:] or ["not a command"]
+            raise BatchError(number, line, reason[0]) from None
+        parsed.append((number, line, args))
+    return parsed
+
+
+def run_batch(lines, session=None):
+    """
+    Run the commands of lines (strings as in a batch file or argv lists) against one
+    session and save everything they changed at the end, raising BatchError when any of
+    them fails (nothing is saved then)
+    """
+    from tim.main import new_session, retry
+
+    parsed = parse(read(lines))
+    session = new_session() if session is None else session
+    retry(lambda: _run(parsed, session), session)
+
+
+def _run(parsed, session):
+    from tim.storage import StaleError
+
+    with session.batch():
+        for number, line, args in parsed:
+            args.session = session
+            try:
+                args.func(args)
+            except StaleError:
+                raise
+            except SystemExit as e:
+                if e.code not in (None, 0):
+                    raise BatchError(number, line, f"exited with {e.code}") from None
+            except Exception as e:
+                raise BatchError(number, line, e) from e
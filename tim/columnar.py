@@ -0,0 +1,117 @@
+from tim.time import TimeSet, TimeFloat, local_tz
+from tim.event import EventID, EventEmpty
+
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime
+
+"""
+A compact form of a log for going over a lot of them.
+
+Times are minutes since the epoch in an int64 array and events are ids in an int32 array,
+so durations are just differences of the columns and no Time/Event objects are created.
+Times are whole minutes which is all the resolution the log shows anyway.
+
+The columns of an archived day are memoryviews into the archive rather than arrays, see
+tim.archive, anything only reading them works with either.
+"""
+
+# event column value of an EventEmpty
+EMPTY = -1
+# time column value of a TimeFloat, resolved against the current minute
+FLOATING = -(2**63)
+
+
+def to_minute(time: datetime):
+    return int(time.timestamp()) // 60
+
+
+def from_minute(minute: int):
+    return datetime.fromtimestamp(minute * 60, local_tz())
+
+
+def now_minute():
+    return to_minute(datetime.now(local_tz()))
+
+
+@dataclass
+class ColumnarLog:
+    times: array = field(default_factory=lambda: array("q"))
+    events: array = field(default_factory=lambda: array("i"))
+    start_date: datetime = field(default_factory=datetime.now)
+
+    @classmethod
+    def from_tim(cls, log):
+        times = array(
+            "q",
+            [
+                to_minute(time.time) if isinstance(time, TimeSet) else FLOATING
+                for time in log.times
+            ],
+        )
+        events = array(
+            "i", [EMPTY if event.is_empty() else event.id for event in log.events]
+        )
+        return cls(times, events, log.start_date)
+
+    def to_tim(self):
+        from tim.tim import Tim
+
+        times = [
+            TimeFloat() if minute == FLOATING else TimeSet(from_minute(minute))
+            for minute in self.times
+        ]
+        events = [EventEmpty() if id == EMPTY else EventID(id) for id in self.events]
+        return Tim(times, events, self.start_date)
+
+    def is_open(self):
+        return FLOATING in self.times
+
+    def resolved(self, now=None):
+        """The times with the floating ones set to now (in minutes)"""
+        if not self.is_open():
+            return self.times
+        now = now_minute() if now is None else now
+        return array("q", [now if t == FLOATING else t for t in self.times])
+
+    def changed_rows(self, old):
+        """
+        Entries (event i between times i and i + 1) that differ from those of old,
+        including any old doesn't have
+        """
+        rows = []
+        for i in range(len(self.events)):
+            if (
+                i >= len(old.events)
+                or self.events[i] != old.events[i]
+                or self.times[i : i + 2] != old.times[i : i + 2]
+            ):
+                rows.append(i)
+        return rows
+
+    def rows(self, lookup):
+        """
+        (date, project id, task id, description, quantity) for every non empty entry,
+        lookup being a dict of event id to EventDefinition such as EventTable.table
+        """
+        times = self.resolved()
+        for i, event_id in enumerate(self.events):
+            if event_id == EMPTY:
+                continue
+            else:
+                event = lookup[event_id]
+                # an entry edited to end before it starts counts for nothing rather than
+                # wrapping around to most of a day, see tim log query overlaps
+                minutes = max(times[i + 1] - times[i], 0)
+                yield (
+                    from_minute(times[i]).strftime("%m/%d/%Y"),
+                    event.project_id,
+                    event.task_id,
+                    event.description,
+                    minutes / 60,
+                )
+
+    def durations(self, now=None):
+        """Minutes spent on each event, nothing for one ending before it starts (see rows)"""
+        times = self.resolved(now)
+        return array("q", [max(end - start, 0) for start, end in zip(times, times[1:])])
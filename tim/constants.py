@@ -1,4 +1,4 @@
-from platformdirs import *
+from platformdirs import user_data_dir, user_config_dir
 from os import path
 
 appname = "tim"
@@ -11,3 +11,10 @@ EVENT_TABLE_LOCATION = path.join(user_data_dir, "event_definitions.pkl")
 PROJECT_TABLE_LOCATION = path.join(user_data_dir, "project_definitions.pkl")
 LOG_LOCATION = path.join(user_data_dir, "logs")
 CONFIG_LOCATION = path.join(user_config_dir, "config.ini")
+SQLITE_LOCATION = path.join(user_data_dir, "tim.sqlite3")
+REPORT_CACHE_LOCATION = path.join(user_data_dir, "report_cache.pkl")
+INTERVAL_INDEX_LOCATION = path.join(user_data_dir, "intervals.pkl")
+SEARCH_INDEX_LOCATION = path.join(user_data_dir, "search.pkl")
+SYNC_STATE_LOCATION = path.join(user_data_dir, "sync_cache.json")
+SYNC_BASES_LOCATION = path.join(user_data_dir, "sync_bases.json")
+DAEMON_SOCKET = path.join(user_data_dir, "daemon.sock")
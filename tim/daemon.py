@@ -0,0 +1,147 @@
+from tim.constants import DAEMON_SOCKET
+
+from contextlib import redirect_stdout, redirect_stderr
+import io
+import json
+import os
+import socket
+import sys
+import traceback
+
+"""
+Optional long running process holding the tables in memory.
+
+The command line sends its arguments over a unix socket as a json line and gets back
+what the command printed and its exit status, so a command costs a round trip instead
+of loading everything. Commands are run one at a time, before each one the session
+drops whatever was changed on disk by someone else (the gui, a cron job).
+
+When the daemon isn't running the command line just does the work itself.
+"""
+
+
+def _connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def _send(path, message):
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    sock = _connect(path)
+    if sock is None:
+        # left over from a daemon that didn't shut down cleanly
+        return None
+    with sock:
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        data = b""
+        while chunk := sock.recv(65536):
+            data += chunk
+    if len(data) == 0:
+        # closed without answering, e.g. stopping or killed meanwhile
+        return None
+    return json.loads(data)
+
+
+def request(argv, path=DAEMON_SOCKET):
+    """
+    Run a command in the daemon and print its output. Returns the exit status or
+    None when no daemon is running.
+    """
+    response = _send(path, {"argv": argv, "cwd": os.getcwd()})
+    if response is None:
+        return None
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["status"]
+
+
+def stop(path=DAEMON_SOCKET):
+    return _send(path, {"stop": True}) is not None
+
+
+def is_running(path=DAEMON_SOCKET):
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return False
+    sock = _connect(path)
+    if sock is None:
+        return False
+    sock.close()
+    return True
+
+
+def execute(session, message):
+    from tim.main import run
+
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    status = 0
+    cwd = os.getcwd()
+    try:
+        # relative paths like export --output are relative to the caller
+        os.chdir(message["cwd"])
+        session.refresh()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            run(message["argv"], session)
+    except SystemExit as e:
+        # argparse errors and --help
+        status = e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception:
+        traceback.print_exc(file=stderr)
+        status = 1
+        # don't keep tables that may be half changed
+        session.reset()
+    finally:
+        os.chdir(cwd)
+    return {"stdout": stdout.getvalue(), "stderr": stderr.getvalue(), "status": status}
+
+
+async def _serve(session, path):
+    import asyncio
+
+    stopped = asyncio.Event()
+
+    async def handle(reader, writer):
+        line = await reader.readline()
+        if not line:
+            # is_running checking the socket
+            writer.close()
+            return
+        message = json.loads(line)
+        if message.get("stop"):
+            response = {"status": 0}
+            stopped.set()
+        else:
+            response = execute(session, message)
+        writer.write(json.dumps(response).encode())
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_unix_server(handle, path)
+    os.chmod(path, 0o600)
+    async with server:
+        await stopped.wait()
+
+
+def serve(session, path=DAEMON_SOCKET):
+    if is_running(path):
+        print(f"The daemon is already running on {path}.")
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+    print(f"Listening on {path}.")
+    import asyncio
+
+    try:
+        asyncio.run(_serve(session, path))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
@@ -3,8 +3,6 @@ from tim.project import ProjectTable
 
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-import pickle
-import os
 
 
 class Event(ABC):
@@ -54,14 +52,24 @@ class EventDefinition:
 class EventTable:
     table: dict = field(default_factory=dict)
     last_key: int = field(init=False, default=0)
+    # bumped by every change, for anything caching what it shows
+    version: int = field(init=False, default=0, repr=False, compare=False)
 
     def add_event(self, event: EventDefinition):
         self.last_key += 1
         self.table[self.last_key] = event
+        self.version += 1
         return self.last_key
 
+    def set_event(self, event_id: int, event: EventDefinition):
+        """Add or replace an event under a specific id"""
+        self.table[event_id] = event
+        self.last_key = max(self.last_key, event_id)
+        self.version += 1
+
     def delete_event(self, event_id: int):
         if event_id in self.table:
+            self.version += 1
             return self.table.pop(event_id)
         else:
             return None
@@ -74,11 +82,11 @@ class EventTable:
 
     @classmethod
     def load(cls, file=EVENT_TABLE_LOCATION):
-        with open(file, "rb") as f:
-            return pickle.load(f)
-
-    def save(self, file=EVENT_TABLE_LOCATION):
-        os.makedirs(os.path.dirname(file), exist_ok=True)
-        with open(file, "wb") as f:
-            # print(f"Saving to {file}")
-            pickle.dump(self, f)
+        from tim import serialize
+
+        return serialize.load(file)
+
+    def save(self, file=EVENT_TABLE_LOCATION, format="binary"):
+        from tim import serialize
+
+        serialize.dump(self, file, format)
@@ -0,0 +1,215 @@
+from tim.tim import TimManager
+from tim.columnar import ColumnarLog, EMPTY, FLOATING
+from tim.event import EventTable
+from tim.time import local_tz
+
+from datetime import datetime
+import csv
+import json
+
+"""
+Writing the logs out for other tools.
+
+csv is the upload format, a row per non empty entry with its hours. The others have a row per
+entry with everything about it, for analytics (pandas, duckdb, ...):
+
+    date         the date key of the log, as a date
+    position     of the entry in the log
+    start, end   timestamps (UTC, whole minutes), end being null while it's running
+    duration     end - start, null while it's running and 0 when it ends before it starts
+    event_id, project_id, task_id, description
+                 null for empty entries (and events that aren't defined anymore)
+
+jsonl writes them a json object per line with the timestamps in local time. arrow (an Arrow
+IPC file) and parquet need pyarrow (pip install tim[arrow]), they are written BATCH_SIZE rows
+at a time as they are read so memory doesn't grow with the history. With jobs > 1 the days are
+read ahead by the workers, but only a bounded window of them (see tim.parallel).
+"""
+
+HEADER = ["Date", "Project/Database ID", "Task/Database ID", "Description", "Quantity"]
+FORMATS = ["csv", "jsonl", "arrow", "parquet"]
+ENTRY_COLUMNS = [
+    "date",
+    "position",
+    "start",
+    "end",
+    "duration",
+    "event_id",
+    "project_id",
+    "task_id",
+    "description",
+]
+# entries per record batch
+BATCH_SIZE = 65536
+
+
+def write_csv(rows, out):
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(HEADER)
+    writer.writerows(rows)
+
+
+def iter_rows(
+    logs: TimManager,
+    events: EventTable,
+    start=None,
+    end=None,
+    project=None,
+    task=None,
+    jobs=1,
+):
+    """
+    Export rows for every log between start and end, one day loaded at a time.
+    project/task restrict the rows to those ids. With more than one job the days are
+    spread over processes (see tim.parallel), the rows come out in the same order.
+    """
+    lookup = events.table
+    if jobs == 1:
+        for _, columns in logs.iter_columns(start, end):
+            yield from filter_rows(columns.rows(lookup), project, task)
+        return
+
+    from tim.parallel import map_days
+
+    keys = logs.list_dates(start, end)
+    args = (lookup, project, task)
+    for _, rows in map_days(logs.storage, keys, day_rows, args, jobs):
+        yield from rows
+
+
+def filter_rows(rows, project=None, task=None):
+    for row in rows:
+        if project is not None and row[1] != project:
+            continue
+        if task is not None and row[2] != task:
+            continue
+        yield row
+
+
+def day_rows(storage, key, lookup, project=None, task=None):
+    """The rows of one day, for iter_rows running in other processes"""
+    return list(filter_rows(storage.load_columns(key).rows(lookup), project, task))
+
+
+def day_entries(columns: ColumnarLog, lookup, project=None, task=None):
+    """
+    The entries of a day as ENTRY_COLUMNS name -> list, the times in seconds since the
+    epoch. lookup and project/task as for iter_rows.
+    """
+    entries = {name: [] for name in ENTRY_COLUMNS}
+    day = columns.start_date.date()
+    times = columns.times
+    for i, event_id in enumerate(columns.events):
+        event = None if event_id == EMPTY else lookup.get(event_id)
+        if project is not None and (event is None or event.project_id != project):
+            continue
+        if task is not None and (event is None or event.task_id != task):
+            continue
+        start, end = times[i], times[i + 1]
+        entries["date"].append(day)
+        entries["position"].append(i)
+        entries["start"].append(None if start == FLOATING else start * 60)
+        entries["end"].append(None if end == FLOATING else end * 60)
+        entries["duration"].append(
+            None if FLOATING in (start, end) else max(end - start, 0) * 60
+        )
+        entries["event_id"].append(None if event is None else event_id)
+        entries["project_id"].append(None if event is None else event.project_id)
+        entries["task_id"].append(None if event is None else event.task_id)
+        entries["description"].append(None if event is None else event.description)
+    return entries
+
+
+def load_entries(storage, key, lookup, project=None, task=None):
+    """The entries of one day, for iter_entries running in other processes"""
+    return day_entries(storage.load_columns(key), lookup, project, task)
+
+
+def iter_entries(
+    logs: TimManager,
+    events: EventTable,
+    start=None,
+    end=None,
+    project=None,
+    task=None,
+    jobs=1,
+):
+    """
+    day_entries of every log between start and end gathered into batches of at least
+    BATCH_SIZE entries (the last one being what's left), see iter_rows for the rest
+    """
+    lookup = events.table
+    if jobs == 1:
+        days = (
+            day_entries(columns, lookup, project, task)
+            for _, columns in logs.iter_columns(start, end)
+        )
+    else:
+        from tim.parallel import map_days
+
+        keys = logs.list_dates(start, end)
+        args = (lookup, project, task)
+        days = (
+            entries for _, entries in map_days(logs.storage, keys, load_entries, args, jobs)
+        )
+    batch = {name: [] for name in ENTRY_COLUMNS}
+    for entries in days:
+        for name, values in entries.items():
+            batch[name].extend(values)
+        if len(batch["date"]) >= BATCH_SIZE:
+            yield batch
+            batch = {name: [] for name in ENTRY_COLUMNS}
+    if len(batch["date"]) > 0:
+        yield batch
+
+
+def _local(seconds, tz):
+    return None if seconds is None else datetime.fromtimestamp(seconds, tz).isoformat()
+
+
+def write_jsonl(batches, out):
+    tz = local_tz()
+    for batch in batches:
+        lines = []
+        for values in zip(*(batch[name] for name in ENTRY_COLUMNS)):
+            entry = dict(zip(ENTRY_COLUMNS, values))
+            entry["date"] = entry["date"].isoformat()
+            entry["start"] = _local(entry["start"], tz)
+            entry["end"] = _local(entry["end"], tz)
+            lines.append(json.dumps(entry))
+        out.write("\n".join(lines) + "\n")
+
+
+def write_arrow(batches, path, format="arrow"):
+    """Write the batches to an Arrow IPC or Parquet file, ImportError without pyarrow"""
+    import pyarrow
+
+    schema = pyarrow.schema(
+        [
+            ("date", pyarrow.date32()),
+            ("position", pyarrow.int32()),
+            ("start", pyarrow.timestamp("s", tz="UTC")),
+            ("end", pyarrow.timestamp("s", tz="UTC")),
+            ("duration", pyarrow.duration("s")),
+            ("event_id", pyarrow.int32()),
+            ("project_id", pyarrow.int32()),
+            ("task_id", pyarrow.int32()),
+            ("description", pyarrow.string()),
+        ]
+    )
+    if format == "parquet":
+        import pyarrow.parquet
+
+        writer = pyarrow.parquet.ParquetWriter(path, schema)
+    else:
+        import pyarrow.ipc
+
+        writer = pyarrow.ipc.new_file(path, schema)
+    with writer:
+        for batch in batches:
+            columns = [
+                pyarrow.array(batch[field.name], type=field.type) for field in schema
+            ]
+            writer.write_table(
+                pyarrow.Table.from_batches([pyarrow.record_batch(columns, schema=schema)])
+            )
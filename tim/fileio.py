@@ -0,0 +1,212 @@
+from contextlib import contextmanager
+import json
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks (e.g. windows), the writes are still atomic
+    fcntl = None
+
+"""
+Writing files so a reader sees either the old or the new contents and never half of one, and
+advisory locks so tim processes changing the same file take turns.
+
+A file is written to a temporary file next to it and renamed over it, so the lock for a file
+is a separate path.lock rather than the file itself. The last one to let go of it removes it,
+so they don't pile up next to every day there is.
+
+A Transaction does the same for several files at once, see there.
+"""
+
+# path -> how many times this thread holds its lock, taking a lock again is a no op
+_held = threading.local()
+
+
+def _write_temporary(path, data: bytes):
+    """data written and synced to a temporary file next to path, returning its path"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        _remove(temp)
+        raise
+    return temp
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def atomic_write(path, data: bytes):
+    temp = _write_temporary(path, data)
+    try:
+        os.replace(temp, path)
+    except BaseException:
+        _remove(temp)
+        raise
+    _sync_directory(os.path.dirname(path) or ".")
+
+
+def _sync_directory(directory):
+    # so the rename itself survives a crash, not something every platform can do
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def lock_path(path):
+    return f"{path}.lock"
+
+
+@contextmanager
+def locked(path, shared=False):
+    """
+    Hold the lock of path, shared for reading or exclusive for changing it. Already holding
+    it (e.g. for a Transaction) it's left as it is.
+    """
+    held = _held.__dict__.setdefault("paths", {})
+    if fcntl is None or path in held:
+        held[path] = held.get(path, 0) + 1
+        try:
+            yield
+        finally:
+            held[path] -= 1
+            if held[path] == 0:
+                del held[path]
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    f = _lock(lock_path(path), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    held[path] = 1
+    try:
+        yield
+    finally:
+        del held[path]
+        _unlock(lock_path(path), f)
+
+
+def _lock(path, operation):
+    """The lock file path opened and locked, again when it was removed while waiting for it"""
+    while True:
+        f = open(path, "a+b")
+        try:
+            fcntl.flock(f.fileno(), operation)
+            try:
+                current = os.stat(path).st_ino == os.fstat(f.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+        except BaseException:
+            f.close()
+            raise
+        if current:
+            return f
+        # whoever had it removed it, anyone waiting for it now makes a new one
+        f.close()
+
+
+def _unlock(path, f):
+    try:
+        # nobody else holding it (or about to, see _lock), it can go
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        pass
+    else:
+        _remove(path)
+    finally:
+        # closing it lets go of the lock
+        f.close()
+
+
+class Transaction:
+    """
+    Files written and removed together, either all of them or none.
+
+    Everything is written to a temporary file next to where it goes as it is added. commit
+    then writes down (in intent) what goes where before moving them into place, so when it
+    is cut short by a crash the next recover(intent) finishes the job. Until then nothing
+    has changed, and abort just throws the temporary files away.
+    """
+
+    def __init__(self, intent):
+        self.intent = intent
+        # path -> temporary file with its new contents
+        self.renames = {}
+        self.removals = []
+
+    def write(self, path, data: bytes):
+        temp = _write_temporary(path, data)
+        self._forget(path)
+        self.renames[path] = temp
+
+    def remove(self, path):
+        self._forget(path)
+        self.removals.append(path)
+
+    def _forget(self, path):
+        if path in self.renames:
+            _remove(self.renames.pop(path))
+        if path in self.removals:
+            self.removals.remove(path)
+
+    def commit(self):
+        plan = {"renames": list(self.renames.items()), "removals": self.removals}
+        with locked(self.intent):
+            atomic_write(self.intent, json.dumps(plan).encode())
+            _apply(plan)
+            os.remove(self.intent)
+        self.renames = {}
+        self.removals = []
+
+    def abort(self):
+        for temp in self.renames.values():
+            _remove(temp)
+        self.renames = {}
+        self.removals = []
+
+
+def _apply(plan):
+    # every step can be done again, recover may be redoing a commit that got part of the way
+    for path, temp in plan["renames"]:
+        if os.path.exists(temp):
+            os.replace(temp, path)
+    for path in plan["removals"]:
+        _remove(path)
+    directories = {os.path.dirname(path) or "." for path, _ in plan["renames"]}
+    directories.update(os.path.dirname(path) or "." for path in plan["removals"])
+    for directory in directories:
+        _sync_directory(directory)
+
+
+def recover(intent):
+    """Finish the commit of a Transaction that was cut short, True when there was one"""
+    if not os.path.exists(intent):
+        return False
+    with locked(intent):
+        try:
+            with open(intent, "rb") as f:
+                plan = json.loads(f.read())
+        except FileNotFoundError:
+            # finished while waiting for the lock
+            return False
+        _apply(plan)
+        os.remove(intent)
+    return True
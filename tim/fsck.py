@@ -0,0 +1,260 @@
+from tim.columnar import EMPTY, FLOATING
+from tim.event import EventEmpty
+from tim.project import Project, Task
+
+from dataclasses import dataclass
+import os
+
+"""
+Checking the logs and tables for what would otherwise only show up (or crash) when they are
+shown: entries of events that aren't defined anymore, events of projects or tasks that
+aren't, logs whose times and events don't line up, entries ending before they start or
+overlapping others, and files that can't be read at all.
+
+The days are checked in parallel from their columns (see tim.parallel), against the set of
+defined event ids, the rest is lookups in the tables.
+
+    tim fsck
+    tim fsck --repair
+
+Repairing only does what doesn't lose anything or need a guess: an entry of an undefined
+event is made empty, a missing project or task is made again (named "missing ..." to be
+renamed), a log with too many events loses the extra ones and one with too few gets empty
+ones, and an unreadable day is moved out of the way (as .<date>.pkl.corrupt next to the
+logs) so the rest can be used. That last one needs the day to have its own file, a day sqlite
+or the archive can't read is left alone. Times out of order are left for tim log edit.
+"""
+
+# the kinds of problems --repair fixes (the first only with files, see Problem.repairable)
+REPAIRABLE = [
+    "unreadable log",
+    "lengths",
+    "missing event",
+    "missing project",
+    "missing task",
+    "last key",
+]
+
+
+@dataclass
+class Problem:
+    # "projects", "events" or the date key of a log
+    name: str
+    kind: str
+    message: str
+    # the entry or event it is about
+    target: int | None = None
+
+    def repairable(self, storage):
+        """Whether repair fixes it in storage"""
+        if self.kind == "unreadable log":
+            from tim.storage import FileStorage
+
+            # what's set aside is the day's own file, not a row of sqlite or the archive
+            return isinstance(storage, FileStorage) and os.path.exists(
+                storage.log_path(self.name)
+            )
+        return self.kind in REPAIRABLE
+
+    def __str__(self):
+        return f"{self.name}: {self.message}"
+
+
+def check_day(storage, key, event_ids):
+    """(problems, first time, last time) of a day, in minutes, see tim.parallel"""
+    try:
+        columns = storage.load_columns(key)
+    except Exception as e:
+        return [Problem(key, "unreadable log", f"can't be read ({e})")], None, None
+    times, events = columns.times, columns.events
+    problems = []
+    if len(times) != len(events) + 1:
+        problems.append(
+            Problem(
+                key,
+                "lengths",
+                f"has {len(times)} times for {len(events)} entries, "
+                "there should be one more time than entries",
+            )
+        )
+    for i, event_id in enumerate(events):
+        if event_id != EMPTY and event_id not in event_ids:
+            problems.append(
+                Problem(
+                    key,
+                    "missing event",
+                    f"entry {i} is event {event_id}, which isn't defined",
+                    i,
+                )
+            )
+    for i in range(len(times) - 1):
+        if times[i] == FLOATING:
+            problems.append(
+                Problem(key, "floating", f"time {i} isn't set but isn't the last one", i)
+            )
+    # the furthest any entry so far reaches
+    reach = None
+    for i in range(min(len(events), len(times) - 1)):
+        start, end = times[i], times[i + 1]
+        if start == FLOATING or end == FLOATING:
+            continue
+        if end < start:
+            problems.append(
+                Problem(
+                    key,
+                    "negative",
+                    f"entry {i} ends {start - end} minutes before it starts",
+                    i,
+                )
+            )
+            continue
+        if reach is not None and start < reach:
+            problems.append(
+                Problem(
+                    key,
+                    "overlap",
+                    f"entry {i} starts {reach - start} minutes before an earlier one ends",
+                    i,
+                )
+            )
+        reach = end if reach is None else max(reach, end)
+    set_times = [time for time in times if time != FLOATING]
+    if len(set_times) == 0:
+        return problems, None, None
+    return problems, set_times[0], max(set_times)
+
+
+def check_tables(projects, events):
+    """The problems of the links from the events to the projects and tasks"""
+    problems = []
+    for event_id, event in events.list_events():
+        project = projects.get_project(event.project_id)
+        if project is None:
+            problems.append(
+                Problem(
+                    "events",
+                    "missing project",
+                    f"event {event_id} is in project {event.project_id}, which doesn't exist",
+                    event_id,
+                )
+            )
+        elif project.get_task(event.task_id) is None:
+            problems.append(
+                Problem(
+                    "events",
+                    "missing task",
+                    f"event {event_id} is of task {event.task_id} of project "
+                    f"{event.project_id}, which doesn't exist",
+                    event_id,
+                )
+            )
+    if len(events.table) > 0 and events.last_key < max(events.table):
+        problems.append(
+            Problem(
+                "events",
+                "last key",
+                f"the last id given out is {events.last_key} but there is an event "
+                f"{max(events.table)}, the next one added would replace it",
+            )
+        )
+    return problems
+
+
+def fsck(session, jobs=1):
+    """(problems, days checked) of everything in the session's storage"""
+    from tim.parallel import map_days
+
+    storage = session.storage
+    problems = []
+    projects = events = None
+    for table in ["projects", "events"]:
+        try:
+            loaded = getattr(session, table)
+        except Exception as e:
+            problems.append(Problem(table, "unreadable table", f"can't be read ({e})"))
+            continue
+        if table == "projects":
+            projects = loaded
+        else:
+            events = loaded
+    if projects is not None and events is not None:
+        problems.extend(check_tables(projects, events))
+
+    keys = sorted(storage.list_logs())
+    # with the events unreadable every entry would be reported
+    event_ids = frozenset(events.table) if events is not None else _Everything()
+    previous = None
+    for key, (found, first, last) in map_days(storage, keys, check_day, (event_ids,), jobs):
+        problems.extend(found)
+        if previous is not None and first is not None and first < previous[1]:
+            problems.append(
+                Problem(
+                    key,
+                    "overlap",
+                    f"starts {previous[1] - first} minutes before {previous[0]} ends",
+                    0,
+                )
+            )
+        if last is not None:
+            previous = (key, last)
+    return problems, len(keys)
+
+
+class _Everything:
+    """Contains every event id"""
+
+    def __contains__(self, event_id):
+        return True
+
+
+def repair(session, problems):
+    """Fix the problems that can be (see REPAIRABLE), returning those that were"""
+    repaired = []
+    for problem in problems:
+        if problem.kind == "unreadable log" and problem.repairable(session.storage):
+            if session.storage.set_aside(problem.name):
+                repaired.append(problem)
+
+    logs = {}
+    with session.batch():
+        for problem in problems:
+            if problem.kind in ("lengths", "missing event"):
+                logs.setdefault(problem.name, []).append(problem)
+            elif problem.kind in ("missing project", "missing task"):
+                event = session.events.get_event(problem.target)
+                _recreate(session, event.project_id, event.task_id)
+                repaired.append(problem)
+            elif problem.kind == "last key":
+                session.events.last_key = max(session.events.table)
+                session.save_events()
+                repaired.append(problem)
+        for key, found in logs.items():
+            log = session.get_log(key)
+            # the entries by position before the events are lined up with the times
+            for problem in sorted(found, key=lambda problem: problem.kind != "missing event"):
+                if problem.kind == "missing event":
+                    log.events[problem.target] = EventEmpty()
+                elif len(log.times) == 0:
+                    # nothing to line the events up with
+                    continue
+                elif len(log.events) >= len(log.times):
+                    del log.events[len(log.times) - 1 :]
+                else:
+                    log.events.extend(
+                        EventEmpty() for _ in range(len(log.times) - 1 - len(log.events))
+                    )
+                repaired.append(problem)
+            session.save_log(log)
+    return repaired
+
+
+def _recreate(session, project_id, task_id):
+    projects = session.projects
+    project = projects.get_project(project_id)
+    if project is None:
+        project = Project(project_id, f"missing project {project_id}")
+        projects.add_project(project)
+        session.save_project(project_id)
+    if project.get_task(task_id) is None:
+        project.add_task(Task(task_id, f"missing task {task_id}"))
+        session.save_task(project_id, task_id)
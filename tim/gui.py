@@ -1,7 +1,9 @@
 from textual.app import App, ComposeResult
 from textual.containers import HorizontalGroup, VerticalScroll
 from textual.reactive import reactive
+from textual.screen import Screen
 from textual.widgets import (
+    DataTable,
     Footer,
     Header,
     Button,
@@ -10,13 +12,36 @@ from textual.widgets import (
     Select,
     TextArea,
     Input,
+    Label,
 )
-from textual import on
+from textual import on, work
 
-from tim import event, project
+from tim.columnar import ColumnarLog, FLOATING
 
-PROJECTS = project.ProjectTable.load()
-EVENTS = event.EventTable.load()
+from datetime import date
+import queue
+
+try:
+    from watchfiles import awatch
+except ImportError:
+    # without it the storage is checked every few seconds instead (only a stat)
+    awatch = None
+
+CHECK_INTERVAL = 2
+# days added to the history at a time
+PAGE = 100
+
+
+def open_session():
+    from tim.session import Session
+    from tim.storage import open_storage
+
+    return Session(open_storage())
+
+
+def show_duration(seconds):
+    hours, minutes = divmod(int(seconds) // 60, 60)
+    return f"{hours}:{minutes:02}"
 
 
 class ProjectSelect(Select):
@@ -35,8 +60,9 @@ class TaskSelect(Select):
 
 class EventDef(HorizontalGroup):
     def compose(self):
+        projects = self.app.session.projects
         yield ProjectSelect(
-            [(project.name, project.id) for (_, project) in PROJECTS.list_projects()],
+            [(project.name, project.id) for (_, project) in projects.list_projects()],
             id="project",
         )
         yield TaskSelect([], id="task")
@@ -45,16 +71,295 @@ class EventDef(HorizontalGroup):
 
     @on(Select.Changed, "#project")
     def project_select(self):
-        project_id = self.query_one("#project").value
-        task_list = [
-            (task.name, task.id)
-            for (_, task) in PROJECTS.get_project(project_id).list_tasks()
-        ]
+        select = self.query_one("#project")
+        task_list = []
+        if not select.is_blank():
+            project = self.app.session.projects.get_project(select.value)
+            if project is not None:
+                task_list = [(task.name, task.id) for (_, task) in project.list_tasks()]
         self.query_one("#task").set_options(task_list)
 
+    @on(Button.Pressed, "#save")
+    def save(self):
+        """Switch the log to the event, defining it first when it's new"""
+        from tim.event import EventDefinition
+        from tim.storage import StaleError
+
+        project = self.query_one("#project")
+        task = self.query_one("#task")
+        description = self.query_one(Input).value
+        if project.is_blank() or task.is_blank() or description == "":
+            self.notify(
+                "Pick a project and a task and describe the event.", severity="warning"
+            )
+            return
+
+        session = self.app.session
+        try:
+            definition = EventDefinition(project.value, task.value, description)
+            self.start_event(session, definition)
+        except StaleError:
+            # changed by someone else since it was loaded, start from what's there now
+            session.reset()
+            self.notify(
+                "The log was changed elsewhere, save again.", severity="warning"
+            )
+        self.app.query_one(LogView).sync()
+
+    def start_event(self, session, definition):
+        event_id = session.render.find(definition)
+        if event_id is None:
+            event_id = session.events.add_event(definition)
+            session.save_event(event_id)
+        log = session.latest()
+        if log is None:
+            session.save_log(session.logs.start(event_id))
+        else:
+            session.save_log(log, log.add(event_id))
+
+
 class EventDisplay(HorizontalGroup):
+    """One entry of the log, when it started, for how long and what it was"""
+
+    def __init__(self, position, **kwargs):
+        super().__init__(**kwargs)
+        self.position = position
+        self.labels = [
+            Label(classes="time"),
+            Label(classes="duration"),
+            Label(classes="event"),
+        ]
+        self.shown = [None] * len(self.labels)
+
+    def compose(self):
+        yield from self.labels
+
+    def show(self, log, minutes, render):
+        """minutes being the entry's duration from the log's columns, as in reports"""
+        start = log.times[self.position].get_time()
+        text = [
+            f"{self.position}) {start:%H:%M}",
+            show_duration(minutes * 60),
+            render.show(log.events[self.position]),
+        ]
+        # only the labels that changed are touched
+        for label, old, new in zip(self.labels, self.shown, text):
+            if old != new:
+                label.update(new)
+        self.shown = text
+
+
+class LogView(VerticalScroll):
+    """
+    The latest log, kept in step with the storage. Only the entries that changed since
+    it was last drawn are redrawn and the ones still running are ticked along.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # what was drawn, the log, the RenderCache it was drawn with and its columns
+        self.tim = None
+        self.render_cache = None
+        self.drawn = ColumnarLog()
+        self.displays = []
+        # entries ending at a floating time
+        self.running = []
+
+    def on_mount(self):
+        self.sync()
+        self.set_interval(1, self.tick)
+        paths = self.app.session.storage.watch_paths()
+        if awatch is not None and len(paths) > 0:
+            self.follow_storage(paths)
+        else:
+            self.set_interval(CHECK_INTERVAL, self.check_storage)
+
+    @work(exclusive=True)
+    async def follow_storage(self, paths):
+        async for _ in awatch(*paths):
+            self.check_storage()
+
+    def check_storage(self):
+        """Pick up changes made by someone else, e.g. the cli"""
+        self.app.session.refresh()
+        self.sync()
+
+    def sync(self):
+        session = self.app.session
+        log = session.latest()
+        render = session.render
+        if log is None:
+            self.remove_children()
+            self.tim, self.drawn = None, ColumnarLog()
+            self.displays, self.running = [], []
+            return
+        if (
+            self.tim is None
+            or log.start_date != self.tim.start_date
+            or render is not self.render_cache
+        ):
+            # another day or the tables were reloaded, all of it is redrawn
+            self.drawn = ColumnarLog()
+
+        columns = ColumnarLog.from_tim(log)
+        for display in self.displays[len(log.events) :]:
+            display.remove()
+        del self.displays[len(log.events) :]
+        added = []
+        durations = columns.durations()
+        for i in columns.changed_rows(self.drawn):
+            if i >= len(self.displays):
+                self.displays.append(EventDisplay(i))
+                added.append(self.displays[i])
+            self.displays[i].show(log, durations[i], render)
+        if len(added) > 0:
+            self.mount_all(added)
+            self.scroll_end(animate=False)
+
+        self.tim, self.render_cache, self.drawn = log, render, columns
+        self.running = [
+            i for i in range(len(log.events)) if columns.times[i + 1] == FLOATING
+        ]
+
+    def tick(self):
+        if len(self.running) == 0:
+            return
+        durations = self.drawn.durations()
+        for i in self.running:
+            self.displays[i].show(self.tim, durations[i], self.render_cache)
+
+
+class HistoryTable(DataTable):
+    def watch_scroll_y(self, old, new):
+        super().watch_scroll_y(old, new)
+        self.screen.check_more()
+
+
+class HistoryScreen(Screen):
+    """
+    Every day there is, newest first. Rows are added a page at a time as they're
+    scrolled to and the totals are worked out on a thread (through the report cache), so
+    the size of the history doesn't matter.
+    """
+
+    BINDINGS = [("escape", "app.pop_screen", "Back")]
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.keys = []
+        self.shown = 0
+        # date keys for the thread to summarize, None to stop it
+        self.pending = queue.Queue()
+
     def compose(self):
-        yield 
+        yield Header()
+        yield HistoryTable(cursor_type="row")
+        yield Footer()
+
+    def on_mount(self):
+        self.sub_title = "History"
+        self.keys = self.app.session.logs.list_dates()[::-1]
+        table = self.query_one(HistoryTable)
+        table.add_column("Day", key="day")
+        table.add_column("Total", key="total")
+        table.add_column("Most time on", key="top")
+        self.summarize_days(self.app.session.storage)
+        self.more()
+
+    def on_unmount(self):
+        self.pending.put(None)
+
+    def more(self):
+        table = self.query_one(HistoryTable)
+        for key in self.keys[self.shown : self.shown + PAGE]:
+            table.add_row(f"{key} {date.fromisoformat(key):%a}", "...", "", key=key)
+            self.pending.put(key)
+            self.shown += 1
+
+    def check_more(self):
+        table = self.query_one(HistoryTable)
+        if self.shown == len(self.keys):
+            return
+        bottom = max(table.scroll_y + table.size.height, table.cursor_row)
+        if bottom >= table.row_count - PAGE // 2:
+            self.more()
+
+    @on(DataTable.RowHighlighted)
+    def highlighted(self):
+        self.check_more()
+
+    @on(DataTable.RowSelected)
+    def selected(self, message):
+        self.app.push_screen(DayScreen(message.row_key.value))
+
+    @work(thread=True)
+    def summarize_days(self, storage):
+        from tim.report import ReportCache, day_summary
+
+        storage = storage.reopen()
+        cache = ReportCache.load(storage.identity())
+        while True:
+            key = self.pending.get()
+            if key is None:
+                break
+            summary = day_summary(storage, key, cache)
+            self.app.call_from_thread(self.show_summary, key, summary)
+        cache.save()
+
+    def show_summary(self, key, summary):
+        if not self.is_attached:
+            return
+        table = self.query_one(HistoryTable)
+        spent = {event_id: s for event_id, s in summary.items() if event_id is not None}
+        top = max(spent, key=spent.get, default=None)
+        table.update_cell(key, "total", show_duration(sum(spent.values())))
+        if top is not None:
+            table.update_cell(key, "top", self.app.session.render.show_id(top))
+
+
+class DayScreen(Screen):
+    """The entries of one day of the history"""
+
+    BINDINGS = [("escape", "app.pop_screen", "Back")]
+
+    def __init__(self, key, **kwargs):
+        super().__init__(**kwargs)
+        self.key = key
+
+    def compose(self):
+        yield Header()
+        yield DataTable(cursor_type="row")
+        yield Footer()
+
+    def on_mount(self):
+        self.sub_title = self.key
+        table = self.query_one(DataTable)
+        table.add_columns("", "Start", "End", "Time", "Event")
+        self.load_day(self.app.session.storage)
+
+    @work(thread=True)
+    def load_day(self, storage):
+        log = storage.reopen().load_log(self.key)
+        self.app.call_from_thread(self.show_day, log)
+
+    def show_day(self, log):
+        if not self.is_attached:
+            return
+        render = self.app.session.render
+        table = self.query_one(DataTable)
+        # in whole minutes like the totals of the history
+        durations = ColumnarLog.from_tim(log).durations()
+        for i, event in enumerate(log.events):
+            start = log.times[i].get_time()
+            end = log.times[i + 1].get_time()
+            table.add_row(
+                str(i),
+                f"{start:%H:%M}",
+                f"{end:%H:%M}",
+                show_duration(durations[i] * 60),
+                render.show(event),
+            )
+
 
 # class EventDefinition(HorizontalGroup):
 #     project_list = reactive(PROJECTS.list_projects)
@@ -87,11 +392,20 @@ class EventDisplay(HorizontalGroup):
 
 class TimApp(App):
     CSS_PATH = "static/css/app.tcss"
+    BINDINGS = [("f2", "history", "History")]
+
+    def __init__(self, session=None):
+        super().__init__()
+        self.session = open_session() if session is None else session
 
     def compose(self):
         yield Header()
         yield Footer()
         yield EventDef()
+        yield LogView()
+
+    def action_history(self):
+        self.push_screen(HistoryScreen())
 
 
 def main():
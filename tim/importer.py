@@ -0,0 +1,181 @@
+from tim.project import ProjectTable, Project, Task
+from tim.event import EventTable, EventDefinition
+
+from collections import Counter
+from dataclasses import dataclass, field
+import csv
+import json
+
+"""
+Bulk loading of projects, tasks and event definitions, e.g. from a dump of the billing system.
+
+Every row is a flat record with any of the columns
+
+    project_id, project_name, task_id, task_name, event_id, description
+
+A row with a project_name creates or renames the project, a task_name does the same for the
+task and a description adds an event definition for the project/task (or updates event_id
+when given). Rows only referring to a project or task by id expect it to exist already.
+"""
+
+@dataclass
+class ImportResult:
+    # e.g. ("project", "added") -> count
+    counts: Counter = field(default_factory=Counter)
+    # (row number, reason)
+    conflicts: list = field(default_factory=list)
+
+    def changed(self, kind):
+        return self.counts[(kind, "added")] + self.counts[(kind, "updated")] > 0
+
+
+def read_rows(file, format="csv"):
+    """Rows as dicts, streamed for csv and json lines. A json array is read all at once."""
+    if format == "csv":
+        yield from csv.DictReader(file)
+        return
+    first = file.read(1)
+    while first.isspace():
+        first = file.read(1)
+    if first == "[":
+        yield from json.loads(first + file.read())
+        return
+    rest = file.readline()
+    if first:
+        yield json.loads(first + rest)
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _value(row, column, type=str):
+    value = row.get(column)
+    if value is None or value == "":
+        return None
+    return type(value)
+
+
+class Conflict(Exception):
+    pass
+
+
+class Importer:
+    def __init__(self, projects: ProjectTable, events: EventTable, update=True):
+        self.projects = projects
+        self.events = events
+        # whether differing names/descriptions replace the existing ones or are conflicts
+        self.update = update
+        self.result = ImportResult()
+        self.known_events = {
+            (e.project_id, e.task_id, e.description): event_id
+            for event_id, e in events.list_events()
+        }
+
+    def apply(self, rows):
+        for number, row in enumerate(rows, start=1):
+            try:
+                self.apply_row(row)
+            except (ValueError, TypeError) as e:
+                self.conflict(number, f"unreadable row {row}: {e}")
+            except Conflict as e:
+                self.conflict(number, str(e))
+        return self.result
+
+    def conflict(self, number, reason):
+        self.result.conflicts.append((number, reason))
+
+    def apply_row(self, row):
+        # the whole row is read and checked before anything changes, a row with a conflict
+        # doesn't leave its project added without its task or event
+        project_id = _value(row, "project_id", int)
+        if project_id is None:
+            raise Conflict("no project_id")
+        project_name = _value(row, "project_name")
+        task_id = _value(row, "task_id", int)
+        task_name = _value(row, "task_name")
+        description = _value(row, "description")
+        event_id = None
+        if description is not None:
+            if task_id is None:
+                raise Conflict("an event description without a task_id")
+            event_id = _value(row, "event_id", int)
+
+        self.check_project(project_id, project_name)
+        if task_id is not None:
+            self.check_task(project_id, task_id, task_name)
+        if description is not None:
+            self.check_event(event_id, project_id, task_id, description)
+
+        project = self.apply_project(project_id, project_name)
+        if task_id is not None:
+            self.apply_task(project, task_id, task_name)
+        if description is not None:
+            self.apply_event(event_id, project_id, task_id, description)
+
+    def check_project(self, project_id, name):
+        project = self.projects.get_project(project_id)
+        if project is None:
+            if name is None:
+                raise Conflict(f"no project {project_id} and no project_name to add it")
+        elif name is not None and name != project.name and not self.update:
+            raise Conflict(f"project {project_id} is named {project.name}, not {name}")
+
+    def check_task(self, project_id, task_id, name):
+        task = self.projects.get_task(project_id, task_id)
+        if task is None:
+            if name is None:
+                raise Conflict(
+                    f"no task {task_id} in project {project_id} and no task_name to add it"
+                )
+        elif name is not None and name != task.name and not self.update:
+            raise Conflict(f"task {task_id} is named {task.name}, not {name}")
+
+    def check_event(self, event_id, project_id, task_id, description):
+        if event_id is None or self.update:
+            return
+        existing = self.events.get_event(event_id)
+        if existing is not None and existing != EventDefinition(
+            project_id, task_id, description
+        ):
+            raise Conflict(f"event {event_id} is already {existing}")
+
+    def apply_project(self, project_id, name):
+        project = self.projects.get_project(project_id)
+        if project is None:
+            project = Project(project_id, name)
+            self.projects.add_project(project)
+            self.count("project", "added")
+        elif name is not None and name != project.name:
+            self.projects.rename_project(project_id, name)
+            self.count("project", "updated")
+        return project
+
+    def apply_task(self, project, task_id, name):
+        task = project.get_task(task_id)
+        if task is None:
+            project.add_task(Task(task_id, name))
+            self.count("task", "added")
+        elif name is not None and name != task.name:
+            project.rename_task(task_id, name)
+            self.count("task", "updated")
+
+    def apply_event(self, event_id, project_id, task_id, description):
+        definition = EventDefinition(project_id, task_id, description)
+        key = (project_id, task_id, description)
+        if event_id is None:
+            if key not in self.known_events:
+                self.known_events[key] = self.events.add_event(definition)
+                self.count("event", "added")
+            return
+        existing = self.events.get_event(event_id)
+        if existing == definition:
+            return
+        if existing is not None:
+            old = (existing.project_id, existing.task_id, existing.description)
+            self.known_events.pop(old, None)
+        self.events.set_event(event_id, definition)
+        self.known_events[key] = event_id
+        self.count("event", "added" if existing is None else "updated")
+
+    def count(self, kind, what):
+        self.result.counts[(kind, what)] += 1
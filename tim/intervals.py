@@ -0,0 +1,270 @@
+from tim.constants import INTERVAL_INDEX_LOCATION
+from tim.columnar import ColumnarLog, EMPTY, FLOATING, now_minute, to_minute
+from tim.tim import Tim
+
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from typing import NamedTuple
+import pickle
+
+"""
+Every entry of every log as an interval of minutes, for asking what was going on at some time
+or over a range, and where entries overlap or leave gaps.
+
+The intervals are kept sorted by start, with an array of their starts next to them.
+Those longer than LONG minutes (and the running ones) are kept apart and checked one by
+one, so anything else overlapping a range starts at most LONG before it: a query bisects
+to that stretch and costs log n plus the entries of about a day, however long any one
+entry is. Changing a day inserts and removes its intervals in place, nothing is rebuilt.
+
+Like the report cache it is kept on disk per day against the storage's log signatures, so
+bringing it up to date only reloads the days that changed, and the session updates the day
+in place when it saves a log.
+
+Only the latest day's last entry can still be running. One of an earlier day that was never
+stopped is taken to end with its day (or the day's last time when that's later), not now.
+"""
+
+# end of an entry that is still running, taken as now when asked
+OPEN = 2**62
+# minutes, see above. Past a day an entry is most likely a time typed wrong
+LONG = 24 * 60
+# of the pickle, one of another version is made again
+INDEX_VERSION = 2
+
+
+class Interval(NamedTuple):
+    start: int
+    end: int
+    key: str
+    position: int
+    # EMPTY for the empty events
+    event_id: int
+    # the entry ends before it starts (a time edited out of order), start/end are swapped
+    backwards: bool = False
+
+
+def day_intervals(log: Tim) -> list[Interval]:
+    return column_intervals(ColumnarLog.from_tim(log))
+
+
+def column_intervals(columns: ColumnarLog) -> list[Interval]:
+    key = columns.start_date.strftime("%Y-%m-%d")
+    intervals = []
+    for i, event_id in enumerate(columns.events):
+        start, end = columns.times[i], columns.times[i + 1]
+        if start == FLOATING:
+            continue
+        end = OPEN if end == FLOATING else end
+        backwards = end < start
+        if backwards:
+            start, end = end, start
+        intervals.append(Interval(start, end, key, i, event_id, backwards))
+    return intervals
+
+
+def load_intervals(storage, key):
+    """day_intervals of a day from the storage, see tim.parallel"""
+    return column_intervals(storage.load_columns(key))
+
+
+def end_of(interval: Interval, now: int):
+    return now if interval.end == OPEN else interval.end
+
+
+def is_long(interval: Interval):
+    return interval.end - interval.start > LONG
+
+
+def closed(key, intervals):
+    """The intervals of a day that isn't the latest, the floating end closed (see above)"""
+    if all(interval.end != OPEN for interval in intervals):
+        return intervals
+    from tim.time import local_tz
+
+    midnight = datetime.fromisoformat(key).replace(tzinfo=local_tz()) + timedelta(days=1)
+    last = max(
+        [to_minute(midnight)]
+        + [interval.start for interval in intervals]
+        + [interval.end for interval in intervals if interval.end != OPEN]
+    )
+    return [
+        interval._replace(end=last) if interval.end == OPEN else interval
+        for interval in intervals
+    ]
+
+
+class IntervalIndex:
+    # above this many changed days the index is sorted again rather than inserted into
+    REBUILD_DAYS = 32
+
+    def __init__(self, identity):
+        self.identity = identity
+        self.version = INDEX_VERSION
+        # date key -> (storage signature, intervals)
+        self.days = {}
+        # the latest date key, the only day whose intervals are in the index as they are
+        self.latest = None
+        # those of every day (the others' closed) of at most LONG minutes and their starts
+        self.intervals = []
+        self.starts = array("q")
+        # the longer and running ones, sorted
+        self.long = []
+        self.changed = False
+
+    @classmethod
+    def load(cls, identity, file=INTERVAL_INDEX_LOCATION):
+        try:
+            with open(file, "rb") as f:
+                index = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            index = None
+        if (
+            not isinstance(index, cls)
+            or index.identity != identity
+            or getattr(index, "version", None) != INDEX_VERSION
+        ):
+            return cls(identity)
+        index.changed = False
+        return index
+
+    def save(self, file=INTERVAL_INDEX_LOCATION):
+        if not self.changed:
+            return
+        from tim.fileio import atomic_write
+
+        atomic_write(file, pickle.dumps(self))
+        self.changed = False
+
+    def refresh(self, storage, jobs=1):
+        """Catch up with the storage, only loading the days whose signature changed"""
+        from tim.parallel import map_days
+
+        keys = set(storage.list_logs())
+        for key in [key for key in self.days if key not in keys]:
+            self.set_day(key, None, None)
+        signatures = {key: storage.log_signature(key) for key in keys}
+        stale = sorted(
+            key
+            for key in keys
+            if signatures[key] is None
+            or key not in self.days
+            or self.days[key][0] != signatures[key]
+        )
+        if len(stale) <= self.REBUILD_DAYS:
+            for key, intervals in map_days(storage, stale, load_intervals, jobs=jobs):
+                self.set_day(key, signatures[key], intervals)
+            return
+        for key, intervals in map_days(storage, stale, load_intervals, jobs=jobs):
+            self.days[key] = (signatures[key], intervals)
+        self.latest = max(self.days, default=None)
+        everything = sorted(
+            interval for key in self.days for interval in self._indexed(key)
+        )
+        self.intervals = [interval for interval in everything if not is_long(interval)]
+        self.starts = array("q", [interval.start for interval in self.intervals])
+        self.long = [interval for interval in everything if is_long(interval)]
+        self.changed = True
+
+    def _indexed(self, key):
+        """The intervals of a day as they are in the index"""
+        _, intervals = self.days[key]
+        return intervals if key == self.latest else closed(key, intervals)
+
+    def _remove(self, key):
+        for interval in self._indexed(key):
+            found = self.long if is_long(interval) else self.intervals
+            i = bisect_left(found, interval)
+            if i < len(found) and found[i] == interval:
+                del found[i]
+                if found is self.intervals:
+                    del self.starts[i]
+
+    def _insert(self, key):
+        for interval in self._indexed(key):
+            if is_long(interval):
+                insort(self.long, interval)
+            else:
+                i = bisect_right(self.intervals, interval)
+                self.intervals.insert(i, interval)
+                self.starts.insert(i, interval.start)
+
+    def set_day(self, key, signature, intervals):
+        """Replace the intervals of a day, None removing it"""
+        if key in self.days:
+            self._remove(key)
+            del self.days[key]
+        latest = max(self.days, default=None)
+        if intervals is not None and (latest is None or key > latest):
+            latest = key
+        moved = []
+        if latest != self.latest:
+            # the day that was the latest closes and the one that is now opens again
+            moved = [
+                other
+                for other in (self.latest, latest)
+                if other is not None and other != key and other in self.days
+            ]
+        for other in moved:
+            self._remove(other)
+        self.latest = latest
+        for other in moved:
+            self._insert(other)
+        if intervals is not None:
+            self.days[key] = (signature, intervals)
+            self._insert(key)
+        self.changed = True
+
+    def between(self, start, end, now=None):
+        """The intervals overlapping [start, end) in minutes, in order of their start"""
+        now = now_minute() if now is None else now
+        # any shorter one starting before this ends before start
+        first = bisect_right(self.starts, start - LONG)
+        last = bisect_left(self.starts, end)
+        found = [
+            interval for interval in self.intervals[first:last] if interval.end > start
+        ]
+        long = [
+            interval
+            for interval in self.long
+            if interval.start < end and end_of(interval, now) > start
+        ]
+        return sorted(found + long) if long else found
+
+    def at(self, minute, now=None):
+        """The intervals covering a minute"""
+        return self.between(minute, minute + 1, now)
+
+    def overlaps(self, start, end, now=None):
+        """(earlier, later) pairs of intervals covering the same time"""
+        now = now_minute() if now is None else now
+        pairs = []
+        reach = None
+        for interval in self.between(start, end, now):
+            if reach is not None and interval.start < end_of(reach, now):
+                pairs.append((reach, interval))
+            if reach is None or end_of(interval, now) > end_of(reach, now):
+                reach = interval
+        return pairs
+
+    def gaps(self, start, end, minimum=1, now=None):
+        """
+        (from, to, key) stretches of at least minimum minutes within a day not covered by
+        anything but empty events
+        """
+        now = now_minute() if now is None else now
+        gaps = []
+        reach = None
+        for interval in self.between(start, end, now):
+            if interval.event_id == EMPTY:
+                continue
+            if reach is not None and reach.key == interval.key:
+                covered = end_of(reach, now)
+                if interval.start - covered >= minimum:
+                    gaps.append((covered, interval.start, interval.key))
+            if reach is None or reach.key != interval.key or end_of(
+                interval, now
+            ) > end_of(reach, now):
+                reach = interval
+        return gaps
@@ -0,0 +1,80 @@
+from tim.time import dump_time, load_time
+from tim.event import EventID, EventEmpty
+
+import json
+import os
+
+"""
+Append only record of the changes made to a log since it was last written in full.
+
+Each line is a json list, either
+    ["time", i, isoformat or null]   set (or append when i is the length) time i, null being floating
+    ["event", i, id or null]         set (or append when i is the length) event i, null being empty
+
+Records set absolute values so replaying the same journal twice gives the same log.
+"""
+
+# bytes of journal before it is folded back into the log file
+COMPACT_THRESHOLD = 16 * 1024
+
+
+class Journal:
+    def __init__(self, path, threshold=COMPACT_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+
+    def append(self, log, positions):
+        lines = []
+        for i in positions:
+            lines.append(json.dumps(["time", i, dump_time(log.times[i])]))
+            if i < len(log.events):
+                event = log.events[i]
+                lines.append(
+                    json.dumps(["event", i, None if event.is_empty() else event.id])
+                )
+        data = "".join(f"{line}\n" for line in lines).encode()
+        with open(self.path, "ab+") as f:
+            # start on a fresh line if a previous append was cut short
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def replay(self, log):
+        if not os.path.exists(self.path):
+            return log
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    kind, i, value = json.loads(line)
+                except ValueError:
+                    # partial line from a crash mid append
+                    continue
+                if kind == "time":
+                    self._set(log.times, i, load_time(value))
+                elif kind == "event":
+                    event = EventEmpty() if value is None else EventID(value)
+                    self._set(log.events, i, event)
+        return log
+
+    @staticmethod
+    def _set(values, i, value):
+        if i == len(values):
+            values.append(value)
+        else:
+            values[i] = value
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -1,13 +1,88 @@
 import argparse
+import sys
+from datetime import date
 
+# the rest of tim is imported by the handlers that need it, the command line
+# is run on every shell prompt so only pay for what the command uses
 
-from tim.tim import Tim, TimManager
-from tim.event import EventDefinition, EventTable
-from tim.project import ProjectTable, Project, Task
 
+def date_key(value):
+    """argparse type for a log key, %Y-%m-%d"""
+    return date.fromisoformat(value).isoformat()
 
-def handle_project_list(_):
-    projects = ProjectTable.load()
+
+def minute_of(value):
+    """argparse type for a time, %Y-%m-%d %H:%M or just %H:%M for today, as minutes"""
+    from datetime import datetime
+    from tim.columnar import to_minute
+    from tim.time import local_tz
+
+    try:
+        time = datetime.combine(date.today(), datetime.strptime(value, "%H:%M").time())
+    except ValueError:
+        time = datetime.fromisoformat(value)
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=local_tz())
+    return to_minute(time)
+
+
+def day_range(start, end):
+    """Minutes from the start of day start to the end of day end (keys or None)"""
+    from datetime import datetime
+    from tim.columnar import to_minute
+    from tim.intervals import OPEN
+    from tim.time import local_tz
+
+    def midnight(key):
+        return to_minute(datetime.fromisoformat(key).replace(tzinfo=local_tz()))
+
+    first = -OPEN if start is None else midnight(start)
+    last = OPEN if end is None else midnight(end) + 24 * 60
+    return first, last
+
+
+def resolve(value, ids, lookup, kind):
+    """
+    An id given either directly or by a name or prefix (ids being the matches for it),
+    exiting after saying why when there isn't exactly one (so a batch is rolled back)
+    """
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    if len(ids) == 1:
+        return ids[0]
+    elif len(ids) == 0:
+        print(f"No {kind} matching {value}.")
+    else:
+        names = ", ".join(f"{id}) {lookup(id).name}" for id in ids)
+        print(f"{value} matches several {kind}s: {names}")
+    sys.exit(1)
+
+
+def resolve_project(projects, value):
+    return resolve(
+        value, projects.resolve_project(value), projects.get_project, "project"
+    )
+
+
+def resolve_task(project, value):
+    if project is None:
+        return resolve(value, [], None, "task")
+    return resolve(value, project.resolve_task(value), project.get_task, "task")
+
+
+def existing_project(projects, value):
+    """The project given by id, name or prefix, exiting when there's no such project"""
+    project = projects.get_project(resolve_project(projects, value))
+    if project is None:
+        print(f"No project {value}.")
+        sys.exit(1)
+    return project
+
+
+def handle_project_list(args):
+    projects = args.session.projects
     for project_id, project in projects.list_projects():
         print(f"{project_id}) {project.name}")
         for task_id, task in project.list_tasks():
@@ -15,132 +90,278 @@ def handle_project_list(_):
 
 
 def handle_project_new(args):
-    projects = ProjectTable.load()
+    from tim.project import Project
+
+    session = args.session
+    projects = session.projects
     project_id = args.id
     project_name = args.name
 
     projects.add_project(Project(project_id, project_name))
-    projects.save()
+    session.save_project(project_id)
 
 
 def handle_project_delete(args):
-    projects = ProjectTable.load()
+    session = args.session
+    projects = session.projects
     project_id = args.id
 
+    if projects.get_project(project_id) is None:
+        print(f"No project {project_id}.")
+        sys.exit(1)
     projects.remove_project(project_id)
-    projects.save()
+    session.save_project(project_id)
 
 
 def handle_project_add(args):
-    projects = ProjectTable.load()
-    project_id = args.project_id
+    from tim.project import Task
+
+    session = args.session
+    projects = session.projects
+    prj = existing_project(projects, args.project)
     task_id = args.task_id
     task_name = args.name
 
-    prj = projects.get_project(project_id)
-    if prj is not None:
-        prj.add_task(Task(task_id, task_name))
-        projects.save()
+    prj.add_task(Task(task_id, task_name))
+    session.save_task(prj.id, task_id)
+
+
+def handle_project_find(args):
+    projects = args.session.projects
+    if args.project is None:
+        for project in projects.complete_project(args.prefix):
+            print(f"{project.id}) {project.name}")
+        return
+    project = existing_project(projects, args.project)
+    for task in project.complete_task(args.prefix):
+        print(f"{task.id} - {task.name}")
 
 
 def handle_event_list(args):
-    events = EventTable.load()
-    projects = ProjectTable.load()
-    for event_id, event in events.list_events():
-        prj = projects.get_project(event.project_id)
-        if prj is None:
-            print(f"No project associated with event: {event_id}, {event}. ")
-        else:
-            task = prj.get_task(event.task_id)
-            if task is None:
-                print(f"Task id {event.task_id} not associated with project {prj}.")
-            else:
-                print(f"{event_id}) {prj.name} - {task.name}: {event.description}")
+    from tim.trace import span
+
+    session = args.session
+    render = session.render
+    with span("show events"):
+        for event_id, event in session.events.list_events():
+            print(f"{event_id}) {render.show_id(event_id)}")
+
+
+def handle_event_search(args):
+    from tim.trace import span
+
+    session = args.session
+    index = session.search
+    with span("search events"):
+        found = index.search(" ".join(args.terms), args.limit)
+    index.save()
+    if len(found) == 0:
+        print("No events found.")
+        return
+    render = session.render
+    for event_id, _ in found:
+        print(f"{event_id}) {render.show_id(event_id)}")
 
 
 def handle_event_add(args):
-    events = EventTable.load()
-    project_id = args.project_id
-    task_id = args.task_id
+    from tim.event import EventDefinition
+
+    session = args.session
+    events = session.events
+    projects = session.projects
+    project = existing_project(projects, args.project)
+    project_id = project.id
+    task_id = resolve_task(project, args.task)
+    if project.get_task(task_id) is None:
+        print(f"No task {args.task} in project {project.name}.")
+        sys.exit(1)
     description = args.description
 
-    events.add_event(EventDefinition(project_id, task_id, description))
-    events.save()
+    event_id = events.add_event(EventDefinition(project_id, task_id, description))
+    session.save_event(event_id)
 
 
 def handle_event_delete(args):
-    events = EventTable.load()
-    events.delete_event(args.id)
-    events.save()
+    session = args.session
+    events = session.events
+    if events.delete_event(args.id) is None:
+        print(f"No event {args.id}.")
+        sys.exit(1)
+    session.save_event(args.id)
+
+
+def show_log(session, log):
+    from tim.trace import span
+
+    with span("show log"):
+        log.show(session.projects, session.events, session.render)
 
 
 def handle_log_list(args):
-    logs = TimManager.load()
-    for date, log in logs.list_logs():
+    logs = args.session.logs
+    for date in logs.list_dates():
         print(f"{date}")
 
 
 def handle_log_start(args):
-    projects = ProjectTable.load()
-    events = EventTable.load()
-    logs = TimManager.load()
+    session = args.session
+    logs = session.logs
     log = logs.start(args.event)
-    log.save()
-    log.show(projects, events)
+    session.save_log(log)
+    show_log(session, log)
 
 
 def handle_log_show(args):
-    projects = ProjectTable.load()
-    events = EventTable.load()
-    logs = TimManager.load()
+    session = args.session
     id = args.log
     if id is None:
-        log = logs.latest()
+        log = session.latest()
     else:
-        log = logs.get_log(id)
+        log = session.get_log(id)
 
-    log.show(projects, events)
+    show_log(session, log)
 
 
 def handle_log_delete(args):
-    logs = TimManager.load()
     id = args.log
-    logs.delete(id)
+    args.session.delete_log(id)
 
 
 def handle_log_stop(args):
-    projects = ProjectTable.load()
-    events = EventTable.load()
-    logs = TimManager.load()
-    log = logs.latest()
-    log.stop()
-    log.save()
-    log.show(projects, events)
+    session = args.session
+    log = session.latest()
+    changed = log.stop()
+    session.save_log(log, changed)
+    show_log(session, log)
 
 
 def handle_log_export(args):
-    projects = ProjectTable.load()
-    events = EventTable.load()
-    logs = TimManager.load()
-    log = logs.latest()
-    print(log.export(events))
+    from tim.export import iter_entries, iter_rows, write_arrow, write_csv, write_jsonl
+    from tim.trace import span
+
+    session = args.session
+    events = session.events
+    logs = session.logs
+    start, end = args.start, args.end
+    if start is None and end is None and not args.all:
+        # just the current log
+        start = end = max(logs.list_dates(), default=None)
+    filters = (start, end, args.project, args.task, args.jobs)
+    if args.format in ("arrow", "parquet"):
+        if args.output is None:
+            print(f"Give the file to write the {args.format} to with --output.")
+            sys.exit(1)
+        try:
+            with span("export"):
+                entries = iter_entries(logs, events, *filters)
+                write_arrow(entries, args.output, args.format)
+        except ImportError:
+            print(
+                f"Exporting to {args.format} needs pyarrow, pip install 'tim[arrow]'."
+            )
+            sys.exit(1)
+        return
+    if args.format == "jsonl":
+        write, data = write_jsonl, iter_entries(logs, events, *filters)
+    else:
+        write, data = write_csv, iter_rows(logs, events, *filters)
+    with span("export"):
+        if args.output is None:
+            write(data, sys.stdout)
+        else:
+            with open(args.output, "w", newline="") as f:
+                write(data, f)
+
+
+def show_interval(interval, render, now):
+    from tim.columnar import EMPTY, from_minute
+    from tim.intervals import OPEN, end_of
+
+    start = from_minute(interval.start)
+    end = from_minute(end_of(interval, now))
+    if interval.end == OPEN:
+        until = "now"
+    elif end.date() == start.date():
+        until = f"{end:%H:%M}"
+    else:
+        until = f"{end:%Y-%m-%d %H:%M}"
+    if interval.event_id == EMPTY:
+        what = "Nothing"
+    else:
+        what = render.show_id(interval.event_id)
+    backwards = " (ends before it starts)" if interval.backwards else ""
+    where = f"[{interval.key} {interval.position}]"
+    return f"{start:%Y-%m-%d %H:%M} - {until}  {where} {what}{backwards}"
+
+
+def handle_log_query_at(args):
+    from tim.columnar import now_minute
+
+    session = args.session
+    index = session.intervals
+    now = now_minute()
+    found = index.at(args.time, now)
+    if len(found) == 0:
+        print("Nothing logged then.")
+    for interval in found:
+        print(show_interval(interval, session.render, now))
+    index.save()
+
+
+def handle_log_query_range(args):
+    from tim.columnar import now_minute
+
+    session = args.session
+    index = session.intervals
+    now = now_minute()
+    for interval in index.between(*day_range(args.start, args.end), now):
+        print(show_interval(interval, session.render, now))
+    index.save()
+
+
+def handle_log_query_overlaps(args):
+    from tim.columnar import now_minute
+
+    session = args.session
+    index = session.intervals
+    now = now_minute()
+    overlaps = index.overlaps(*day_range(args.start, args.end), now)
+    if len(overlaps) == 0:
+        print("No overlaps.")
+    for earlier, later in overlaps:
+        print(show_interval(earlier, session.render, now))
+        print(f"  overlaps {show_interval(later, session.render, now)}")
+    index.save()
+
+
+def handle_log_query_gaps(args):
+    from tim.columnar import from_minute, now_minute
+
+    session = args.session
+    index = session.intervals
+    now = now_minute()
+    gaps = index.gaps(*day_range(args.start, args.end), args.min, now)
+    if len(gaps) == 0:
+        print("No gaps.")
+    for start, end, key in gaps:
+        print(
+            f"{from_minute(start):%Y-%m-%d %H:%M} - {from_minute(end):%H:%M}  "
+            f"{end - start} min"
+        )
+    index.save()
 
 
 def handle_log_add(args):
-    projects = ProjectTable.load()
-    events = EventTable.load()
-    logs = TimManager.load()
-    log = logs.latest()
-    log.add(args.event)
-    log.save()
-    log.show(projects, events)
+    session = args.session
+    log = session.latest()
+    changed = log.add(args.event)
+    session.save_log(log, changed)
+    show_log(session, log)
 
 
 def handle_log_edit_time(args):
-    projects = ProjectTable.load()
-    events = EventTable.load()
-    logs = TimManager.load()
-    log = logs.latest()
+    session = args.session
+    log = session.latest()
     vals = {
         "year": args.year,
         "month": args.month,
@@ -148,24 +369,210 @@ def handle_log_edit_time(args):
         "hour": args.hour,
         "minute": args.minute,
     }
-    log.update_time(args.position, **vals)
-    log.save()
-    log.show(projects, events)
+    changed = log.update_time(args.position, **vals)
+    session.save_log(log, changed)
+    show_log(session, log)
 
 
 def handle_log_edit_event(args):
-    projects = ProjectTable.load()
-    events = EventTable.load()
-    logs = TimManager.load()
-    log = logs.latest()
+    session = args.session
+    log = session.latest()
     position = args.position
     val = args.id
-    log.update_event(position, val)
-    log.save()
-    log.show(projects, events)
+    changed = log.update_event(position, val)
+    session.save_log(log, changed)
+    show_log(session, log)
+
+
+def handle_report(args):
+    from tim.report import ReportCache, report, label
+    from tim.trace import span
+
+    session = args.session
+    projects = session.projects
+    events = session.events
+    logs = session.logs
+    cache = ReportCache.load(session.storage.identity())
+    with span("report"):
+        totals = report(
+            logs, events, args.start, args.end, args.by, args.group, cache, args.jobs
+        )
+    cache.save()
+    for name, values in totals.items():
+        print(name)
+        for key, seconds in sorted(values.items(), key=lambda item: -item[1]):
+            print(f"  {seconds / 3600:7.2f}  {label(key, args.by, projects, events)}")
+
+
+def handle_import(args):
+    from tim.importer import Importer, read_rows
+
+    session = args.session
+    format = args.format
+    if format is None:
+        format = "json" if args.file.endswith((".json", ".jsonl")) else "csv"
+    importer = Importer(session.projects, session.events, update=not args.keep)
+    if args.file == "-":
+        result = importer.apply(read_rows(sys.stdin, format))
+    else:
+        with open(args.file, newline="") as f:
+            result = importer.apply(read_rows(f, format))
+
+    if not args.dry_run:
+        # everything is saved once at the end rather than per row
+        if result.changed("project") or result.changed("task"):
+            session.save_projects()
+        if result.changed("event"):
+            session.save_events()
+
+    for kind in ["project", "task", "event"]:
+        added = result.counts[(kind, "added")]
+        updated = result.counts[(kind, "updated")]
+        print(f"{kind}s: {added} added, {updated} updated")
+    print(f"conflicting rows: {len(result.conflicts)}")
+    for number, reason in result.conflicts[:20]:
+        print(f"  row {number}: {reason}")
+    if len(result.conflicts) > 20:
+        print(f"  ... and {len(result.conflicts) - 20} more")
+
+
+def handle_migrate(args):
+    from tim.constants import CONFIG_LOCATION, SQLITE_LOCATION
+    from tim.storage import FileStorage, SqliteStorage, copy_storage
+
+    storage = args.session.storage
+    if isinstance(storage, FileStorage):
+        # the only place the files of older versions are read
+        storage.legacy = True
+    if args.to is not None:
+        if args.to == "sqlite":
+            target = SqliteStorage(args.path or SQLITE_LOCATION)
+        else:
+            target = FileStorage(format=args.format or "binary")
+        copy_storage(storage, target)
+        print(
+            f"Copied everything, set backend = {args.to} in the [storage] section of "
+            f"{CONFIG_LOCATION} to use it."
+        )
+    elif isinstance(storage, FileStorage):
+        if args.format is not None:
+            storage.format = args.format
+        legacy = storage.rewrite()
+        print(
+            f"Rewrote everything as {storage.format}, {legacy} files were from older "
+            "versions of tim."
+        )
+    else:
+        print("Nothing to migrate, the current storage isn't using files.")
 
 
-def main():
+def handle_archive(args):
+    from tim.storage import FileStorage
+
+    storage = args.session.storage
+    if not isinstance(storage, FileStorage):
+        print("Nothing to archive, the current storage isn't using files.")
+        return
+    before = args.before or date.today().isoformat()
+    moved, running = storage.archive_logs(before)
+    print(f"Archived {len(moved)} days from before {before}.")
+    if len(running) > 0:
+        print(
+            f"Left out {len(running)} days that were never stopped: "
+            f"{', '.join(running)}"
+        )
+
+
+def handle_batch(args):
+    from tim.batch import BatchError, run_batch
+    from tim.storage import StaleError
+
+    if args.file is None or args.file == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(args.file) as f:
+            lines = f.read().splitlines()
+    try:
+        run_batch(lines, args.session)
+    except BatchError as e:
+        print(f"{e}\nNothing was saved.", file=sys.stderr)
+        sys.exit(1)
+    except StaleError as e:
+        # already started over RETRIES times, and stdin can't be read again
+        print(f"{e} Gave up after {RETRIES} tries, nothing was saved.", file=sys.stderr)
+        sys.exit(1)
+
+
+def handle_fsck(args):
+    from tim.fsck import fsck, repair
+
+    problems, days = fsck(args.session, args.jobs)
+    repaired = repair(args.session, problems) if args.repair else []
+    fixed = {id(problem) for problem in repaired}
+    for problem in problems:
+        print(f"{problem}{' (repaired)' if id(problem) in fixed else ''}")
+    if len(problems) == 0:
+        print(f"Checked {days} days, no problems.")
+        return
+    left = len(problems) - len(repaired)
+    if args.repair:
+        print(
+            f"Checked {days} days, {len(problems)} problems, {len(repaired)} repaired."
+        )
+    else:
+        fixable = sum(problem.repairable(args.session.storage) for problem in problems)
+        print(
+            f"Checked {days} days, {len(problems)} problems, "
+            f"--repair fixes {fixable} of them."
+        )
+    if left > 0:
+        sys.exit(1)
+
+
+def handle_sync(args):
+    from tim.sync import SyncError, open_remote, sync
+
+    remote = open_remote(args.remote)
+    try:
+        result = sync(args.session, remote, args.prefer, args.jobs)
+    except SyncError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    received_rows = sum(result.received_rows.values())
+    sent_rows = sum(result.sent_rows.values())
+    print(
+        f"Got {len(result.received)} days and {received_rows} rows of the tables "
+        f"from {remote}, sent {len(result.sent)} days and {sent_rows} rows."
+    )
+    for old, new in result.renumbered:
+        print(f"Event {old} was also added elsewhere, it is event {new} now.")
+    if len(result.conflicts) > 0:
+        print(f"{len(result.conflicts)} conflicts, left as they are on each side:")
+        for conflict in result.conflicts:
+            print(f"  {conflict}")
+        print("Edit them to match or sync again with --prefer local/remote.")
+
+
+def handle_daemon_run(args):
+    from tim import daemon
+
+    daemon.serve(args.session)
+
+
+def handle_daemon_stop(args):
+    from tim import daemon
+
+    if not daemon.stop():
+        print("The daemon isn't running.")
+
+
+def handle_daemon_status(args):
+    from tim import daemon
+
+    print("running" if daemon.is_running() else "stopped")
+
+
+def build_parser():
     """
     want an interface that acts something like
 
@@ -176,9 +583,29 @@ def main():
 
 
     """
+    # imports tim.tim and the rest, which every command but --help loads for its session
+    from tim.export import FORMATS
+
     parser = argparse.ArgumentParser(description="Tool for time logging.")
     # needed so the func can just be called for all parsers
     parser.set_defaults(func=lambda _: parser.print_help())
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Print how long the imports and loading took to stderr.",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print how long loading, saving and showing took to stderr "
+        "(or set TIM_TRACE=1).",
+    )
+    parser.add_argument(
+        "--timings-output",
+        type=str,
+        help="Also write the timings to a file, a Chrome trace for .json and a "
+        "cProfile dump otherwise (or set TIM_TRACE to the file).",
+    )
     subparsers = parser.add_subparsers()
 
     #
@@ -211,11 +638,24 @@ def main():
     )
     project_add.set_defaults(func=handle_project_add)
     project_add.add_argument(
-        "project_id", type=int, help="The project id to add the task to."
+        "project", type=str, help="The project id (or name) to add the task to."
     )
     project_add.add_argument("task_id", type=int, help="The id of the task to add.")
     project_add.add_argument("name", type=str, help="The name of the task to add.")
 
+    project_find = project_commands.add_parser(
+        "find",
+        description="List the projects, or the tasks of a project, starting with a "
+        "prefix.",
+    )
+    project_find.add_argument(
+        "prefix", type=str, nargs="?", default="", help="The start of the name."
+    )
+    project_find.add_argument(
+        "--project", type=str, help="List the tasks of this project id (or name)."
+    )
+    project_find.set_defaults(func=handle_project_find)
+
     #
     # Events interface
     #
@@ -231,9 +671,26 @@ def main():
     )
     event_list.set_defaults(func=handle_event_list)
 
+    event_search = event_commands.add_parser(
+        "search",
+        description="Find events by the words of their description, project and task, "
+        "best matches first.",
+    )
+    event_search.add_argument(
+        "terms", type=str, nargs="+", help="Words (or the start of them) to look for."
+    )
+    event_search.add_argument(
+        "--limit", type=int, default=20, help="Show at most this many events."
+    )
+    event_search.set_defaults(func=handle_event_search)
+
     event_add = event_commands.add_parser("add", description="Add an event definition.")
-    event_add.add_argument("project_id", type=int, help="The project for the event.")
-    event_add.add_argument("task_id", type=int, help="The task id for the event.")
+    event_add.add_argument(
+        "project", type=str, help="The project id (or name) for the event."
+    )
+    event_add.add_argument(
+        "task", type=str, help="The task id (or name) for the event."
+    )
     event_add.add_argument("description", type=str, help="The description of the task.")
     event_add.set_defaults(func=handle_event_add)
 
@@ -279,10 +736,76 @@ def main():
     log_stop.set_defaults(func=handle_log_stop)
 
     log_export = log_commands.add_parser(
-        "export", description="Export the log to a csv to be uploaded."
+        "export",
+        description="Export logs to a csv to be uploaded, or to jsonl/arrow/parquet "
+        "with every entry for analytics (see tim.export). Defaults to the current log.",
+    )
+    log_export.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="csv",
+        help="arrow and parquet need pyarrow and --output.",
+    )
+    log_export.add_argument(
+        "--all", action="store_true", help="Every log rather than the current one."
+    )
+    log_export.add_argument(
+        "--from",
+        dest="start",
+        type=date_key,
+        help="The first date (%%Y-%%m-%%d) to export.",
+    )
+    log_export.add_argument(
+        "--to", dest="end", type=date_key, help="The last date (%%Y-%%m-%%d) to export."
+    )
+    log_export.add_argument("--project", type=int, help="Only export this project id.")
+    log_export.add_argument("--task", type=int, help="Only export this task id.")
+    log_export.add_argument(
+        "--output", type=str, help="The file to write to, defaults to stdout."
+    )
+    log_export.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Processes to spread the days over, 0 for one per core.",
     )
     log_export.set_defaults(func=handle_log_export)
 
+    log_query = log_commands.add_parser(
+        "query",
+        description="Look up entries across every log by time, and find overlaps and "
+        "gaps.",
+    )
+    log_query.set_defaults(func=lambda _: log_query.print_help())
+    log_query_commands = log_query.add_subparsers()
+    query_at = log_query_commands.add_parser(
+        "at", description="What was being done at a time."
+    )
+    query_at.add_argument(
+        "time", type=minute_of, help="%%Y-%%m-%%d %%H:%%M, or %%H:%%M for today."
+    )
+    query_at.set_defaults(func=handle_log_query_at)
+    for name, description, func in [
+        ("range", "Every entry between two dates.", handle_log_query_range),
+        ("overlaps", "Entries covering the same time.", handle_log_query_overlaps),
+        ("gaps", "Time within a day with nothing logged.", handle_log_query_gaps),
+    ]:
+        query = log_query_commands.add_parser(name, description=description)
+        query.add_argument(
+            "--from", dest="start", type=date_key, help="The first date (%%Y-%%m-%%d)."
+        )
+        query.add_argument(
+            "--to", dest="end", type=date_key, help="The last date (%%Y-%%m-%%d)."
+        )
+        query.set_defaults(func=func)
+        if name == "gaps":
+            query.add_argument(
+                "--min",
+                type=int,
+                default=1,
+                help="Only gaps of at least this many minutes.",
+            )
+
     log_add = log_commands.add_parser(
         "add", description="Add a new event to the end of the log."
     )
@@ -321,9 +844,351 @@ def main():
     log_edit_event.add_argument("id", type=int, help="The event to update to.")
     log_edit_event.set_defaults(func=handle_log_edit_event)
 
-    args = parser.parse_args()
-    args.func(args)
+    #
+    # Report interface
+    #
+    parser_report = subparsers.add_parser(
+        "report", description="Hours spent over a range of logs."
+    )
+    parser_report.add_argument(
+        "--from",
+        dest="start",
+        type=date_key,
+        help="The first date (%%Y-%%m-%%d) to include.",
+    )
+    parser_report.add_argument(
+        "--to",
+        dest="end",
+        type=date_key,
+        help="The last date (%%Y-%%m-%%d) to include.",
+    )
+    # these mirror report.BY and report.GROUPS, written out so the parser is built
+    # without loading tim.report
+    parser_report.add_argument(
+        "--by",
+        choices=["project", "task", "event"],
+        default="project",
+        help="What to total the time by.",
+    )
+    parser_report.add_argument(
+        "--group",
+        choices=["total", "day", "week", "month"],
+        default="total",
+        help="The period to total over.",
+    )
+    parser_report.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Processes to spread the days over, 0 for one per core.",
+    )
+    parser_report.set_defaults(func=handle_report)
+
+    #
+    # Import interface
+    #
+    parser_import = subparsers.add_parser(
+        "import",
+        description="Add or update projects, tasks and event definitions from a csv or "
+        "json file with the columns project_id, project_name, task_id, task_name, "
+        "event_id and description.",
+    )
+    parser_import.add_argument(
+        "file", type=str, help="The file to import, - for stdin."
+    )
+    parser_import.add_argument(
+        "--format",
+        choices=["csv", "json"],
+        help="The format of the file, json being json lines or an array of objects. "
+        "Guessed from the extension by default.",
+    )
+    parser_import.add_argument(
+        "--keep",
+        action="store_true",
+        help="Treat differing names and descriptions as conflicts instead of updating.",
+    )
+    parser_import.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report what would change without saving.",
+    )
+    parser_import.set_defaults(func=handle_import)
+
+    #
+    # Migrate interface
+    #
+    parser_migrate = subparsers.add_parser(
+        "migrate",
+        description="Rewrite the files in the current format or copy everything to "
+        "another storage backend.",
+    )
+    parser_migrate.add_argument(
+        "--to", choices=["file", "sqlite"], help="Copy everything to this backend."
+    )
+    parser_migrate.add_argument(
+        "--format",
+        choices=["binary", "json"],
+        help="The format to write the files in, json is for debugging.",
+    )
+    parser_migrate.add_argument(
+        "--path", type=str, help="The sqlite file to copy to with --to sqlite."
+    )
+    parser_migrate.set_defaults(func=handle_migrate)
+
+    #
+    # Archive interface
+    #
+    parser_archive = subparsers.add_parser(
+        "archive",
+        description="Pack the closed days into the read only archive, they are still "
+        "shown, reported and exported as before.",
+    )
+    parser_archive.add_argument(
+        "--before",
+        type=date_key,
+        help="Only the days before this date (%%Y-%%m-%%d), defaults to today.",
+    )
+    parser_archive.set_defaults(func=handle_archive)
+
+    #
+    # Batch interface
+    #
+    parser_batch = subparsers.add_parser(
+        "batch",
+        description="Run a command per line (without the tim) against one load of "
+        "everything and save all the changes together at the end, or nothing when one "
+        "fails.",
+    )
+    parser_batch.add_argument(
+        "file", type=str, nargs="?", help="The commands, defaults to stdin (-)."
+    )
+    parser_batch.set_defaults(func=handle_batch)
+
+    #
+    # Fsck interface
+    #
+    parser_fsck = subparsers.add_parser(
+        "fsck",
+        description="Check every log and table for references to things that don't "
+        "exist, times that don't line up and files that can't be read.",
+    )
+    parser_fsck.add_argument(
+        "--repair",
+        action="store_true",
+        help="Fix what can be fixed without losing anything, see tim.fsck.",
+    )
+    parser_fsck.add_argument(
+        "--jobs",
+        type=int,
+        default=0,
+        help="Processes to spread the days over, defaults to one per core.",
+    )
+    parser_fsck.set_defaults(func=handle_fsck)
+
+    #
+    # Sync interface
+    #
+    parser_sync = subparsers.add_parser(
+        "sync",
+        description="Bring the logs and tables here and those in a sync directory up "
+        "to date with each other, only sending what changed since the last sync. "
+        "Changes to different entries of a day or rows of a table are merged.",
+    )
+    parser_sync.add_argument(
+        "remote",
+        type=str,
+        help="The sync directory, a path or host:path to reach it over ssh ($TIM_SSH).",
+    )
+    parser_sync.add_argument(
+        "--prefer",
+        choices=["local", "remote"],
+        help="Settle conflicts with this side's version instead of leaving them.",
+    )
+    parser_sync.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Processes to spread hashing the changed days over, 0 for one per core.",
+    )
+    parser_sync.set_defaults(func=handle_sync)
+
+    #
+    # Daemon interface
+    #
+    parser_daemon = subparsers.add_parser(
+        "daemon",
+        description="Keep the tables loaded and answer the other commands over a "
+        "socket.",
+    )
+    parser_daemon.set_defaults(func=lambda _: parser_daemon.print_help())
+    daemon_commands = parser_daemon.add_subparsers()
+    daemon_run = daemon_commands.add_parser(
+        "run", description="Run the daemon in the foreground."
+    )
+    daemon_run.set_defaults(func=handle_daemon_run)
+    daemon_stop = daemon_commands.add_parser("stop", description="Stop the daemon.")
+    daemon_stop.set_defaults(func=handle_daemon_stop)
+    daemon_status = daemon_commands.add_parser(
+        "status", description="Whether the daemon is running."
+    )
+    daemon_status.set_defaults(func=handle_daemon_status)
+
+    return parser
+
+
+# times a command is started over when what it saves was changed by someone else
+RETRIES = 10
+
+
+def new_session():
+    from tim.storage import open_storage
+    from tim.session import Session
+
+    return Session(open_storage())
+
+
+def run(argv, session=None):
+    """Run a command line against a session, a fresh one when not given"""
+    args = build_parser().parse_args(argv)
+    if args.profile_startup:
+        profile_startup(args, session)
+        return
+    if args.timings or args.timings_output is not None:
+        run_timed(args, session)
+        return
+    args.session = new_session() if session is None else session
+    run_command(args)
+
+
+def run_command(args):
+    """
+    Run the command's handler, starting it over on freshly loaded tables and logs when a
+    save finds someone else changed them since they were loaded
+    """
+    from tim.serialize import LegacyError
+    from tim.storage import StaleError
+
+    try:
+        retry(lambda: args.func(args), args.session)
+    except StaleError as e:
+        print(f"{e} Gave up after {RETRIES} tries.", file=sys.stderr)
+        sys.exit(1)
+    except LegacyError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+
+def retry(function, session):
+    """
+    Call function until it gets through without a StaleError, resetting the session
+    before starting it over. The last StaleError is raised after RETRIES tries.
+    """
+    from tim.storage import StaleError
+    import random
+    import time
+
+    for attempt in range(RETRIES):
+        try:
+            return function()
+        except StaleError:
+            session.reset()
+            if attempt == RETRIES - 1:
+                raise
+            # a random wait so processes that collided don't just collide again
+            time.sleep(random.uniform(0, min(0.01 * 2**attempt, 0.5)))
+
+
+def run_timed(args, session=None):
+    from tim import trace
+
+    output = args.timings_output
+    profiler = None
+    if output is not None and not output.endswith(".json"):
+        import cProfile
+
+        profiler = cProfile.Profile()
+    with trace.recording() as spans:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            with trace.span("command"):
+                with trace.span("open storage"):
+                    args.session = new_session() if session is None else session
+                run_command(args)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            print(trace.breakdown(spans), file=sys.stderr)
+    if output is None:
+        return
+    if profiler is None:
+        trace.write_chrome_trace(spans, output)
+    else:
+        profiler.dump_stats(output)
+    print(f"Wrote the timings to {output}", file=sys.stderr)
+
+
+def profile_startup(args, session=None):
+    from time import perf_counter, process_time
+    from tim import trace
+
+    before = process_time()
+    trace.enable()
+    spans = trace.spans()
+    start = perf_counter()
+    with trace.ImportTimer() as imports:
+        with trace.span("open storage"):
+            args.session = new_session() if session is None else session
+        run_command(args)
+    total = perf_counter() - start
+    trace.disable()
+
+    lines = [f"cpu before the command {before * 1000:8.2f} ms", "slowest imports"]
+    slowest = sorted(imports.times.items(), key=lambda item: -item[1])[:15]
+    for name, seconds in slowest:
+        lines.append(f"  {seconds * 1000:8.2f} ms  {name}")
+    lines.append("phases")
+    lines.append(trace.breakdown(spans))
+    lines.append(f"command total {total * 1000:8.2f} ms")
+    print("\n".join(lines), file=sys.stderr)
+
+
+# commands never handed to the daemon: it can't read our stdin for a batch, nor stop or
+# start itself, and a sync runs ssh with our environment
+LOCAL_COMMANDS = ["daemon", "batch", "sync"]
+# the options before the command that take a value, see build_parser
+VALUE_OPTIONS = ["--timings-output"]
+
+
+def command_of(argv):
+    """(command, its arguments) of argv, skipping the options before the command"""
+    i = 0
+    while i < len(argv) and argv[i].startswith("-"):
+        i += 2 if argv[i] in VALUE_OPTIONS else 1
+    if i >= len(argv):
+        return None, []
+    return argv[i], argv[i + 1 :]
+
+
+def runs_here(argv):
+    """Whether argv has to be run in this process rather than by the daemon"""
+    command, arguments = command_of(argv)
+    if command == "import" and "-" in arguments:
+        # the daemon would read its own stdin
+        return True
+    return command in LOCAL_COMMANDS or "--profile-startup" in argv
+
+
+def main():
+    from tim.trace import from_environment
+
+    argv = from_environment(sys.argv[1:])
+    if not runs_here(argv):
+        from tim import daemon
 
-    # projects = ProjectTable.load()
+        # hand the command to the daemon when it is up, otherwise do it here
+        status = daemon.request(argv)
+        if status is not None:
+            sys.exit(status)
 
-    # print(projects)
+    run(argv)
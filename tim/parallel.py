@@ -0,0 +1,77 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import os
+import sys
+
+"""
+Spreading the work per day over processes, for the commands going through the whole history.
+
+map_days(storage, keys, function, args, jobs) calls function(storage, key, *args) for every key
+and yields (key, result) in the order of the keys, so anything merged from the results comes
+out the same however many jobs there are. The function has to be a module level function (it
+is sent to the workers by name) and its results picklable, the storage and args are sent once
+per worker. With one job, or too few days to be worth starting processes for, it all happens in
+this process one day after another.
+
+The days are sent out in chunks with at most WINDOW chunks per job waiting or running, the next
+one going out as the first is taken, so a long history never has every result in memory at once
+(and stopping early doesn't wait for the rest of it).
+"""
+
+# fewer days than this per job and starting the processes costs more than it saves
+MIN_DAYS_PER_JOB = 8
+# chunks sent out per job before waiting on the first, and the most days in a chunk
+WINDOW = 4
+MAX_CHUNK = 32
+
+# set in each worker by _init
+_storage = None
+_args = ()
+
+
+def _init(storage, args):
+    global _storage, _args
+    _storage = storage
+    _args = args
+
+
+def _call(function, keys):
+    return [function(_storage, key, *_args) for key in keys]
+
+
+def job_count(jobs):
+    """The number of processes for --jobs, 0 being one per core"""
+    if jobs == 0:
+        return os.cpu_count() or 1
+    return max(jobs, 1)
+
+
+def map_days(storage, keys, function, args=(), jobs=1):
+    keys = list(keys)
+    jobs = min(job_count(jobs), len(keys) // MIN_DAYS_PER_JOB)
+    if jobs <= 1:
+        for key in keys:
+            yield key, function(storage, key, *args)
+        return
+
+    try:
+        executor = ProcessPoolExecutor(jobs, initializer=_init, initargs=(storage, args))
+    except (OSError, NotImplementedError, ImportError) as e:
+        print(f"Couldn't start {jobs} processes ({e}), doing it in one.", file=sys.stderr)
+        yield from map_days(storage, keys, function, args, jobs=1)
+        return
+    # a few chunks per job so a slow stretch of days doesn't hold up the rest
+    chunk = min(max(len(keys) // (jobs * WINDOW), 1), MAX_CHUNK)
+    pending = deque()
+    try:
+        for i in range(0, len(keys), chunk):
+            part = keys[i : i + chunk]
+            pending.append((part, executor.submit(_call, function, part)))
+            if len(pending) >= jobs * WINDOW:
+                part, future = pending.popleft()
+                yield from zip(part, future.result())
+        while len(pending) > 0:
+            part, future = pending.popleft()
+            yield from zip(part, future.result())
+    finally:
+        executor.shutdown(cancel_futures=True)
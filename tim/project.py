@@ -1,8 +1,7 @@
 from tim.constants import PROJECT_TABLE_LOCATION
 
+from bisect import bisect_left, insort
 from dataclasses import dataclass, field
-import pickle
-import os
 
 """
 Could have separate task and project tables so it mimics more closely the sql database structure,
@@ -16,6 +15,79 @@ bit of the interface.
 """
 
 
+class NameIndex:
+    """
+    Lookups from names to ids, exact, ignoring case and by prefix (also ignoring case).
+    Names don't have to be unique so each lookup gives every matching id.
+    """
+
+    def __init__(self, items=()):
+        self.exact = {}
+        self.folded = {}
+        # sorted (casefolded name, id) for prefix searches
+        self.prefixes = []
+        for name, id in items:
+            folded = name.casefold()
+            self.exact.setdefault(name, []).append(id)
+            self.folded.setdefault(folded, []).append(id)
+            self.prefixes.append((folded, id))
+        # sorted once rather than inserting each
+        self.prefixes.sort()
+
+    def add(self, name: str, id: int):
+        self.exact.setdefault(name, []).append(id)
+        self.folded.setdefault(name.casefold(), []).append(id)
+        insort(self.prefixes, (name.casefold(), id))
+
+    def remove(self, name: str, id: int):
+        self._discard(self.exact, name, id)
+        self._discard(self.folded, name.casefold(), id)
+        i = bisect_left(self.prefixes, (name.casefold(), id))
+        if i < len(self.prefixes) and self.prefixes[i] == (name.casefold(), id):
+            del self.prefixes[i]
+
+    @staticmethod
+    def _discard(index, key, id):
+        ids = index.get(key, [])
+        if id in ids:
+            ids.remove(id)
+            if len(ids) == 0:
+                del index[key]
+
+    def find(self, name: str) -> list[int]:
+        return list(self.exact.get(name, []))
+
+    def find_folded(self, name: str) -> list[int]:
+        return list(self.folded.get(name.casefold(), []))
+
+    def find_prefix(self, prefix: str) -> list[int]:
+        prefix = prefix.casefold()
+        ids = []
+        for i in range(bisect_left(self.prefixes, (prefix,)), len(self.prefixes)):
+            name, id = self.prefixes[i]
+            if not name.startswith(prefix):
+                break
+            ids.append(id)
+        return ids
+
+    def resolve(self, text: str) -> list[int]:
+        """The ids for text, the exact matches, otherwise ignoring case, otherwise by prefix"""
+        return self.find(text) or self.find_folded(text) or self.find_prefix(text)
+
+
+# the indexes are rebuilt on load rather than pickled
+class Indexed:
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("index", None)
+        state.pop("_index", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__post_init__()
+
+
 @dataclass
 class Task:
     id: int
@@ -23,22 +95,57 @@ class Task:
 
 
 @dataclass
-class Project:
+class Project(Indexed):
     id: int
     name: str
     tasks: dict = field(default_factory=dict)
+    _index: NameIndex = field(init=False, default=None, repr=False, compare=False)
+    # bumped by every change to the tasks, for anything caching what it shows
+    version: int = field(init=False, default=0, repr=False, compare=False)
+
+    def __post_init__(self):
+        # built the first time a task is looked up by name, which most projects loaded
+        # (e.g. with the whole table) never are
+        self._index = None
+
+    @property
+    def index(self) -> NameIndex:
+        if self._index is None:
+            self._index = NameIndex((task.name, task.id) for task in self.tasks.values())
+        return self._index
 
     def add_task(self, task: Task):
+        if task.id in self.tasks:
+            self.remove_task(task.id)
+        index = self.index
         self.tasks[task.id] = task
+        index.add(task.name, task.id)
+        self.version += 1
 
     def remove_task(self, task_id: int):
-        return self.tasks.pop(task_id)
-
-    def find_task(self, name: str) -> Task | None:
-        for key, val in self.tasks:
-            if val.name == name:
-                return key
-        return None
+        index = self.index
+        task = self.tasks.pop(task_id)
+        index.remove(task.name, task_id)
+        self.version += 1
+        return task
+
+    def rename_task(self, task_id: int, name: str):
+        task = self.tasks[task_id]
+        self.index.remove(task.name, task_id)
+        task.name = name
+        self.index.add(name, task_id)
+        self.version += 1
+
+    def find_task(self, name: str) -> int | None:
+        ids = self.index.find(name)
+        return ids[0] if len(ids) > 0 else None
+
+    def resolve_task(self, text: str) -> list[int]:
+        """ids of the tasks by name, ignoring case or by prefix, see NameIndex.resolve"""
+        return self.index.resolve(text)
+
+    def complete_task(self, prefix: str) -> list[Task]:
+        return [self.tasks[id] for id in self.index.find_prefix(prefix)]
 
     def get_task(self, task_id: int) -> Task | None:
         return self.tasks.get(task_id)
@@ -48,20 +155,47 @@ class Project:
 
 
 @dataclass
-class ProjectTable:
+class ProjectTable(Indexed):
     table: dict = field(default_factory=dict)
+    index: NameIndex = field(init=False, repr=False, compare=False)
+    # bumped by every change to the projects (not their tasks, see Project.version)
+    version: int = field(init=False, default=0, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.index = NameIndex(
+            (project.name, project.id) for project in self.table.values()
+        )
 
     def add_project(self, project: Project):
+        if project.id in self.table:
+            self.remove_project(project.id)
         self.table[project.id] = project
+        self.index.add(project.name, project.id)
+        self.version += 1
 
     def remove_project(self, project_id: int):
-        return self.table.pop(project_id)
+        project = self.table.pop(project_id)
+        self.index.remove(project.name, project_id)
+        self.version += 1
+        return project
+
+    def rename_project(self, project_id: int, name: str):
+        project = self.table[project_id]
+        self.index.remove(project.name, project_id)
+        project.name = name
+        self.index.add(name, project_id)
+        self.version += 1
 
     def find_project(self, name: str):
-        for key, val in self.table.items():
-            if val.name == name:
-                return key
-        return None
+        ids = self.index.find(name)
+        return ids[0] if len(ids) > 0 else None
+
+    def resolve_project(self, text: str) -> list[int]:
+        """ids of the projects by name, ignoring case or by prefix, see NameIndex.resolve"""
+        return self.index.resolve(text)
+
+    def complete_project(self, prefix: str) -> list[Project]:
+        return [self.table[id] for id in self.index.find_prefix(prefix)]
 
     def find_task(self, project_id: int, name: str):
         project = self.table.get(project_id)
@@ -85,10 +219,11 @@ class ProjectTable:
 
     @classmethod
     def load(cls, file=PROJECT_TABLE_LOCATION):
-        with open(file, "rb") as f:
-            return pickle.load(f)
+        from tim import serialize
+
+        return serialize.load(file)
+
+    def save(self, file=PROJECT_TABLE_LOCATION, format="binary"):
+        from tim import serialize
 
-    def save(self, file=PROJECT_TABLE_LOCATION):
-        os.makedirs(os.path.dirname(file), exist_ok=True)
-        with open(file, "wb") as f:
-            pickle.dump(self, f)
+        serialize.dump(self, file, format)
@@ -0,0 +1,71 @@
+from tim.event import Event, EventDefinition, EventTable
+from tim.project import ProjectTable
+
+"""
+The text of each event for showing logs, worked out once per event rather than every
+time it appears.
+
+Entries are dropped whenever the event or project table has changed since (their version
+counters moved on) and each entry remembers the version of its project, so renaming a
+task only goes stale the events of that project.
+
+It also finds the id of an event from its definition, for reusing one rather than adding
+the same event again.
+"""
+
+
+class RenderCache:
+    def __init__(self, projects: ProjectTable, events: EventTable):
+        self.projects = projects
+        self.events = events
+        # event id -> (text, project, project version)
+        self.entries = {}
+        self.versions = (projects.version, events.version)
+        # (project id, task id, description) -> the first event id with them
+        self.ids = None
+        self.ids_version = None
+
+    def show(self, event: Event):
+        if event.is_empty():
+            return "Nothing"
+        return self.show_id(event.id)
+
+    def show_id(self, event_id: int):
+        versions = (self.projects.version, self.events.version)
+        if versions != self.versions:
+            self.entries.clear()
+            self.versions = versions
+        entry = self.entries.get(event_id)
+        if entry is not None:
+            text, project, version = entry
+            if project is None or project.version == version:
+                return text
+        text, project = self.render(event_id)
+        version = None if project is None else project.version
+        self.entries[event_id] = (text, project, version)
+        return text
+
+    def find(self, event: EventDefinition):
+        """The id of an event with the same definition, None when there's none"""
+        if self.ids is None or self.ids_version != self.events.version:
+            self.ids = {}
+            for event_id, other in self.events.list_events():
+                self.ids.setdefault(
+                    (other.project_id, other.task_id, other.description), event_id
+                )
+            self.ids_version = self.events.version
+        return self.ids.get((event.project_id, event.task_id, event.description))
+
+    def render(self, event_id: int):
+        event = self.events.get_event(event_id)
+        if event is None:
+            return f"Unknown event {event_id}", None
+        project = self.projects.get_project(event.project_id)
+        if project is None:
+            return f"Unknown project {event.project_id} | {event.description}", None
+        if project.get_task(event.task_id) is None:
+            return (
+                f"{project.name} - Unknown task {event.task_id} | {event.description}",
+                project,
+            )
+        return event.show(self.projects), project
@@ -0,0 +1,208 @@
+from tim.constants import REPORT_CACHE_LOCATION
+from tim.tim import Tim, TimManager
+from tim.columnar import ColumnarLog, EMPTY
+from tim.event import EventTable
+from tim.project import ProjectTable
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date
+import pickle
+
+"""
+Totals of the time spent over a range of logs.
+
+Every day is first summarized to the seconds spent per event id. That only depends on
+the day's log so it is cached against the storage's signature for the day and only
+recomputed when the day changes. The summaries are then rolled up to projects, tasks or
+events using the current event definitions so editing an event doesn't invalidate anything.
+"""
+
+GROUPS = ["total", "day", "week", "month"]
+BY = ["project", "task", "event"]
+# of the cached summaries, a cache of another one is started over
+CACHE_VERSION = 2
+
+
+def summarize(log: Tim):
+    """seconds spent per event id, None for the empty events"""
+    return summarize_columns(ColumnarLog.from_tim(log))
+
+
+def summarize_columns(columns: ColumnarLog):
+    totals = defaultdict(float)
+    for event_id, minutes in zip(columns.events, columns.durations()):
+        totals[None if event_id == EMPTY else event_id] += minutes * 60
+    return dict(totals)
+
+
+def is_open(log: Tim):
+    # still running so the summary changes without the log changing
+    return ColumnarLog.from_tim(log).is_open()
+
+
+@dataclass
+class ReportCache:
+    identity: str
+    # date key -> (storage signature, summary)
+    days: dict = field(default_factory=dict)
+    changed: bool = False
+    version: int = CACHE_VERSION
+
+    @classmethod
+    def load(cls, identity, file=REPORT_CACHE_LOCATION):
+        try:
+            with open(file, "rb") as f:
+                cache = pickle.load(f)
+        except (
+            OSError,
+            pickle.UnpicklingError,
+            EOFError,
+            # pickled by a version of tim whose classes moved or are gone
+            AttributeError,
+            ModuleNotFoundError,
+        ):
+            cache = None
+        if (
+            not isinstance(cache, cls)
+            or cache.identity != identity
+            # from before the entries ending before they start counted for nothing
+            or vars(cache).get("version") != CACHE_VERSION
+        ):
+            # different store, start from scratch
+            return cls(identity)
+        cache.changed = False
+        return cache
+
+    def save(self, file=REPORT_CACHE_LOCATION):
+        if not self.changed:
+            return
+        from tim.fileio import atomic_write
+
+        # the gui's history and the cli can save it at the same time
+        atomic_write(file, pickle.dumps(self))
+        self.changed = False
+
+    def get(self, key, signature):
+        cached = self.days.get(key)
+        if signature is None or cached is None or cached[0] != signature:
+            return None
+        return cached[1]
+
+    def put(self, key, signature, summary):
+        self.days[key] = (signature, summary)
+        self.changed = True
+
+
+def summaries(
+    logs: TimManager, start=None, end=None, cache: ReportCache = None, jobs=1
+):
+    """
+    Yield (key, summary) for the logs between start and end (inclusive). The days that have
+    to be loaded are spread over jobs processes, see tim.parallel.
+    """
+    from tim.parallel import map_days
+
+    storage = logs.storage
+    keys = logs.list_dates(start, end)
+    # taken before loading so a day changing meanwhile isn't cached as the new version
+    signatures = {key: storage.log_signature(key) for key in keys}
+    missing = [
+        key
+        for key in keys
+        if key not in logs.logs
+        and (cache is None or cache.get(key, signatures[key]) is None)
+    ]
+    loaded = dict(map_days(storage, missing, load_summary, jobs=jobs))
+    for key in keys:
+        if key not in loaded:
+            yield key, day_summary(storage, key, cache, logs.logs.get(key))
+            continue
+        summary, running = loaded[key]
+        if cache is not None and signatures[key] is not None and not running:
+            cache.put(key, signatures[key], summary)
+        yield key, summary
+
+
+def load_summary(storage, key):
+    """(summary, whether it's still running) of a day from the storage, see summaries"""
+    columns = storage.load_columns(key)
+    return summarize_columns(columns), columns.is_open()
+
+
+def day_summary(storage, key, cache: ReportCache = None, log: Tim = None):
+    """The summary of a single day, log being the day when it's already loaded"""
+    signature = storage.log_signature(key)
+    summary = None if cache is None else cache.get(key, signature)
+    if summary is None:
+        if log is None:
+            columns = storage.load_columns(key)
+        else:
+            columns = ColumnarLog.from_tim(log)
+        summary = summarize_columns(columns)
+        if cache is not None and signature is not None and not columns.is_open():
+            cache.put(key, signature, summary)
+    return summary
+
+
+def period(key: str, group: str):
+    if group == "total":
+        return "Total"
+    elif group == "day":
+        return key
+    elif group == "week":
+        year, week, _ = date.fromisoformat(key).isocalendar()
+        return f"{year}-W{week:02}"
+    elif group == "month":
+        return key[:7]
+    raise ValueError(f"Unknown group {group}, expected one of {GROUPS}.")
+
+
+def report(
+    logs: TimManager,
+    events: EventTable,
+    start=None,
+    end=None,
+    by="project",
+    group="total",
+    cache: ReportCache = None,
+    jobs=1,
+):
+    """
+    Seconds spent as {period: {key: seconds}} where key is a project id, a (project id,
+    task id) pair or an event id depending on by. Keys are None for the empty events and
+    the project/task of deleted event definitions.
+    """
+    totals = defaultdict(lambda: defaultdict(float))
+    for key, summary in summaries(logs, start, end, cache, jobs):
+        current = totals[period(key, group)]
+        for event_id, seconds in summary.items():
+            current[group_key(event_id, events, by)] += seconds
+    return {name: dict(values) for name, values in totals.items()}
+
+
+def group_key(event_id, events: EventTable, by):
+    if by == "event":
+        return event_id
+    event = None if event_id is None else events.get_event(event_id)
+    if by == "project":
+        return None if event is None else event.project_id
+    elif by == "task":
+        return None if event is None else (event.project_id, event.task_id)
+    raise ValueError(f"Unknown grouping {by}, expected one of {BY}.")
+
+
+def label(key, by, projects: ProjectTable, events: EventTable):
+    if key is None:
+        return "Nothing"
+    if by == "event":
+        event = events.get_event(key)
+        return f"{key}) Unknown event" if event is None else f"{key}) {event.description}"
+    project_id, task_id = (key, None) if by == "project" else key
+    project = projects.get_project(project_id)
+    name = f"Unknown project {project_id}" if project is None else project.name
+    if task_id is None:
+        return name
+    task = None if project is None else project.get_task(task_id)
+    task_name = f"Unknown task {task_id}" if task is None else task.name
+    return f"{name} - {task_name}"
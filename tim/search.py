@@ -0,0 +1,436 @@
+from tim.constants import SEARCH_INDEX_LOCATION
+from tim.event import EventTable, EventDefinition
+from tim.fileio import atomic_write
+from tim.project import ProjectTable, Project, Task
+
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+import heapq
+import json
+import math
+import os
+import pickle
+import re
+
+"""
+Finding events by the words of their description and of their project and task names.
+
+An inverted index from each word to the events it appears in, so a search only looks at the
+events of the words searched for rather than going over every definition. The words of the
+project and task names point at the (project, task) they name and from there at the events
+of that task, so renaming a project or a task doesn't touch the events.
+
+Every word searched for has to appear in the event (as a word or the start of one), the
+events are ranked by how rare the words they matched are (idf), matches in the description
+counting for more than matches in the names and whole words more than prefixes.
+
+It is kept on disk against the signatures of the tables it was built from. The session
+updates it in place when it saves an event, project or task, anything else changing the
+tables (another version of tim, tim import) has the part of it that changed rebuilt by the
+next search.
+
+The file is a pickle of a small header (the signatures) followed by one of the index, and the
+changes saved since it was written are appended to a journal next to it as json lines
+
+    [generation, "event", event id, [project id, task id, description] or null, signature]
+    [generation, "project", project id, [name, [[task id, name], ...]] or null, signature]
+
+replayed when it's loaded. Saving an event only appends a line, without even loading the index
+(see SearchJournal), it is written whole again after a rebuild or once the journal has more
+than JOURNAL_LIMIT lines. Each time it's written whole it gets a new generation, lines of
+another one were appended to an index that's been replaced and are skipped.
+"""
+
+WORD = re.compile(r"\w+")
+# a name matching counts this much of the same word in the description
+NAME_WEIGHT = 0.5
+# a word only matching as a prefix counts this much of matching whole
+PREFIX_WEIGHT = 0.5
+# of the file, one of another version is built again
+INDEX_VERSION = 2
+# journal lines before the index is written whole again
+JOURNAL_LIMIT = 1000
+
+
+def words(text: str):
+    return [word.casefold() for word in WORD.findall(text)]
+
+
+def _expand(vocabulary, prefix):
+    """(word, whether it's the whole word) for the words starting with prefix"""
+    for i in range(bisect_left(vocabulary, prefix), len(vocabulary)):
+        word = vocabulary[i]
+        if not word.startswith(prefix):
+            break
+        yield word, word == prefix
+
+
+class SearchIndex:
+    def __init__(self, identity):
+        self.identity = identity
+        # table name -> signature of the table the index is up to date with
+        self.signatures = {}
+        # word -> sorted ids of the events with it in their description, once per time it's in
+        # it. Arrays since they load and save far faster than dicts or sets of the ids
+        self.postings = {}
+        # sorted ids of every event
+        self.events = array("i")
+        # event id -> (project id, task id, description) it was indexed as, to take it out
+        # of just the postings it's in
+        self.indexed = {}
+        # project id -> task id -> sorted ids of the events of the task
+        self.tasks = {}
+        # word -> (project id, task id) whose name has it, task id None for the project name
+        self.names = {}
+        # project id -> the words of its name and its tasks' names
+        self.project_words = {}
+        # sorted words of postings and names, for prefixes
+        self.vocabulary = []
+        self.name_vocabulary = []
+        self.generation = None
+        self.changed = False
+        # journal lines for the changes since it was loaded or saved, the lines already in
+        # the journal, and whether it has to be written whole
+        self.pending = []
+        self.journaled = 0
+        self.rebuilt = True
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ["changed", "pending", "journaled", "rebuilt"]:
+            state.pop(name)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.changed = False
+        self.pending = []
+        self.journaled = 0
+        self.rebuilt = False
+
+    @classmethod
+    def load(cls, identity, file=SEARCH_INDEX_LOCATION):
+        try:
+            with open(file, "rb") as f:
+                header = pickle.load(f)
+                index = pickle.load(f) if _matches(header, identity) else None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+            index = None
+        if not isinstance(index, cls):
+            return cls(identity)
+        for record in _journal(file, index.generation):
+            index._replay(*record)
+            index.journaled += 1
+        index.pending = []
+        # written whole by the next save once the journal has grown too long
+        index.changed = index.journaled > JOURNAL_LIMIT
+        index.rebuilt = index.changed
+        return index
+
+    def save(self, file=SEARCH_INDEX_LOCATION):
+        if not self.changed:
+            return
+        if self.rebuilt or self.journaled + len(self.pending) > JOURNAL_LIMIT:
+            self.generation = os.urandom(8).hex()
+            header = {
+                "version": INDEX_VERSION,
+                "identity": self.identity,
+                "generation": self.generation,
+                "signatures": self.signatures,
+            }
+            atomic_write(file, pickle.dumps(header) + pickle.dumps(self))
+            try:
+                os.remove(f"{file}.journal")
+            except FileNotFoundError:
+                pass
+            self.journaled = 0
+            self.rebuilt = False
+        else:
+            _append(file, self.generation, self.pending)
+            self.journaled += len(self.pending)
+        self.pending = []
+        self.changed = False
+
+    def is_current(self, table, signature):
+        return signature is not None and self.signatures.get(table) == signature
+
+    def build_events(self, events: EventTable, signature):
+        postings = defaultdict(list)
+        tasks = defaultdict(lambda: defaultdict(list))
+        self.indexed = {}
+        for event_id, event in sorted(events.list_events()):
+            for word in words(event.description):
+                postings[word].append(event_id)
+            tasks[event.project_id][event.task_id].append(event_id)
+            self.indexed[event_id] = (event.project_id, event.task_id, event.description)
+        self.postings = {word: array("i", ids) for word, ids in postings.items()}
+        self.events = array("i", sorted(events.table))
+        self.tasks = {
+            project_id: {task_id: array("i", ids) for task_id, ids in project.items()}
+            for project_id, project in tasks.items()
+        }
+        self.vocabulary = sorted(self.postings)
+        self.signatures["events"] = signature
+        self.changed = self.rebuilt = True
+
+    def build_names(self, projects: ProjectTable, signature):
+        self.names = {}
+        self.project_words = {}
+        for project_id, project in projects.list_projects():
+            self._add_project(project_id, project, sort=False)
+        self.name_vocabulary = sorted(self.names)
+        self.signatures["projects"] = signature
+        self.changed = self.rebuilt = True
+
+    def set_event(self, event_id, event: EventDefinition | None, signature):
+        """Replace the event, None removing it"""
+        self._set_event(event_id, event, signature)
+        self.pending.append(_event_record(event_id, event, signature))
+
+    def set_project(self, projects: ProjectTable, project_id, signature):
+        """Take the names of a project and its tasks from projects again"""
+        project = projects.get_project(project_id)
+        self._set_project(project_id, project, signature)
+        self.pending.append(_project_record(project_id, project, signature))
+
+    def _replay(self, kind, key, value, signature):
+        if kind == "event":
+            event = None if value is None else EventDefinition(*value)
+            self._set_event(key, event, signature)
+        else:
+            project = None
+            if value is not None:
+                name, tasks = value
+                project = Project(key, name, {id: Task(id, task) for id, task in tasks})
+            self._set_project(key, project, signature)
+
+    def _set_event(self, event_id, event, signature):
+        i = bisect_left(self.events, event_id)
+        if i < len(self.events) and self.events[i] == event_id:
+            del self.events[i]
+            self._remove_event(event_id)
+        if event is not None:
+            insort(self.events, event_id)
+            self._add_event(event_id, event)
+        self.signatures["events"] = signature
+        self.changed = True
+
+    def _set_project(self, project_id, project, signature):
+        for word in self.project_words.pop(project_id, ()):
+            keys = self.names[word]
+            keys.difference_update([key for key in keys if key[0] == project_id])
+            if len(keys) == 0:
+                del self.names[word]
+                del self.name_vocabulary[bisect_left(self.name_vocabulary, word)]
+        if project is not None:
+            self._add_project(project_id, project)
+        self.signatures["projects"] = signature
+        self.changed = True
+
+    def _add_event(self, event_id, event):
+        for word in words(event.description):
+            ids = self.postings.get(word)
+            if ids is None:
+                ids = self.postings[word] = array("i")
+                insort(self.vocabulary, word)
+            insort(ids, event_id)
+        ids = self.tasks.setdefault(event.project_id, {}).setdefault(
+            event.task_id, array("i")
+        )
+        insort(ids, event_id)
+        self.indexed[event_id] = (event.project_id, event.task_id, event.description)
+
+    def _remove_event(self, event_id):
+        project_id, task_id, description = self.indexed.pop(event_id)
+        for word in dict.fromkeys(words(description)):
+            ids = self.postings[word]
+            _discard(ids, event_id)
+            if len(ids) == 0:
+                del self.postings[word]
+                del self.vocabulary[bisect_left(self.vocabulary, word)]
+        _discard(self.tasks[project_id][task_id], event_id)
+
+    def _add_project(self, project_id, project, sort=True):
+        self._add_name((project_id, None), project.name, sort)
+        for task_id, task in project.list_tasks():
+            self._add_name((project_id, task_id), task.name, sort)
+
+    def _add_name(self, key, name, sort=True):
+        found = self.project_words.setdefault(key[0], set())
+        for word in words(name):
+            keys = self.names.get(word)
+            if keys is None:
+                keys = self.names[word] = set()
+                if sort:
+                    insort(self.name_vocabulary, word)
+            keys.add(key)
+            found.add(word)
+
+    def _named_events(self, project_id, task_id):
+        project = self.tasks.get(project_id, {})
+        if task_id is not None:
+            return project.get(task_id, ())
+        # the project's name, every event of any of its tasks
+        return [event_id for ids in project.values() for event_id in ids]
+
+    def _idf(self, count):
+        return math.log(1 + len(self.events) / max(count, 1))
+
+    def _scores(self, term):
+        """event id -> score for the events with the term somewhere"""
+        scores = defaultdict(float)
+        for word, whole in _expand(self.vocabulary, term):
+            ids = self.postings[word]
+            weight = self._idf(len(ids)) * (1 if whole else PREFIX_WEIGHT)
+            # an id is in there once for every time the word is in the description
+            for event_id in ids:
+                scores[event_id] += weight
+        for word, whole in _expand(self.name_vocabulary, term):
+            for project_id, task_id in self.names[word]:
+                ids = self._named_events(project_id, task_id)
+                weight = self._idf(len(ids)) * NAME_WEIGHT * (1 if whole else PREFIX_WEIGHT)
+                for event_id in ids:
+                    scores[event_id] += weight
+        return scores
+
+    def search(self, text: str, limit=None) -> list[tuple[int, float]]:
+        """(event id, score) of the events with every word of text, best first"""
+        terms = words(text)
+        if len(terms) == 0:
+            return []
+        # the fewest matches first so the intersection shrinks as fast as possible
+        matches = sorted((self._scores(term) for term in dict.fromkeys(terms)), key=len)
+        totals = dict(matches[0])
+        for scores in matches[1:]:
+            totals = {
+                event_id: total + scores[event_id]
+                for event_id, total in totals.items()
+                if event_id in scores
+            }
+        if limit is None:
+            return sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+        return heapq.nsmallest(limit, totals.items(), key=lambda item: (-item[1], item[0]))
+
+
+def _discard(ids, event_id):
+    i = bisect_left(ids, event_id)
+    j = bisect_right(ids, event_id, i)
+    del ids[i:j]
+
+
+class SearchJournal:
+    """
+    The changes to the index on disk, appended to its journal without loading it, for a
+    process that saves an event but never searches. Like SearchIndex for Session._searched.
+    """
+
+    def __init__(self, file, generation, signatures):
+        self.file = file
+        self.generation = generation
+        self.signatures = signatures
+        self.pending = []
+
+    @classmethod
+    def open(cls, identity, file=SEARCH_INDEX_LOCATION):
+        """The journal of the index in file, None when there's none (for identity)"""
+        try:
+            with open(file, "rb") as f:
+                header = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+            return None
+        if not _matches(header, identity):
+            return None
+        signatures = dict(header["signatures"])
+        for kind, _, _, signature in _journal(file, header["generation"]):
+            signatures["events" if kind == "event" else "projects"] = signature
+        return cls(file, header["generation"], signatures)
+
+    def is_current(self, table, signature):
+        return signature is not None and self.signatures.get(table) == signature
+
+    def set_event(self, event_id, event: EventDefinition | None, signature):
+        self._record(_event_record(event_id, event, signature))
+
+    def set_project(self, projects: ProjectTable, project_id, signature):
+        project = projects.get_project(project_id)
+        self._record(_project_record(project_id, project, signature))
+
+    def build_events(self, events: EventTable, signature):
+        self._stale()
+
+    def build_names(self, projects: ProjectTable, signature):
+        self._stale()
+
+    def _record(self, record):
+        if self.pending is not None:
+            self.pending.append(record)
+            self.signatures["events" if record[0] == "event" else "projects"] = record[-1]
+
+    def _stale(self):
+        # nothing is written, the index on disk is then behind the tables and the next
+        # search builds it again
+        self.pending = None
+        self.signatures = {}
+
+    def save(self):
+        if self.pending is not None:
+            _append(self.file, self.generation, self.pending)
+            self.pending = []
+
+
+def _matches(header, identity):
+    return (
+        isinstance(header, dict)
+        and header.get("version") == INDEX_VERSION
+        and header.get("identity") == identity
+    )
+
+
+def _event_record(event_id, event, signature):
+    value = None if event is None else [event.project_id, event.task_id, event.description]
+    return ["event", event_id, value, signature]
+
+
+def _project_record(project_id, project, signature):
+    value = None
+    if project is not None:
+        value = [project.name, [[id, task.name] for id, task in project.list_tasks()]]
+    return ["project", project_id, value, signature]
+
+
+def _append(file, generation, records):
+    if len(records) == 0:
+        return
+    data = "".join(json.dumps([generation, *record]) + "\n" for record in records).encode()
+    with open(f"{file}.journal", "ab+") as f:
+        # start on a fresh line if a previous append was cut short
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                data = b"\n" + data
+        f.write(data)
+
+
+def _journal(file, generation):
+    """The records of the journal of file appended to generation"""
+    try:
+        with open(f"{file}.journal", "rb") as f:
+            lines = f.readlines()
+    except OSError:
+        return
+    for line in lines:
+        try:
+            found, kind, key, value, signature = json.loads(line)
+        except (ValueError, TypeError):
+            # partial line from a crash mid append
+            continue
+        if found == generation:
+            yield kind, key, value, _tuples(signature)
+
+
+def _tuples(value):
+    """A signature read back from json, its lists being the tuples they were"""
+    if isinstance(value, list):
+        return tuple(_tuples(item) for item in value)
+    return value
@@ -0,0 +1,376 @@
+from tim.project import ProjectTable, Project, Task
+from tim.event import EventTable, EventDefinition, EventID, EventEmpty
+from tim.time import TimeSet, TimeFloat, local_tz
+from tim.tim import Tim
+from tim.fileio import atomic_write
+
+from array import array
+from datetime import datetime
+from itertools import accumulate
+import gc
+import io
+import json
+import marshal
+import pickle
+import struct
+import sys
+
+"""
+The on disk format of the tables and logs.
+
+Objects are turned into documents of plain values
+
+    {"kind": "projects" | "events" | "tim", "version": n, "data": ...}
+
+which are written either as MAGIC followed by the document in the binary encoding below
+(compact and fast to read) or as json for looking at/debugging. Nothing refers to a module or
+class so moving the code around doesn't break old files, and a document from an older schema
+version is brought up to date through MIGRATIONS when it is read.
+
+The binary encoding is a tag byte per value followed by its contents, little endian:
+
+    N F T                None, False, True
+    I q / D d            an int / a float
+    S I bytes            a str as its utf-8
+    L I values           a list of that many values
+    M I (str value)*     a dict with str keys
+    A I q*               a list of ints, as one array
+    Z I I* I bytes       a list of strs, their lengths in characters then all of them as one
+    R I I columns        a list of rows (lists of the same length), column by column
+
+The columns are what make the tables quick to read, 50k events are four bulk conversions
+rather than 200k values. Reading checks every length against what's there, so a damaged file
+is a ValueError and never anything else.
+
+Files written before this are pickles (or marshal for a while). They are only read by
+`tim migrate` (see FileStorage.legacy) to rewrite them, and only tim's own classes (and the
+datetimes in them) are unpickled.
+"""
+
+MAGIC = b"TIM\x01"
+# the binary format of before, marshal
+MARSHAL_MAGIC = b"TIM\x00"
+SCHEMA_VERSION = 1
+FORMATS = ["binary", "json"]
+
+_COUNT = struct.Struct("<I")
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+# what a legacy pickle may contain
+LEGACY_CLASSES = {
+    ("tim.project", "ProjectTable"),
+    ("tim.project", "Project"),
+    ("tim.project", "Task"),
+    ("tim.event", "EventTable"),
+    ("tim.event", "EventDefinition"),
+    ("tim.event", "EventID"),
+    ("tim.event", "EventEmpty"),
+    ("tim.tim", "Tim"),
+    ("tim.time", "TimeSet"),
+    ("tim.time", "TimeFloat"),
+    ("datetime", "datetime"),
+    ("datetime", "timezone"),
+    ("datetime", "timedelta"),
+    ("dateutil.tz.tz", "tzlocal"),
+    ("dateutil.tz.tz", "tzutc"),
+    ("dateutil.tz.tz", "tzoffset"),
+}
+
+
+class LegacyError(ValueError):
+    """A file written by an older version of tim, which only tim migrate reads"""
+
+
+# kind -> {version: function upgrading the data of that version to the next one}
+MIGRATIONS = {
+    "projects": {},
+    "events": {},
+    "tim": {},
+}
+
+
+def to_document(obj):
+    if isinstance(obj, ProjectTable):
+        kind = "projects"
+        data = [
+            [project.id, project.name, [[task.id, task.name] for task in project.tasks.values()]]
+            for project in obj.table.values()
+        ]
+    elif isinstance(obj, EventTable):
+        kind = "events"
+        data = {
+            "last_key": obj.last_key,
+            "events": [
+                [event_id, event.project_id, event.task_id, event.description]
+                for event_id, event in obj.table.items()
+            ],
+        }
+    elif isinstance(obj, Tim):
+        kind = "tim"
+        data = {
+            "start_date": obj.start_date.isoformat(),
+            # timestamps, None being the floating time
+            "times": [
+                time.time.timestamp() if isinstance(time, TimeSet) else None
+                for time in obj.times
+            ],
+            # ids, None being empty
+            "events": [None if event.is_empty() else event.id for event in obj.events],
+        }
+    else:
+        raise TypeError(f"Can't serialize {type(obj).__name__}.")
+    return {"kind": kind, "version": SCHEMA_VERSION, "data": data}
+
+
+def from_document(document):
+    kind = document["kind"]
+    data = migrate(kind, document["version"], document["data"])
+    if kind == "projects":
+        # built as whole dicts so the name indexes are built in one go
+        return ProjectTable(
+            {
+                project_id: Project(
+                    project_id,
+                    name,
+                    {task_id: Task(task_id, task_name) for task_id, task_name in tasks},
+                )
+                for project_id, name, tasks in data
+            }
+        )
+    elif kind == "events":
+        events = EventTable(
+            {
+                event_id: EventDefinition(project_id, task_id, description)
+                for event_id, project_id, task_id, description in data["events"]
+            }
+        )
+        events.last_key = data["last_key"]
+        return events
+    elif kind == "tim":
+        tz = local_tz()
+        times = [
+            TimeFloat() if time is None else TimeSet(datetime.fromtimestamp(time, tz))
+            for time in data["times"]
+        ]
+        events = [EventEmpty() if id is None else EventID(id) for id in data["events"]]
+        return Tim(times, events, datetime.fromisoformat(data["start_date"]))
+    raise ValueError(f"Unknown kind of document {kind}.")
+
+
+def migrate(kind, version, data):
+    if version > SCHEMA_VERSION:
+        raise ValueError(
+            f"The {kind} were written by a newer version of tim (schema {version})."
+        )
+    while version < SCHEMA_VERSION:
+        data = MIGRATIONS[kind][version](data)
+        version += 1
+    return data
+
+
+def _ints(values) -> bytes:
+    ints = array("q", values)
+    if sys.byteorder == "big":
+        ints.byteswap()
+    return ints.tobytes()
+
+
+def _encode(value, out: list):
+    kind = type(value)
+    if value is None:
+        out.append(b"N")
+    elif kind is bool:
+        out.append(b"T" if value else b"F")
+    elif kind is int:
+        out += [b"I", _INT.pack(value)]
+    elif kind is float:
+        out += [b"D", _FLOAT.pack(value)]
+    elif kind is str:
+        data = value.encode()
+        out += [b"S", _COUNT.pack(len(data)), data]
+    elif kind is dict:
+        out += [b"M", _COUNT.pack(len(value))]
+        for key, item in value.items():
+            if type(key) is not str:
+                raise TypeError(f"Can't encode the dict key {key!r}, only strs.")
+            _encode(key, out)
+            _encode(item, out)
+    elif kind is list or kind is tuple:
+        count = _COUNT.pack(len(value))
+        if len(value) == 0:
+            out += [b"L", count]
+        elif all(type(item) is int for item in value):
+            out += [b"A", count, _ints(value)]
+        elif all(type(item) is str for item in value):
+            data = "".join(value).encode()
+            out += [b"Z", count, _ints(map(len, value)), _COUNT.pack(len(data)), data]
+        elif (
+            all(type(item) is list for item in value)
+            and len(value[0]) > 0
+            and all(len(item) == len(value[0]) for item in value)
+        ):
+            out += [b"R", count, _COUNT.pack(len(value[0]))]
+            for column in zip(*value):
+                _encode(list(column), out)
+        else:
+            out += [b"L", count]
+            for item in value:
+                _encode(item, out)
+    else:
+        raise TypeError(f"Can't encode {kind.__name__}.")
+
+
+def encode(document) -> bytes:
+    out = [MAGIC]
+    try:
+        _encode(document, out)
+    except (struct.error, OverflowError) as e:
+        raise ValueError(f"Can't encode the document: {e}") from None
+    return b"".join(out)
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def take(self, size):
+        end = self.position + size
+        if size < 0 or end > len(self.data):
+            raise ValueError("The file is cut short.")
+        part = self.data[self.position : end]
+        self.position = end
+        return part
+
+    def count(self):
+        return _COUNT.unpack(self.take(_COUNT.size))[0]
+
+    def ints(self, count):
+        ints = array("q")
+        ints.frombytes(self.take(count * ints.itemsize))
+        if sys.byteorder == "big":
+            ints.byteswap()
+        return ints.tolist()
+
+    def value(self):
+        tag = self.take(1)
+        if tag == b"N":
+            return None
+        elif tag == b"F":
+            return False
+        elif tag == b"T":
+            return True
+        elif tag == b"I":
+            return _INT.unpack(self.take(_INT.size))[0]
+        elif tag == b"D":
+            return _FLOAT.unpack(self.take(_FLOAT.size))[0]
+        elif tag == b"S":
+            return str(self.take(self.count()), "utf-8")
+        elif tag == b"L":
+            return [self.value() for _ in range(self.count())]
+        elif tag == b"M":
+            document = {}
+            for _ in range(self.count()):
+                key = self.value()
+                if type(key) is not str:
+                    raise ValueError("A dict key that isn't a str.")
+                document[key] = self.value()
+            return document
+        elif tag == b"A":
+            return self.ints(self.count())
+        elif tag == b"Z":
+            lengths = self.ints(self.count())
+            text = str(self.take(self.count()), "utf-8")
+            ends = list(accumulate(lengths))
+            if any(length < 0 for length in lengths) or (ends[-1] if ends else 0) != len(text):
+                raise ValueError("The lengths of the strs don't add up.")
+            return [text[end - length : end] for end, length in zip(ends, lengths)]
+        elif tag == b"R":
+            rows, width = self.count(), self.count()
+            columns = [self.value() for _ in range(width)]
+            if any(type(column) is not list or len(column) != rows for column in columns):
+                raise ValueError("The columns of the rows don't line up.")
+            return list(map(list, zip(*columns)))
+        raise ValueError(f"Unknown tag {tag!r}.")
+
+
+def decode(data: bytes):
+    """The document of the binary encoding of data (after MAGIC), ValueError when it's damaged"""
+    reader = _Reader(memoryview(data)[len(MAGIC) :])
+    try:
+        document = reader.value()
+    except (struct.error, UnicodeDecodeError, RecursionError) as e:
+        raise ValueError(f"The file is damaged: {e}") from None
+    if reader.position != len(reader.data):
+        raise ValueError("The file has something after the document.")
+    return document
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) not in LEGACY_CLASSES:
+            raise pickle.UnpicklingError(f"{module}.{name} isn't something tim pickled.")
+        return super().find_class(module, name)
+
+
+def detect(data: bytes):
+    if data.startswith(MAGIC):
+        return "binary"
+    elif data.lstrip()[:1] == b"{":
+        return "json"
+    elif data.startswith(MARSHAL_MAGIC):
+        return "marshal"
+    elif data[:1] == b"\x80":
+        return "pickle"
+    raise ValueError("Unrecognized file format.")
+
+
+def dumps(obj, format="binary"):
+    document = to_document(obj)
+    if format == "binary":
+        return encode(document)
+    elif format == "json":
+        return json.dumps(document, indent=1).encode()
+    raise ValueError(f"Unknown format {format}, expected one of {FORMATS}.")
+
+
+def loads(data: bytes, legacy=False):
+    """
+    The object of data. The pickles (and marshal) of older versions are only read with legacy,
+    i.e. by tim migrate, they're refused with a LegacyError otherwise.
+    """
+    format = detect(data)
+    if format in FORMATS:
+        # nothing read makes cycles, and the collections run every few hundred objects
+        # made otherwise, which is most of the time of reading a big table
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            document = decode(data) if format == "binary" else json.loads(data)
+            return from_document(document)
+        finally:
+            if enabled:
+                gc.enable()
+    elif not legacy:
+        raise LegacyError(f"Written by an older version of tim ({format}), run tim migrate.")
+    elif format == "marshal":
+        return from_document(marshal.loads(data[len(MARSHAL_MAGIC) :]))
+    return _LegacyUnpickler(io.BytesIO(data)).load()
+
+
+def load(path, legacy=False):
+    with open(path, "rb") as f:
+        try:
+            return loads(f.read(), legacy)
+        except ValueError as e:
+            raise type(e)(f"{path}: {e}") from None
+
+
+def dump(obj, path, format="binary"):
+    # written next to it and renamed into place so nobody ever reads half a file
+    atomic_write(path, dumps(obj, format))
+
+
+def file_format(path):
+    with open(path, "rb") as f:
+        return detect(f.read(len(MAGIC)))
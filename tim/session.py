@@ -0,0 +1,303 @@
+from tim.render import RenderCache
+from tim.storage import Storage
+from tim.tim import TimManager
+from tim.trace import span
+
+from contextlib import contextmanager
+
+
+class Session:
+    """
+    The tables and logs for running commands against, loaded from the storage the
+    first time they are used and kept around so several commands can share them.
+    """
+
+    def __init__(self, storage: Storage):
+        self.storage = storage
+        self._projects = None
+        self._events = None
+        self._logs = None
+        self._render = None
+        self._intervals = None
+        self._search = None
+        # the saves held back by batch, None outside of one
+        self._batch = None
+        # what the storage looked like when each part was loaded/saved
+        self._signatures = {}
+
+    @property
+    def projects(self):
+        if self._projects is None:
+            self._mark("projects")
+            with span("load projects"):
+                self._projects = self.storage.load_projects()
+        return self._projects
+
+    @property
+    def events(self):
+        if self._events is None:
+            self._mark("events")
+            with span("load events"):
+                self._events = self.storage.load_events()
+        return self._events
+
+    @property
+    def logs(self):
+        if self._logs is None:
+            self._mark("logs")
+            with span("index logs"):
+                self._logs = TimManager.load(storage=self.storage)
+        return self._logs
+
+    @property
+    def render(self):
+        """The RenderCache of the current tables, shared by everything showing events"""
+        projects, events = self.projects, self.events
+        if (
+            self._render is None
+            or self._render.projects is not projects
+            or self._render.events is not events
+        ):
+            self._render = RenderCache(projects, events)
+        return self._render
+
+    @property
+    def intervals(self):
+        """The IntervalIndex of every log, brought up to date with the storage"""
+        if self._intervals is None:
+            from tim.intervals import IntervalIndex
+
+            with span("load interval index"):
+                self._intervals = IntervalIndex.load(self.storage.identity())
+        with span("refresh interval index"):
+            self._intervals.refresh(self.storage)
+        return self._intervals
+
+    @property
+    def search(self):
+        """The SearchIndex of the events, brought up to date with the storage"""
+        index = self._search_index()
+        if not index.is_current("events", self.storage.table_signature("events")):
+            with span("index events"):
+                if self._events is not None and self._stale("events"):
+                    self._events = None
+                index.build_events(self.events, self._expected("events"))
+        if not index.is_current("projects", self.storage.table_signature("projects")):
+            with span("index names"):
+                if self._projects is not None and self._stale("projects"):
+                    self._projects = None
+                index.build_names(self.projects, self._expected("projects"))
+        return index
+
+    def _search_index(self):
+        if self._search is None:
+            from tim.search import SearchIndex
+
+            with span("load search index"):
+                self._search = SearchIndex.load(self.storage.identity())
+        return self._search
+
+    def _searched(self, table, expected, update):
+        """
+        Keep the search index in step with a save of table, when it was up to date with
+        what was saved over. Otherwise whatever changed meanwhile is caught up on by the next
+        search, as is everything when nobody has searched yet.
+        """
+        index = self._search
+        if index is None:
+            from tim.search import SearchJournal
+
+            # only appended to, loading all of it for one change costs more than the save
+            index = SearchJournal.open(self.storage.identity())
+        if index is None or not index.is_current(table, expected):
+            return
+        update(index, self._signatures[table])
+        index.save()
+
+    def _mark(self, name):
+        self._signatures[name] = self.storage.table_signature(name)
+
+    def signature(self, name):
+        """What the table or log name looked like in the storage when last loaded/saved"""
+        return self._signatures.get(name)
+
+    def _expected(self, name):
+        # what it looked like when it was loaded, saving raises StaleError if that's changed
+        return self._signatures.get(name)
+
+    def _saved(self, name, signature):
+        # taken by the storage during the save, someone saving right after isn't mistaken for us
+        self._signatures[name] = signature
+
+    def _save(self, table, name, save, search=None, after=None):
+        """
+        save(expected) saving table, returning its new signature. search updates the search
+        index (see _searched) and after is called once the new signature is known. In a
+        batch it is held back until the end of it.
+        """
+        if self._batch is not None:
+            self._batch.append((table, name, save, search, after))
+            return
+        expected = self._expected(table)
+        with span(name):
+            self._saved(table, save(expected))
+        if search is not None:
+            self._searched(table, expected, search)
+        if after is not None:
+            after()
+
+    @contextmanager
+    def batch(self):
+        """
+        Hold back the saves of the block and make them at the end, in one transaction of the
+        storage so either all of them happen or, when anything fails, none of them
+        """
+        if self._batch is not None:
+            yield
+            return
+        self._batch = []
+        try:
+            yield
+            saves = self._batch
+        except BaseException:
+            # the tables have changes that aren't going to be saved
+            self.reset()
+            raise
+        finally:
+            self._batch = None
+        self._flush(saves)
+
+    def _flush(self, saves):
+        tables = list(dict.fromkeys(table for table, *_ in saves))
+        before = {table: self._expected(table) for table in tables}
+        try:
+            with span("save batch"), self.storage.transaction(tables) as signatures:
+                for table, name, save, _, _ in saves:
+                    with span(name):
+                        self._saved(table, save(self._expected(table)))
+        except BaseException:
+            self.reset()
+            raise
+        self._signatures.update(signatures)
+        for table in tables:
+            searches = [save[3] for save in saves if save[0] == table and save[3] is not None]
+            if len(searches) > 0:
+                self._searched(
+                    table,
+                    before[table],
+                    lambda index, signature, searches=searches: [
+                        search(index, signature) for search in searches
+                    ],
+                )
+        for *_, after in saves:
+            if after is not None:
+                after()
+
+    def save_project(self, project_id):
+        self._save(
+            "projects",
+            "save project",
+            lambda expected: self.storage.save_project(self.projects, project_id, expected),
+            lambda index, signature: index.set_project(self.projects, project_id, signature),
+        )
+
+    def save_task(self, project_id, task_id):
+        self._save(
+            "projects",
+            "save task",
+            lambda expected: self.storage.save_task(
+                self.projects, project_id, task_id, expected
+            ),
+            lambda index, signature: index.set_project(self.projects, project_id, signature),
+        )
+
+    def save_projects(self):
+        self._save(
+            "projects",
+            "save projects",
+            lambda expected: self.storage.save_projects(self.projects, expected),
+            lambda index, signature: index.build_names(self.projects, signature),
+        )
+
+    def save_event(self, event_id):
+        self._save(
+            "events",
+            "save event",
+            lambda expected: self.storage.save_event(self.events, event_id, expected),
+            lambda index, signature: index.set_event(
+                event_id, self.events.get_event(event_id), signature
+            ),
+        )
+
+    def save_events(self):
+        self._save(
+            "events",
+            "save events",
+            lambda expected: self.storage.save_events(self.events, expected),
+            lambda index, signature: index.build_events(self.events, signature),
+        )
+
+    def save_log(self, log, positions=None):
+        key = log.start_date.strftime("%Y-%m-%d")
+
+        def saved():
+            self._mark("logs")
+            if self._intervals is not None:
+                from tim.intervals import day_intervals
+
+                self._intervals.set_day(key, self._signatures[key], day_intervals(log))
+
+        self._save(
+            key,
+            f"save log {key}",
+            lambda expected: self.storage.save_log(log, positions, expected),
+            after=saved,
+        )
+
+    def delete_log(self, key):
+        if not self.logs.forget(key):
+            return
+        self._save(
+            key,
+            f"delete log {key}",
+            lambda expected: self.storage.delete_log(key),
+            after=lambda: self._mark("logs"),
+        )
+
+    def reset(self):
+        """Drop everything, e.g. after a command failed half way through changing it"""
+        self._projects = None
+        self._events = None
+        self._logs = None
+        self._signatures = {}
+
+    def refresh(self):
+        """Forget anything that was changed in the storage by someone else"""
+        if self._projects is not None and self._stale("projects"):
+            self._projects = None
+        if self._events is not None and self._stale("events"):
+            self._events = None
+        if self._logs is None:
+            return
+        if self._stale("logs"):
+            self._logs = None
+            return
+        for key in list(self._logs.logs):
+            signature = self.storage.log_signature(key)
+            if signature is None or signature != self._signatures.get(key):
+                self._logs.logs.pop(key)
+                self._signatures.pop(key, None)
+
+    def _stale(self, name):
+        signature = self.storage.table_signature(name)
+        return signature is None or signature != self._signatures.get(name)
+
+    def get_log(self, key):
+        if key not in self.logs.logs:
+            self._signatures[key] = self.storage.log_signature(key)
+        with span(f"load log {key}"):
+            return self.logs.get_log(key)
+
+    def latest(self):
+        dates = self.logs.list_dates()
+        return None if len(dates) == 0 else self.get_log(dates[-1])
@@ -0,0 +1,814 @@
+from tim.constants import (
+    CONFIG_LOCATION,
+    EVENT_TABLE_LOCATION,
+    PROJECT_TABLE_LOCATION,
+    LOG_LOCATION,
+    SQLITE_LOCATION,
+)
+from tim.project import ProjectTable, Project, Task
+from tim.event import EventTable, EventDefinition, EventID, EventEmpty
+from tim.time import dump_time, load_time
+from tim.journal import Journal
+from tim.fileio import Transaction, locked, recover
+from tim.tim import Tim
+from tim.columnar import ColumnarLog
+from tim.archive import Archive
+
+from abc import ABC, abstractmethod
+from configparser import ConfigParser
+from contextlib import ExitStack, contextmanager
+from datetime import date, datetime
+from itertools import groupby
+import os
+
+"""
+Where the projects, events and logs live.
+
+The handlers mutate the in memory objects and then tell the storage which part changed
+(a project, a task, an event or some positions of a log) so backends that can update a
+single row don't have to rewrite everything. The fine grained methods fall back to saving
+the whole object so a backend only has to implement the coarse ones.
+
+The backend is picked in the config file, e.g.
+
+    [storage]
+    backend = sqlite
+    path = /somewhere/tim.sqlite3
+
+or for the files, optionally written as json rather than the binary format
+
+    [storage]
+    backend = file
+    format = json
+
+Every save takes the signature the caller saw when it loaded what it is saving (expected) and
+raises StaleError, without saving, when someone else has saved it since. None skips the check.
+Saves return the signature right after the save (None when unknown) to expect next time.
+
+Saves made inside transaction(names) happen together or not at all, see there.
+"""
+
+TABLES = ["projects", "events", "logs"]
+
+
+class StaleError(Exception):
+    """What was being saved has been changed by someone else since it was loaded"""
+
+
+class Storage(ABC):
+    @abstractmethod
+    def load_projects(self) -> ProjectTable:
+        pass
+
+    @abstractmethod
+    def save_projects(self, projects: ProjectTable, expected=None):
+        pass
+
+    def save_project(self, projects: ProjectTable, project_id: int, expected=None):
+        # also used for deletes, the project just won't be in the table anymore
+        return self.save_projects(projects, expected)
+
+    def save_task(
+        self, projects: ProjectTable, project_id: int, task_id: int, expected=None
+    ):
+        return self.save_project(projects, project_id, expected)
+
+    @abstractmethod
+    def load_events(self) -> EventTable:
+        pass
+
+    @abstractmethod
+    def save_events(self, events: EventTable, expected=None):
+        pass
+
+    def save_event(self, events: EventTable, event_id: int, expected=None):
+        return self.save_events(events, expected)
+
+    @abstractmethod
+    def list_logs(self) -> list[str]:
+        """The date keys (%Y-%m-%d) of every stored log"""
+        pass
+
+    @abstractmethod
+    def load_log(self, key: str) -> Tim | None:
+        pass
+
+    @abstractmethod
+    def save_log(self, log: Tim, positions=None, expected=None):
+        """
+        positions are the indexes of the times/events that changed, None meaning
+        the whole log should be written
+        """
+        pass
+
+    def load_columns(self, key: str) -> ColumnarLog | None:
+        """The log as a ColumnarLog, for backends that can read one without making a Tim"""
+        log = self.load_log(key)
+        return None if log is None else ColumnarLog.from_tim(log)
+
+    def identity(self) -> str:
+        """Distinguishes one store from another, e.g. for caches kept outside of it"""
+        return type(self).__name__
+
+    @abstractmethod
+    def delete_log(self, key: str):
+        pass
+
+    def table_signature(self, name: str):
+        """
+        Like log_signature for "projects", "events" and "logs" (the set of logs),
+        None when the backend can't tell.
+        """
+        return None
+
+    def log_signature(self, key: str):
+        """
+        A value that changes whenever the stored log changes, for caching things
+        derived from it. None when the backend can't tell.
+        """
+        return None
+
+    def signature(self, name: str):
+        """table_signature of one of the TABLES, otherwise log_signature of a log key"""
+        if name in TABLES:
+            return self.table_signature(name)
+        return self.log_signature(name)
+
+    def check(self, name: str, expected):
+        """Raise StaleError when name isn't as expected anymore, see the module docstring"""
+        if expected is not None and self.signature(name) != expected:
+            raise StaleError(f"The {name} changed since they were loaded.")
+
+    @contextmanager
+    def transaction(self, names):
+        """
+        Make the saves of the block all at once at the end, or none of them when it fails.
+        names are those of the TABLES and log keys the block saves, nobody else can save them
+        meanwhile. Yields a dict which gets the signature of each name after the commit.
+        Without support from the backend the saves just happen as they're made.
+        """
+        signatures = {}
+        yield signatures
+        signatures.update({name: self.signature(name) for name in names})
+
+    def reopen(self):
+        """The same store for using from another thread, self when it doesn't hold anything open"""
+        return self
+
+    def watch_paths(self) -> list[str]:
+        """Directories whose changes may be changes to the store, empty when unknown"""
+        return []
+
+    def iter_logs(self, start=None, end=None):
+        """Yield (key, log) for the logs between start and end (inclusive keys)"""
+        for key in sorted(self.list_logs()):
+            if (start is None or key >= start) and (end is None or key <= end):
+                yield key, self.load_log(key)
+
+    def iter_columns(self, start=None, end=None):
+        """iter_logs as ColumnarLogs"""
+        for key, log in self.iter_logs(start, end):
+            yield key, ColumnarLog.from_tim(log)
+
+
+class FileStorage(Storage):
+    """
+    The original layout, a file per table and one per day (still named .pkl
+    from when they were pickles, see tim.serialize for the format).
+
+    Changes to a day are appended to its journal instead of re-pickling it, the
+    journal is folded back into the file once it grows past the threshold.
+
+    Files are replaced atomically and saves hold the file's lock (see tim.fileio), so
+    several tim processes can save at once without losing anything.
+
+    Closed days can be moved into the archive (see tim.archive), they are read from there
+    unless the day has a live file again, e.g. after being edited.
+
+    In a transaction the files are kept in memory and written by a fileio.Transaction at
+    the end, a transaction cut short by a crash is finished when the storage is next opened.
+    """
+
+    def __init__(
+        self,
+        project_file=PROJECT_TABLE_LOCATION,
+        event_file=EVENT_TABLE_LOCATION,
+        log_dir=LOG_LOCATION,
+        format="binary",
+    ):
+        self.project_file = project_file
+        self.event_file = event_file
+        self.log_dir = log_dir
+        # see tim.serialize, json is for debugging
+        self.format = format
+        # whether the pickles of older versions are read, only for tim migrate to rewrite them
+        self.legacy = False
+        self.archive = Archive(log_dir)
+        # path -> what to write there (None to remove it) during a transaction
+        self._pending = None
+        self._after_commit = []
+        recover(self._intent())
+
+    def _intent(self):
+        return os.path.join(self.log_dir, ".transaction")
+
+    def _read(self, path):
+        from tim import serialize
+
+        return serialize.load(path, legacy=self.legacy)
+
+    def _write(self, path, obj):
+        from tim import serialize
+
+        if self._pending is None:
+            serialize.dump(obj, path, self.format)
+        else:
+            self._pending[path] = obj
+
+    def _remove(self, path):
+        if self._pending is None:
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            self._pending[path] = None
+
+    def _path(self, name):
+        if name == "projects":
+            return self.project_file
+        elif name == "events":
+            return self.event_file
+        return self.log_path(name)
+
+    @contextmanager
+    def transaction(self, names):
+        from tim import serialize
+
+        signatures = {}
+        with ExitStack() as stack:
+            for path in sorted({self._path(name) for name in names}):
+                stack.enter_context(locked(path))
+            self._pending = {}
+            self._after_commit = []
+            try:
+                yield signatures
+                pending, after_commit = self._pending, self._after_commit
+            finally:
+                self._pending = None
+                self._after_commit = []
+            transaction = Transaction(self._intent())
+            try:
+                for path, obj in pending.items():
+                    if obj is None:
+                        transaction.remove(path)
+                    else:
+                        transaction.write(path, serialize.dumps(obj, self.format))
+            except BaseException:
+                transaction.abort()
+                raise
+            transaction.commit()
+            for function in after_commit:
+                function()
+            signatures.update({name: self.signature(name) for name in names})
+
+    def load_projects(self):
+        if not os.path.exists(self.project_file):
+            return ProjectTable()
+        return self._read(self.project_file)
+
+    def save_projects(self, projects, expected=None):
+        with locked(self.project_file):
+            self.check("projects", expected)
+            self._write(self.project_file, projects)
+            return self.signature("projects")
+
+    def load_events(self):
+        if not os.path.exists(self.event_file):
+            return EventTable()
+        return self._read(self.event_file)
+
+    def save_events(self, events, expected=None):
+        with locked(self.event_file):
+            self.check("events", expected)
+            self._write(self.event_file, events)
+            return self.signature("events")
+
+    def identity(self):
+        return f"file:{os.path.abspath(self.log_dir)}"
+
+    def log_path(self, key):
+        return os.path.join(self.log_dir, f"{key}.pkl")
+
+    def journal(self, key):
+        return Journal(os.path.join(self.log_dir, f"{key}.journal"))
+
+    def list_logs(self):
+        keys = self.live_logs()
+        live = set(keys)
+        keys.extend(key for key in self.archive.keys() if key not in live)
+        return keys
+
+    def live_logs(self):
+        """The keys of the days with their own file, i.e. not only archived"""
+        from tim.archive import DATA_FILE, INDEX_FILE
+
+        keys = []
+        os.makedirs(self.log_dir, exist_ok=True)
+        for filename in os.listdir(self.log_dir):
+            vals = filename.split(".")
+            if filename.startswith(".") or filename.endswith(".lock"):
+                # temporary files of a save and locks (left behind by a crash), see tim.fileio
+                continue
+            elif filename in (DATA_FILE, INDEX_FILE):
+                continue
+            elif len(vals) == 2 and vals[1] == "journal":
+                continue
+            elif len(vals) == 2 and vals[1] == "pkl":
+                try:
+                    date.fromisoformat(vals[0])
+                except ValueError as e:
+                    print(
+                        f"Expect files to have the format %Y-%m-%d.pkl, unrecognized {filename}."
+                    )
+                    continue
+            else:
+                print(
+                    f"Expect files to have the format %Y-%m-%d.pkl, unrecognized {filename}."
+                )
+                continue
+            keys.append(vals[0])
+        return keys
+
+    def load_log(self, key):
+        path = self.log_path(key)
+        if not os.path.exists(path):
+            return self.archive.load_log(key)
+        # not halfway through someone compacting it
+        with locked(path, shared=True):
+            log = self._read(path)
+            self.journal(key).replay(log)
+        return log
+
+    def load_columns(self, key):
+        if not os.path.exists(self.log_path(key)):
+            return self.archive.columns(key)
+        return super().load_columns(key)
+
+    def iter_columns(self, start=None, end=None):
+        for key in sorted(self.list_logs()):
+            if (start is None or key >= start) and (end is None or key <= end):
+                yield key, self.load_columns(key)
+
+    def archive_logs(self, before):
+        """
+        Move the closed days before the date key into the archive, returning the keys moved
+        and those left out because they are still running
+        """
+        from tim.archive import is_closed
+
+        keys = sorted(key for key in self.live_logs() if key < before)
+        closed = []
+        running = []
+        for key in keys:
+            signature = self.log_signature(key)
+            log = self.load_log(key)
+            if is_closed(log):
+                closed.append((key, signature, log))
+            else:
+                running.append(key)
+        self.archive.add([log for _, _, log in closed])
+        moved = []
+        for key, signature, _ in closed:
+            with locked(self.log_path(key)):
+                # saved meanwhile, the live file stays and is what's read
+                if self.log_signature(key) != signature:
+                    continue
+                os.remove(self.log_path(key))
+                self.journal(key).clear()
+            moved.append(key)
+        return moved, running
+
+    def save_log(self, log, positions=None, expected=None):
+        key = log.start_date.strftime("%Y-%m-%d")
+        journal = self.journal(key)
+        with locked(self.log_path(key)):
+            self.check(key, expected)
+            # in a transaction it's written out whole at the end anyway
+            if (
+                positions is None
+                or self._pending is not None
+                or not os.path.exists(self.log_path(key))
+            ):
+                self.compact(log, journal)
+            else:
+                journal.append(log, positions)
+                if journal.size() > journal.threshold:
+                    self.compact(log, journal)
+            return self.signature(key)
+
+    def compact(self, log, journal):
+        # replaying is idempotent so crashing between these two is harmless
+        self._write(self.log_path(log.start_date.strftime("%Y-%m-%d")), log)
+        self._remove(journal.path)
+
+    def delete_log(self, key):
+        with locked(self.log_path(key)):
+            self._remove(self.log_path(key))
+            self._remove(self.journal(key).path)
+            if self._pending is None:
+                self.archive.remove([key])
+            else:
+                self._after_commit.append(lambda: self.archive.remove([key]))
+
+    def set_aside(self, key):
+        """
+        Move the files of a day that can't be read out of the way (as .<file>.corrupt, which
+        live_logs skips), False when it has none of its own (it's only archived)
+        """
+        moved = False
+        with locked(self.log_path(key)):
+            for path in [self.log_path(key), self.journal(key).path]:
+                if os.path.exists(path):
+                    directory, name = os.path.split(path)
+                    os.replace(path, os.path.join(directory, f".{name}.corrupt"))
+                    moved = True
+        return moved
+
+    def table_signature(self, name):
+        path = {
+            "projects": self.project_file,
+            "events": self.event_file,
+            "logs": self.log_dir,
+        }[name]
+        try:
+            stat = os.stat(path)
+            # the inode changes with every save since they're renamed into place
+            return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return ()
+
+    def watch_paths(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        dirs = [os.path.dirname(self.project_file), os.path.dirname(self.event_file)]
+        return [
+            path for path in dict.fromkeys([self.log_dir] + dirs) if os.path.isdir(path)
+        ]
+
+    def rewrite(self):
+        """
+        Write everything again in the current format, returning how many of the files
+        were still pickles (or marshal), which are only read with legacy set
+        """
+        from tim import serialize
+
+        paths = [self.project_file, self.event_file]
+        # the archive has a format of its own, only the live files are rewritten
+        paths.extend(self.log_path(key) for key in self.live_logs())
+        legacy = sum(
+            1
+            for path in paths
+            if os.path.exists(path)
+            and serialize.file_format(path) in ("pickle", "marshal")
+        )
+        if os.path.exists(self.project_file):
+            self.save_projects(self.load_projects())
+        if os.path.exists(self.event_file):
+            self.save_events(self.load_events())
+        for key in self.live_logs():
+            self.save_log(self.load_log(key))
+        return legacy
+
+    def log_signature(self, key):
+        signature = []
+        for path in (self.log_path(key), self.journal(key).path):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        if signature == [None, None]:
+            return self.archive.signature(key) or (None, None)
+        return tuple(signature)
+
+
+class SqliteStorage(Storage):
+    """
+    Everything in a single sqlite file with a row per project, task, event and log entry.
+
+    Log entries are stored by position, row i holding times[i] and events[i]. The last
+    row has no event since there is always one more time than there are events.
+    A NULL time is the floating (still running) time.
+
+    A transaction is a single sqlite transaction around every save made in it.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS projects (id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+    CREATE TABLE IF NOT EXISTS tasks (
+        project_id INTEGER NOT NULL,
+        id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        PRIMARY KEY (project_id, id)
+    );
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY,
+        project_id INTEGER NOT NULL,
+        task_id INTEGER NOT NULL,
+        description TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS events_project_task ON events (project_id, task_id);
+    CREATE INDEX IF NOT EXISTS events_task ON events (task_id);
+    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+    CREATE TABLE IF NOT EXISTS logs (date TEXT PRIMARY KEY, start_date TEXT NOT NULL);
+    CREATE TABLE IF NOT EXISTS entries (
+        date TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        time TEXT,
+        has_event INTEGER NOT NULL,
+        event_id INTEGER,
+        PRIMARY KEY (date, position)
+    );
+    CREATE INDEX IF NOT EXISTS entries_event ON entries (event_id);
+    CREATE TABLE IF NOT EXISTS log_versions (date TEXT PRIMARY KEY, version INTEGER NOT NULL);
+    """
+
+    def __init__(self, path=SQLITE_LOCATION):
+        import sqlite3
+
+        self.path = path
+        self._in_transaction = False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(self.SCHEMA)
+
+    def identity(self):
+        return f"sqlite:{os.path.abspath(self.path)}"
+
+    def load_projects(self):
+        projects = ProjectTable()
+        for project_id, name in self.conn.execute("SELECT id, name FROM projects"):
+            projects.add_project(Project(project_id, name))
+        for project_id, task_id, name in self.conn.execute(
+            "SELECT project_id, id, name FROM tasks"
+        ):
+            project = projects.get_project(project_id)
+            if project is not None:
+                project.add_task(Task(task_id, name))
+        return projects
+
+    @contextmanager
+    def _writing(self, name, expected):
+        if self._in_transaction:
+            # already holding the write lock, committed at the end of the transaction
+            self.check(name, expected)
+            yield
+            return
+        with self.conn:
+            # taking the write lock first so nothing can change between the check and the save
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.check(name, expected)
+            yield
+
+    @contextmanager
+    def transaction(self, names):
+        signatures = {}
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._in_transaction = True
+            try:
+                yield signatures
+            finally:
+                self._in_transaction = False
+            signatures.update({name: self.signature(name) for name in names})
+
+    def _bump_table(self, name):
+        self.conn.execute(
+            "INSERT INTO meta VALUES (?, 1) "
+            "ON CONFLICT (key) DO UPDATE SET value = value + 1",
+            (f"{name}_version",),
+        )
+
+    def save_projects(self, projects, expected=None):
+        with self._writing("projects", expected):
+            self._bump_table("projects")
+            self.conn.execute("DELETE FROM projects")
+            self.conn.execute("DELETE FROM tasks")
+            for project_id, _ in projects.list_projects():
+                self._write_project(projects, project_id)
+            return self.signature("projects")
+
+    def save_project(self, projects, project_id, expected=None):
+        with self._writing("projects", expected):
+            self._bump_table("projects")
+            self._write_project(projects, project_id)
+            return self.signature("projects")
+
+    def save_task(self, projects, project_id, task_id, expected=None):
+        task = projects.get_task(project_id, task_id)
+        with self._writing("projects", expected):
+            self._bump_table("projects")
+            if task is None:
+                self.conn.execute(
+                    "DELETE FROM tasks WHERE project_id = ? AND id = ?",
+                    (project_id, task_id),
+                )
+            else:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO tasks VALUES (?, ?, ?)",
+                    (project_id, task.id, task.name),
+                )
+            return self.signature("projects")
+
+    def _write_project(self, projects, project_id):
+        project = projects.get_project(project_id)
+        self.conn.execute("DELETE FROM tasks WHERE project_id = ?", (project_id,))
+        if project is None:
+            self.conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO projects VALUES (?, ?)", (project.id, project.name)
+        )
+        self.conn.executemany(
+            "INSERT INTO tasks VALUES (?, ?, ?)",
+            [(project.id, task.id, task.name) for _, task in project.list_tasks()],
+        )
+
+    def load_events(self):
+        events = EventTable()
+        for event_id, project_id, task_id, description in self.conn.execute(
+            "SELECT id, project_id, task_id, description FROM events"
+        ):
+            events.table[event_id] = EventDefinition(project_id, task_id, description)
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'last_event_key'"
+        ).fetchone()
+        events.last_key = row[0] if row is not None else max(events.table, default=0)
+        return events
+
+    def save_events(self, events, expected=None):
+        with self._writing("events", expected):
+            self._bump_table("events")
+            self.conn.execute("DELETE FROM events")
+            self.conn.executemany(
+                "INSERT INTO events VALUES (?, ?, ?, ?)",
+                [
+                    (event_id, e.project_id, e.task_id, e.description)
+                    for event_id, e in events.list_events()
+                ],
+            )
+            self._write_last_key(events)
+            return self.signature("events")
+
+    def save_event(self, events, event_id, expected=None):
+        event = events.get_event(event_id)
+        with self._writing("events", expected):
+            self._bump_table("events")
+            if event is None:
+                self.conn.execute("DELETE FROM events WHERE id = ?", (event_id,))
+            else:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?)",
+                    (event_id, event.project_id, event.task_id, event.description),
+                )
+            self._write_last_key(events)
+            return self.signature("events")
+
+    def _write_last_key(self, events):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('last_event_key', ?)",
+            (events.last_key,),
+        )
+
+    def list_logs(self):
+        return [key for (key,) in self.conn.execute("SELECT date FROM logs")]
+
+    def load_log(self, key):
+        row = self.conn.execute(
+            "SELECT start_date FROM logs WHERE date = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        entries = self.conn.execute(
+            "SELECT time, has_event, event_id FROM entries WHERE date = ? ORDER BY position",
+            (key,),
+        )
+        return self._build_log(row[0], entries)
+
+    def iter_logs(self, start=None, end=None):
+        start = "0000-00-00" if start is None else start
+        end = "9999-99-99" if end is None else end
+        starts = dict(
+            self.conn.execute(
+                "SELECT date, start_date FROM logs WHERE date BETWEEN ? AND ?",
+                (start, end),
+            )
+        )
+        entries = self.conn.execute(
+            "SELECT date, time, has_event, event_id FROM entries "
+            "WHERE date BETWEEN ? AND ? ORDER BY date, position",
+            (start, end),
+        )
+        for key, rows in groupby(entries, key=lambda row: row[0]):
+            yield key, self._build_log(starts[key], (row[1:] for row in rows))
+
+    def _build_log(self, start_date, entries):
+        times = []
+        events = []
+        for time, has_event, event_id in entries:
+            times.append(load_time(time))
+            if has_event:
+                events.append(EventEmpty() if event_id is None else EventID(event_id))
+        return Tim(times, events, datetime.fromisoformat(start_date))
+
+    def save_log(self, log, positions=None, expected=None):
+        key = log.start_date.strftime("%Y-%m-%d")
+        if positions is None:
+            positions = range(len(log.times))
+        with self._writing(key, expected):
+            self.conn.execute(
+                "INSERT OR REPLACE INTO logs VALUES (?, ?)",
+                (key, log.start_date.isoformat()),
+            )
+            self.conn.execute(
+                "DELETE FROM entries WHERE date = ? AND position >= ?",
+                (key, len(log.times)),
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                [self._entry(key, log, i) for i in positions],
+            )
+            self._bump_version(key)
+            return self.signature(key)
+
+    def _bump_version(self, key):
+        self.conn.execute(
+            "INSERT INTO log_versions VALUES (?, 1) "
+            "ON CONFLICT (date) DO UPDATE SET version = version + 1",
+            (key,),
+        )
+
+    def _entry(self, key, log, i):
+        time = dump_time(log.times[i])
+        if i < len(log.events):
+            event = log.events[i]
+            return (key, i, time, 1, None if event.is_empty() else event.id)
+        return (key, i, time, 0, None)
+
+    def delete_log(self, key):
+        with self._writing(key, None):
+            self.conn.execute("DELETE FROM entries WHERE date = ?", (key,))
+            self.conn.execute("DELETE FROM logs WHERE date = ?", (key,))
+            # kept rather than deleted so a new log for the date can't reuse a version
+            self._bump_version(key)
+
+    def table_signature(self, name):
+        if name == "logs":
+            # changes whenever another connection commits, our own commits don't matter
+            # since whoever holds this connection already has those changes
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+        # bumped by every save of the table, see _bump_table
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (f"{name}_version",)
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    def reopen(self):
+        # a connection can only be used from the thread that made it
+        return type(self)(self.path)
+
+    # pickled as just the path (e.g. for tim.parallel), connecting again on the other side
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def watch_paths(self):
+        # the database and its journal/wal files
+        return [os.path.dirname(os.path.abspath(self.path))]
+
+    def log_signature(self, key):
+        row = self.conn.execute(
+            "SELECT version FROM log_versions WHERE date = ?", (key,)
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+
+def open_storage(config=CONFIG_LOCATION):
+    """Storage backend selected in the config file, defaulting to the files"""
+    parser = ConfigParser()
+    parser.read(config)
+    backend = parser.get("storage", "backend", fallback="file")
+    if backend == "sqlite":
+        return SqliteStorage(parser.get("storage", "path", fallback=SQLITE_LOCATION))
+    elif backend == "file":
+        return FileStorage(format=parser.get("storage", "format", fallback="binary"))
+    else:
+        raise ValueError(f"Unknown storage backend {backend}, expected file or sqlite.")
+
+
+def copy_storage(source: Storage, target: Storage):
+    """Copy everything from one backend to another, e.g. when switching to sqlite"""
+    target.save_projects(source.load_projects())
+    target.save_events(source.load_events())
+    for _, log in source.iter_logs():
+        target.save_log(log)
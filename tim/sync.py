@@ -0,0 +1,810 @@
+from tim.constants import SYNC_BASES_LOCATION, SYNC_STATE_LOCATION
+from tim.event import EventDefinition
+from tim.fileio import atomic_write, locked
+from tim.project import Project, Task
+from tim.storage import StaleError
+from tim import serialize
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import hashlib
+import io
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tarfile
+
+"""
+Keeping the logs and tables of several machines in step through a sync directory that all of
+them can reach, either a local path (a mounted or shared drive) or host:path over ssh.
+
+    tim sync ~/Dropbox/tim
+    tim sync desktop:tim-sync
+
+The sync directory holds objects named by the sha256 of their contents, never changed once
+written, and manifest.json mapping each item to the object it is at:
+
+    day/<date key>        a day, as the json of its serialize document
+    projects/<n>          BUCKET_SIZE project ids' worth of the project and task names
+    events/<n>            BUCKET_SIZE event ids' worth of event definitions
+
+Each machine remembers the manifest as of its last sync with a directory (the base). An item
+that only changed on one side since then is copied over, one that changed on both is merged
+against the base's object: the rows of a table bucket one by one, a day time by time (a time
+with the event after it), so edits of different entries or rows come together. Both changing
+the same entry or row differently is a conflict, which is reported and left as it is on each
+side until it's settled by editing it or by syncing with --prefer.
+
+Event ids are given out on each machine, so two of them adding events between syncs give out
+the same ids. Those added here are given new ids (past any given out anywhere) before the
+sync goes on, along with their entries in the days changed since the last sync.
+
+The digests of the local days and table buckets are kept against the storage's signatures, so
+a sync only reads and sends what changed since the last one, and the manifest is the only
+thing read whole.
+
+TIM_SSH replaces the ssh command (split like a shell would), it is run as
+`$TIM_SSH host command` like ssh and the other side needs a shell with mkdir, cat, mv and tar.
+"""
+
+MANIFEST = "manifest.json"
+OBJECTS = "objects"
+# of the manifest, a newer one is refused
+FORMAT = 1
+# ids of a table per object, so a changed row only sends the rows next to it
+BUCKET_SIZE = 256
+TABLES = ["projects", "events"]
+# objects per ssh command when fetching, well under the limit on the length of a command
+NAMES_PER_COMMAND = 500
+# the event column of a day's last time, which has no event after it
+END = "end"
+# merge_value when both sides changed something differently
+CONFLICT = object()
+
+
+class SyncError(Exception):
+    """The sync directory couldn't be read or written"""
+
+
+def encode(document) -> bytes:
+    # the same document always gives the same bytes, so the same digest
+    return json.dumps(document, sort_keys=True, separators=(",", ":")).encode()
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def object_name(name: str) -> str:
+    return f"{OBJECTS}/{name[:2]}/{name}"
+
+
+def day_object(log) -> bytes:
+    return encode(serialize.to_document(log))
+
+
+def hash_day(storage, key):
+    """digest of the object of a day, see tim.parallel"""
+    return digest(day_object(storage.load_log(key)))
+
+
+def table_rows(table, obj) -> dict:
+    """key -> value of every row of the projects or events, a task being a row of its own"""
+    rows = {}
+    if table == "projects":
+        for project_id, project in obj.list_projects():
+            rows[str(project_id)] = project.name
+            for task_id, task in project.list_tasks():
+                rows[f"{project_id}/{task_id}"] = task.name
+    else:
+        for event_id, event in obj.list_events():
+            rows[str(event_id)] = [event.project_id, event.task_id, event.description]
+    return rows
+
+
+def buckets(table, rows) -> dict:
+    """item -> its rows, a project's tasks going with the project"""
+    grouped = {}
+    for key, value in rows.items():
+        item = f"{table}/{int(key.split('/')[0]) // BUCKET_SIZE}"
+        grouped.setdefault(item, {})[key] = value
+    return grouped
+
+
+def rows_object(rows) -> bytes:
+    return encode({"kind": "rows", "rows": rows})
+
+
+def merge_value(base, local, remote):
+    if local == remote:
+        return local
+    if local == base:
+        return remote
+    if remote == base:
+        return local
+    return CONFLICT
+
+
+def merge_rows(table, base, local, remote):
+    """
+    (merged rows, keys of the conflicting rows) of three versions of a bucket, None values
+    being rows that aren't there. The conflicting ones aren't in merged.
+    """
+    merged = {}
+    conflicts = []
+    for key in sorted(set(base) | set(local) | set(remote)):
+        value = merge_value(base.get(key), local.get(key), remote.get(key))
+        if value is CONFLICT:
+            conflicts.append(key)
+        elif value is not None:
+            merged[key] = value
+    if table == "projects":
+        # a project deleted on one side and given a task on the other is kept
+        for key in list(merged):
+            project = key.split("/")[0]
+            if project not in merged and project not in conflicts:
+                merged[project] = local.get(project) or remote.get(project) or base[project]
+    return merged, conflicts
+
+
+def new_on_both(base, local, remote):
+    """
+    Keys of the rows that both sides added differently since the base, for events that's the
+    same id given out on two machines for different events
+    """
+    return sorted(
+        key
+        for key in set(local) & set(remote)
+        if key not in base and local[key] != remote[key]
+    )
+
+
+def _slots(document):
+    if document is None:
+        return None, []
+    data = serialize.migrate("tim", document["version"], document["data"])
+    times, events = data["times"], data["events"]
+    return data["start_date"], [
+        (time, events[i] if i < len(events) else END) for i, time in enumerate(times)
+    ]
+
+
+def merge_day(base, local, remote):
+    """
+    The document of three versions of a day merged time by time, a time going with the event
+    after it. None when both changed the same time differently, or removed times (the rest
+    don't line up anymore) while the other side changed anything.
+    """
+    base_start, before = _slots(base)
+    local_start, ours = _slots(local)
+    remote_start, theirs = _slots(remote)
+    if local_start != remote_start or len(ours) < len(before) or len(theirs) < len(before):
+        return None
+    merged = []
+    for i in range(max(len(ours), len(theirs))):
+        value = merge_value(
+            before[i] if i < len(before) else None,
+            ours[i] if i < len(ours) else None,
+            theirs[i] if i < len(theirs) else None,
+        )
+        if value is CONFLICT or value is None:
+            return None
+        merged.append(value)
+    # only the last time may be without an event
+    if len(merged) == 0 or merged[-1][1] != END:
+        return None
+    if any(event == END for _, event in merged[:-1]):
+        return None
+    return {
+        "kind": "tim",
+        "version": serialize.SCHEMA_VERSION,
+        "data": {
+            "start_date": local_start,
+            "times": [time for time, _ in merged],
+            "events": [event for _, event in merged[:-1]],
+        },
+    }
+
+
+def _manifest(data: bytes):
+    if len(data.strip()) == 0:
+        return {}
+    manifest = json.loads(data)
+    if manifest.get("format", FORMAT) > FORMAT:
+        raise SyncError("The sync directory was written by a newer version of tim.")
+    return manifest
+
+
+class Directory:
+    """A sync directory on this machine, e.g. on a mounted or shared drive"""
+
+    def __init__(self, path):
+        self.path = os.path.abspath(os.path.expanduser(path))
+
+    def identity(self):
+        return f"dir:{self.path}"
+
+    def __str__(self):
+        return self.path
+
+    def locked(self):
+        return locked(os.path.join(self.path, MANIFEST))
+
+    def read_manifest(self):
+        try:
+            with open(os.path.join(self.path, MANIFEST), "rb") as f:
+                return _manifest(f.read())
+        except FileNotFoundError:
+            return {}
+
+    def write_manifest(self, manifest):
+        atomic_write(os.path.join(self.path, MANIFEST), encode(manifest))
+
+    def fetch(self, names):
+        """name -> contents of the objects, leaving out those that aren't there"""
+        found = {}
+        for name in names:
+            try:
+                with open(os.path.join(self.path, object_name(name)), "rb") as f:
+                    found[name] = f.read()
+            except FileNotFoundError:
+                pass
+        return found
+
+    def store(self, objects):
+        for name, data in objects.items():
+            path = os.path.join(self.path, object_name(name))
+            if not os.path.exists(path):
+                atomic_write(path, data)
+
+
+class Ssh:
+    """A sync directory on another machine, reached by running commands over ssh"""
+
+    def __init__(self, host, path):
+        self.host = host
+        self.path = path
+        self.command = shlex.split(os.environ.get("TIM_SSH", "ssh"))
+
+    def identity(self):
+        return f"ssh:{self.host}:{self.path}"
+
+    def __str__(self):
+        return f"{self.host}:{self.path}"
+
+    def _run(self, script, input=b""):
+        cd = f"mkdir -p {shlex.quote(self.path)} && cd {shlex.quote(self.path)}"
+        try:
+            process = subprocess.run(
+                [*self.command, self.host, f"{cd} && {script}"],
+                input=input,
+                capture_output=True,
+            )
+        except OSError as e:
+            raise SyncError(f"Couldn't run {self.command[0]}: {e}") from None
+        if process.returncode != 0:
+            error = process.stderr.decode(errors="replace").strip()
+            raise SyncError(f"{self}: {error or f'exited with {process.returncode}'}")
+        return process.stdout
+
+    @contextmanager
+    def locked(self):
+        # mkdir either makes it or fails, on any filesystem
+        try:
+            self._run("mkdir .lock")
+        except SyncError:
+            raise SyncError(
+                f"{self} is being synced by someone else (or a sync was interrupted, "
+                "then remove its .lock directory)."
+            ) from None
+        try:
+            yield
+        except BaseException:
+            # what went wrong in the sync is the error to see, not a failed cleanup after it
+            try:
+                self._run("rmdir .lock")
+            except SyncError as e:
+                print(f"Couldn't remove the .lock of {self}: {e}", file=sys.stderr)
+            raise
+        self._run("rmdir .lock")
+
+    def read_manifest(self):
+        return _manifest(self._run(f"if [ -f {MANIFEST} ]; then cat {MANIFEST}; fi"))
+
+    def write_manifest(self, manifest):
+        self._run(f"cat > .{MANIFEST}.tmp && mv .{MANIFEST}.tmp {MANIFEST}", encode(manifest))
+
+    def fetch(self, names):
+        names = sorted(names)
+        found = {}
+        for i in range(0, len(names), NAMES_PER_COMMAND):
+            paths = " ".join(object_name(name) for name in names[i : i + NAMES_PER_COMMAND])
+            # the names are hex digests, nothing to quote
+            data = self._run(
+                f'for f in {paths}; do if [ -f "$f" ]; then echo "$f"; fi; done '
+                "| tar -cf - -T -"
+            )
+            with tarfile.open(fileobj=io.BytesIO(data), mode="r:") as archive:
+                for member in archive.getmembers():
+                    if member.isfile():
+                        found[os.path.basename(member.name)] = archive.extractfile(
+                            member
+                        ).read()
+        return found
+
+    def store(self, objects):
+        if len(objects) == 0:
+            return
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:") as archive:
+            for name, data in objects.items():
+                info = tarfile.TarInfo(object_name(name))
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        self._run("tar -xf -", buffer.getvalue())
+
+
+def open_remote(target: str):
+    """The sync directory of tim sync's argument, host:path (like scp) being over ssh"""
+    host, colon, path = target.partition(":")
+    if colon and len(host) > 1 and "/" not in host and not os.path.exists(target):
+        return Ssh(host, path or ".")
+    return Directory(target)
+
+
+class SyncState:
+    """
+    What this machine knows of its syncs, kept next to its data as json. The digests are a
+    cache (made again when it can't be read), the bases are what the merges go by and are
+    kept in a file of their own.
+    """
+
+    def __init__(self, identity):
+        self.identity = identity
+        # date key -> (log signature, digest)
+        self.days = {}
+        # table -> (table signature, {item: digest}, last event key)
+        self.tables = {}
+        # sync directory identity -> {item: digest} both sides were at after the last sync
+        self.bases = {}
+
+    @classmethod
+    def load(cls, identity, file=SYNC_STATE_LOCATION, bases_file=SYNC_BASES_LOCATION):
+        state = cls(identity)
+        try:
+            with open(file, "rb") as f:
+                document = json.load(f)
+            if document["format"] == FORMAT and document["identity"] == identity:
+                state.days = {
+                    key: (_tuples(signature), name)
+                    for key, (signature, name) in document["days"].items()
+                }
+                state.tables = {
+                    table: (_tuples(signature), hashes, last_key)
+                    for table, (signature, hashes, last_key) in document["tables"].items()
+                }
+        except (OSError, ValueError, KeyError, TypeError):
+            state.days, state.tables = {}, {}
+        bases = load_bases(identity, bases_file)
+        if bases is not None:
+            state.bases = bases
+        return state
+
+    def save(self, file=SYNC_STATE_LOCATION, bases_file=SYNC_BASES_LOCATION):
+        atomic_write(
+            bases_file,
+            json.dumps(
+                {"format": FORMAT, "identity": self.identity, "bases": self.bases},
+                sort_keys=True,
+                indent=1,
+            ).encode(),
+        )
+        atomic_write(
+            file,
+            json.dumps(
+                {
+                    "format": FORMAT,
+                    "identity": self.identity,
+                    "days": self.days,
+                    "tables": self.tables,
+                }
+            ).encode(),
+        )
+
+
+def _tuples(value):
+    """A signature read back from json, its lists being the tuples they were"""
+    if isinstance(value, list):
+        return tuple(_tuples(item) for item in value)
+    return value
+
+
+def load_bases(identity, file=SYNC_BASES_LOCATION):
+    """
+    The bases of SyncState, None when there's no file yet, refusing to go on without them when
+    it can't be read
+    """
+    try:
+        with open(file, "rb") as f:
+            document = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        raise SyncError(
+            f"{file} can't be read ({e}), without it everything that differs from the sync "
+            "directory is a conflict. Move it away to sync as if for the first time."
+        ) from None
+    if document.get("format", FORMAT) > FORMAT:
+        raise SyncError(f"{file} was written by a newer version of tim.")
+    if document.get("identity") != identity:
+        # another store (e.g. after tim migrate), nothing it synced is known here
+        return {}
+    return document["bases"]
+
+
+@dataclass
+class SyncResult:
+    # date keys of the days changed here/in the sync directory
+    received: list = field(default_factory=list)
+    sent: list = field(default_factory=list)
+    # table -> rows changed here/in the sync directory
+    received_rows: dict = field(default_factory=dict)
+    sent_rows: dict = field(default_factory=dict)
+    # descriptions of what conflicted
+    conflicts: list = field(default_factory=list)
+    # (old, new) ids of the events added here that were given new ones
+    renumbered: list = field(default_factory=list)
+
+
+def local_items(session, state: SyncState, jobs=1):
+    """(item -> digest, last event key) of this machine, only hashing what changed"""
+    from tim.parallel import map_days
+
+    storage = session.storage
+    keys = storage.list_logs()
+    signatures = {key: storage.log_signature(key) for key in keys}
+    state.days = {key: state.days[key] for key in keys if key in state.days}
+    stale = [
+        key
+        for key in keys
+        if signatures[key] is None
+        or key not in state.days
+        or state.days[key][0] != signatures[key]
+    ]
+    for key, hashed in map_days(storage, stale, hash_day, jobs=jobs):
+        state.days[key] = (signatures[key], hashed)
+    items = {f"day/{key}": state.days[key][1] for key in keys}
+    last_key = 0
+    for table in TABLES:
+        signature = storage.table_signature(table)
+        cached = state.tables.get(table)
+        if signature is None or cached is None or cached[0] != signature:
+            obj = getattr(session, table)
+            rows = buckets(table, table_rows(table, obj))
+            cached = state.tables[table] = (
+                session.signature(table),
+                {item: digest(rows_object(bucket)) for item, bucket in rows.items()},
+                getattr(obj, "last_key", 0),
+            )
+        items.update(cached[1])
+        last_key = max(last_key, cached[2])
+    return items, last_key
+
+
+class _Sync:
+    """One sync of a session with a sync directory, see sync"""
+
+    def __init__(self, session, remote, state, prefer):
+        self.session = session
+        self.remote = remote
+        self.state = state
+        self.prefer = prefer
+        self.result = SyncResult()
+        # item -> digest here/in the sync directory once it's done
+        self.ours = {}
+        self.theirs = {}
+        # objects to send
+        self.objects = {}
+        # the items that conflicted, their base stays as it was
+        self.conflicted = set()
+        # table -> bucket rows, made when first needed
+        self.rows = {}
+        self.days = {}
+
+    def run(self, jobs):
+        session = self.session
+        manifest = self.remote.read_manifest()
+        self.theirs = dict(manifest.get("items", {}))
+        base = self.state.bases.get(self.remote.identity(), {})
+        self.ours, last_key = local_items(session, self.state, jobs)
+
+        actions = {}
+        for item in sorted(set(self.ours) | set(self.theirs)):
+            ours, theirs, before = self.ours.get(item), self.theirs.get(item), base.get(item)
+            if ours == theirs:
+                continue
+            elif ours == before:
+                actions[item] = "pull"
+            elif theirs == before:
+                actions[item] = "push"
+            else:
+                actions[item] = "merge"
+        wanted = {self.theirs[item] for item in actions if self.theirs.get(item)}
+        wanted |= {base.get(item) for item, action in actions.items() if action == "merge"}
+        objects = self.remote.fetch(name for name in wanted if name is not None)
+        for name, data in objects.items():
+            if digest(data) != name:
+                raise SyncError(f"{object_name(name)} in {self.remote} is corrupt.")
+        # a base that's gone only makes for more conflicts, what's there now can't be missing
+        for item in actions:
+            if self.theirs.get(item) and self.theirs[item] not in objects:
+                name = object_name(self.theirs[item])
+                raise SyncError(f"{name} is missing from {self.remote}.")
+
+        def document(name):
+            return None if name is None or name not in objects else json.loads(objects[name])
+
+        def rows(name):
+            found = document(name)
+            return {} if found is None else found["rows"]
+
+        ours_last_key = last_key
+        last_key = max(last_key, manifest.get("last_event_key", 0))
+        collisions = []
+        for item, action in actions.items():
+            if action == "merge" and item.startswith("events/"):
+                collisions.extend(
+                    new_on_both(
+                        rows(base.get(item)),
+                        self._local_rows("events").get(item, {}),
+                        rows(self.theirs.get(item)),
+                    )
+                )
+        if collisions:
+            self._renumber(collisions, last_key, base)
+            # nothing's sent yet, the sync starts over with the new ids
+            return None
+        with session.batch():
+            for item, action in actions.items():
+                kind, key = item.split("/", 1)
+                theirs = document(self.theirs.get(item))
+                before = document(base.get(item)) if action == "merge" else None
+                if kind == "day":
+                    self._day(item, key, action, before, theirs)
+                else:
+                    self._bucket(item, kind, action, before, theirs)
+            # the ids given out elsewhere aren't given out again here
+            if ours_last_key < last_key and session.events.last_key < last_key:
+                session.events.last_key = last_key
+                if "events" not in self.result.received_rows:
+                    session.save_events()
+
+        self._saved()
+        self.remote.store(self.objects)
+        manifest = {
+            "format": FORMAT,
+            "items": {item: name for item, name in sorted(self.theirs.items()) if name},
+            "last_event_key": last_key,
+        }
+        self.remote.write_manifest(manifest)
+        self.state.bases[self.remote.identity()] = {
+            item: name
+            for item, name in self.ours.items()
+            if name is not None and self.theirs.get(item) == name
+        } | {item: base[item] for item in self.conflicted if item in base}
+        return self.result
+
+    def _renumber(self, keys, last_key, base):
+        """Give the events here new ids after last_key, in the days changed since the base"""
+        session = self.session
+        events = session.events
+        ids = {int(key): last_key + i for i, key in enumerate(keys, 1)}
+        days = [
+            item.split("/", 1)[1]
+            for item, name in self.ours.items()
+            if item.startswith("day/") and name != base.get(item)
+        ]
+        with session.batch():
+            for old, new in ids.items():
+                events.set_event(new, events.get_event(old))
+                events.delete_event(old)
+                session.save_event(old)
+                session.save_event(new)
+            for key in days:
+                log = session.get_log(key)
+                positions = []
+                for i, event in enumerate(log.events):
+                    if not event.is_empty() and event.id in ids:
+                        positions.extend(log.update_event(i, ids[event.id]))
+                if positions:
+                    session.save_log(log, positions)
+        self.result.renumbered.extend(ids.items())
+
+    def _local_day(self, key):
+        """The object of the day here, checking it's what was hashed"""
+        if f"day/{key}" not in self.ours:
+            return None
+        log = self.session.get_log(key)
+        data = day_object(log)
+        if digest(data) != self.ours[f"day/{key}"]:
+            raise StaleError(f"The log {key} changed while syncing.")
+        return json.loads(data)
+
+    def _day(self, item, key, action, before, theirs):
+        ours = self._local_day(key)
+        if action == "pull":
+            merged = theirs
+        elif action == "push":
+            merged = ours
+        else:
+            merged = merge_day(before, ours, theirs) if ours and theirs else None
+            if merged is None and self.prefer is None:
+                self.conflicted.add(item)
+                self.result.conflicts.append(
+                    f"{key}: changed differently on both sides"
+                    if ours and theirs
+                    else f"{key}: deleted on one side and changed on the other"
+                )
+                return
+            if merged is None:
+                merged = ours if self.prefer == "local" else theirs
+        if merged != ours:
+            if merged is None:
+                self.session.delete_log(key)
+                self.ours.pop(item, None)
+            else:
+                log = serialize.from_document(merged)
+                self.session.logs.add(log)
+                self.session.save_log(log)
+                data = day_object(log)
+                self.days[key] = digest(data)
+                self.ours[item] = digest(data)
+            self.result.received.append(key)
+        if merged != theirs:
+            if merged is None:
+                self.theirs.pop(item, None)
+            else:
+                data = encode(merged)
+                self.objects[digest(data)] = data
+                self.theirs[item] = digest(data)
+            self.result.sent.append(key)
+
+    def _local_rows(self, table):
+        if table not in self.rows:
+            self.rows[table] = buckets(table, table_rows(table, getattr(self.session, table)))
+        return self.rows[table]
+
+    def _bucket(self, item, table, action, before, theirs):
+        ours = self._local_rows(table).get(item, {})
+        theirs = {} if theirs is None else theirs["rows"]
+        if action == "pull":
+            here = there = theirs
+        elif action == "push":
+            here = there = ours
+        else:
+            before = {} if before is None else before["rows"]
+            merged, conflicts = merge_rows(table, before, ours, theirs)
+            here, there = dict(merged), dict(merged)
+            for key in conflicts:
+                if self.prefer is None:
+                    self.result.conflicts.append(
+                        f"{_describe(table, key)}: changed on both sides"
+                    )
+                    self.conflicted.add(item)
+                    # each side keeps its own
+                    sides = ((here, ours), (there, theirs))
+                else:
+                    chosen = ours if self.prefer == "local" else theirs
+                    sides = ((here, chosen), (there, chosen))
+                for side, rows in sides:
+                    if key in rows:
+                        side[key] = rows[key]
+        if here != ours:
+            self.result.received_rows[table] = self.result.received_rows.get(
+                table, 0
+            ) + self._apply(table, ours, here)
+            self._local_rows(table)[item] = here
+            self.ours[item] = digest(rows_object(here)) if here else None
+        if there != theirs:
+            self.result.sent_rows[table] = self.result.sent_rows.get(table, 0) + sum(
+                theirs.get(key) != there.get(key) for key in set(theirs) | set(there)
+            )
+            if there:
+                data = rows_object(there)
+                self.objects[digest(data)] = data
+                self.theirs[item] = digest(data)
+            else:
+                self.theirs.pop(item, None)
+
+    def _apply(self, table, old, new):
+        """Change the table here from the rows old to new, returning how many changed"""
+        changed = sorted(key for key in set(old) | set(new) if old.get(key) != new.get(key))
+        if table == "events":
+            events = self.session.events
+            for key in changed:
+                if new.get(key) is None:
+                    events.delete_event(int(key))
+                else:
+                    events.set_event(int(key), EventDefinition(*new[key]))
+                self.session.save_event(int(key))
+            return len(changed)
+        projects = self.session.projects
+        for project_id in sorted({int(key.split("/")[0]) for key in changed}):
+            name = new.get(str(project_id))
+            project = projects.get_project(project_id)
+            if name is None:
+                if project is not None:
+                    projects.remove_project(project_id)
+                self.session.save_project(project_id)
+                continue
+            if project is None:
+                project = Project(project_id, name)
+                projects.add_project(project)
+            elif project.name != name:
+                projects.rename_project(project_id, name)
+            for key in changed:
+                if not key.startswith(f"{project_id}/"):
+                    continue
+                task_id = int(key.split("/")[1])
+                if new.get(key) is None:
+                    if project.get_task(task_id) is not None:
+                        project.remove_task(task_id)
+                elif project.get_task(task_id) is None:
+                    project.add_task(Task(task_id, new[key]))
+                else:
+                    project.rename_task(task_id, new[key])
+            self.session.save_project(project_id)
+        return len(changed)
+
+    def _saved(self):
+        """Record the digests of what was changed here against the signatures it got"""
+        for key, name in self.days.items():
+            self.state.days[key] = (self.session.signature(key), name)
+        for table in self.result.received_rows:
+            hashes = {
+                item: name
+                for item, name in self.ours.items()
+                if item.startswith(f"{table}/") and name is not None
+            }
+            self.state.tables[table] = (
+                self.session.signature(table),
+                hashes,
+                getattr(getattr(self.session, table), "last_key", 0),
+            )
+
+
+def _describe(table, key):
+    if table == "events":
+        return f"event {key}"
+    if "/" in key:
+        project_id, task_id = key.split("/")
+        return f"task {task_id} of project {project_id}"
+    return f"project {key}"
+
+
+def sync(
+    session,
+    remote,
+    prefer=None,
+    jobs=1,
+    state_file=SYNC_STATE_LOCATION,
+    bases_file=SYNC_BASES_LOCATION,
+) -> SyncResult:
+    """
+    Bring the session's storage and the sync directory remote (see open_remote) up to date
+    with each other. prefer ("local" or "remote") settles conflicts with that side's version,
+    otherwise they are left as they are and listed in the result. The files are SyncState's.
+    """
+    with locked(state_file), remote.locked():
+        state = SyncState.load(session.storage.identity(), state_file, bases_file)
+        renumbered = []
+        result = None
+        while result is None:
+            attempt = _Sync(session, remote, state, prefer)
+            result = attempt.run(jobs)
+            renumbered.extend(attempt.result.renumbered)
+        result.renumbered = renumbered
+        state.save(state_file, bases_file)
+    return result
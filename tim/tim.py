@@ -1,10 +1,11 @@
 from tim.time import Time, TimeSet, TimeFloat
 from tim.event import Event, EventID, EventEmpty
+from tim.columnar import ColumnarLog
 from dataclasses import dataclass, field
-from datetime import datetime, date
+from datetime import datetime
 from tim.constants import LOG_LOCATION
+import io
 import os
-import pickle
 
 
 @dataclass
@@ -26,18 +27,23 @@ class Tim:
         else:
             return cls([TimeSet(), TimeFloat()], [EventID(id)])
 
+    # the mutations return the positions they touched so the storage can
+    # write just those entries
     def stop(self):
         final_time = self.times[-1].set()
         self.times[-1] = final_time
+        return [len(self.times) - 1]
 
     def add(self, event_id):
         self.times[-1] = self.times[-1].set()
         self.times.append(TimeFloat())
         self.events.append(EventID(event_id))
+        return [len(self.times) - 2, len(self.times) - 1]
 
     def update_time(self, index, **kwargs):
         print(f"update time {kwargs}")
         self.times[index].update(**kwargs)
+        return [range(len(self.times))[index]]
 
     def update_event(self, index, id):
         event = self.events[index]
@@ -45,39 +51,44 @@ class Tim:
             self.events[index] = event.set_id(id)
         else:
             event.id = id
+        return [range(len(self.events))[index]]
 
     @classmethod
     def load(cls, path):
-        with open(path, "rb") as f:
-            return pickle.load(f)
+        from tim import serialize
+
+        return serialize.load(path)
+
+    def save(self, dir=LOG_LOCATION, format="binary"):
+        from tim import serialize
 
-    def save(self, dir=LOG_LOCATION):
-        os.makedirs(dir, exist_ok=True)
         path = os.path.join(dir, self.start_date.strftime("%Y-%m-%d"))
         path = f"{path}.pkl"
-        with open(path, "wb") as f:
-            pickle.dump(self, f)
+        serialize.dump(self, path, format)
 
     def delete(self, dir=LOG_LOCATION):
         path = os.path.join(dir, self.start_date.strftime("%Y-%m-%d"))
         path = f"{path}.pkl"
         os.remove(path)
 
-    def show(self, projects, events):
+    def show(self, projects, events, render=None):
         """
-        A pretty printed version of the log
+        A pretty printed version of the log. render is a RenderCache of the tables to
+        reuse across logs, one is made when it isn't given
         """
+        if render is None:
+            from tim.render import RenderCache
+
+            render = RenderCache(projects, events)
         lines = []
+        times = ColumnarLog.from_tim(self).resolved()
         for i, event in enumerate(self.events):
-            time = self.times[i]
-            next_time = self.times[i + 1]
-            lines.append(f"{i}) {time.show()}")
+            lines.append(f"{i}) {self.times[i].show()}")
 
             # add spacing in 15 minute chunks
-            diff = next_time.get_time() - time.get_time()
-            minutes = diff.seconds // 60
+            minutes = times[i + 1] - times[i]
             increments = ["  |"] * max((minutes - 1) // 15 + 1, 1)
-            increments[len(increments) // 2] += f" {i}) {event.show(projects, events)}"
+            increments[len(increments) // 2] += f" {i}) {render.show(event)}"
 
             lines.extend(increments)
 
@@ -85,93 +96,119 @@ class Tim:
         lines.append(f"{len(self.times) - 1} ) {final_time.show()}")
         print("\n".join(lines))
 
+    def rows(self, lookup):
+        """
+        (date, project id, task id, description, quantity) for every non empty entry,
+        lookup being a dict of event id to EventDefinition such as EventTable.table
+        """
+        return ColumnarLog.from_tim(self).rows(lookup)
+
     def export(self, events):
-        lines = ["Date,Project/Database ID,Task/Database ID,Description,Quantity"]
-        for i, event_id in enumerate(self.events):
-
-            if event_id.is_empty():
-                continue
-            else:
-                time = self.times[i]
-                next_time = self.times[i + 1]
-                event = events.get_event(event_id.id)
-                date = time.get_time().strftime("%m/%d/%Y")
-                project_id = event.project_id
-                task_id = event.task_id
-                description = event.description
-                quantity = (next_time.get_time() - time.get_time()).seconds / 3600
-                lines.append(
-                    f'{date},{project_id},{task_id},"{description}",{quantity}'
-                )
-        return "\n".join(lines)
+        from tim.export import write_csv
+
+        out = io.StringIO()
+        write_csv(self.rows(events.table), out)
+        return out.getvalue()
 
 
 class TimManager:
     """
     Manage multiple days of time logging
     For now identifying by start date and storing all in a separate
+
+    Only the keys are read up front, a day is loaded from the storage the first
+    time it is asked for so the cost of loading doesn't grow with the history.
     """
 
-    def __init__(self, logs=None):
+    def __init__(self, logs=None, storage=None):
+        if storage is None:
+            from tim.storage import FileStorage
+
+            storage = FileStorage()
+        self.storage = storage
         if logs is None:
             self.logs = {}
         else:
             self.logs = logs
+        # every known date key whether the log has been loaded or not
+        self.index = set(self.logs)
 
     @classmethod
-    def load(cls, dir=LOG_LOCATION):
-        logs = {}
-        os.makedirs(dir, exist_ok=True)
-        for path in os.listdir(dir):
-            filename = os.path.basename(path)
-
-            vals = filename.split(".")
-            if len(vals) > 1 and vals[-1] == "pkl":
-                try:
-                    d = datetime.strptime(vals[0], "%Y-%m-%d")
-                except ValueError as e:
-                    print(
-                        f"Expect files to have the format %Y-%m-%d.pkl, unrecognized {filename}."
-                    )
-                    continue
-            else:
-                print(
-                    f"Expect files to have the format %Y-%m-%d.pkl, unrecognized {filename}."
-                )
-                continue
-            logs[vals[0]] = Tim.load(os.path.join(dir, path))
-        return cls(logs)
-
-    def save(self, dir=LOG_LOCATION):
+    def load(cls, dir=LOG_LOCATION, storage=None):
+        if storage is None:
+            from tim.storage import FileStorage
+
+            storage = FileStorage(log_dir=dir)
+        manager = cls(storage=storage)
+        manager.index.update(storage.list_logs())
+        return manager
+
+    def save(self):
         # probably never called since you'll want to save the working file
-        for name, content in self.logs().items():
-            content.save(dir)
+        # only the logs that were actually loaded can have changed
+        for name, content in self.logs.items():
+            self.storage.save_log(content)
 
     def latest(self):
-        if len(self.logs) == 0:
+        if len(self.index) == 0:
             return None
-        items = iter(self.logs.items())
-        first = next(items)
-        max_date = first[0]
-        latest_log = first[1]
-        for d, log in items:
-            if d > max_date:
-                max_date = d
-                latest_log = log
-        return latest_log
+        return self.get_log(max(self.index))
 
     def get_log(self, key):
-        return self.logs.get(key)
+        log = self.logs.get(key)
+        if log is None and key in self.index:
+            log = self.storage.load_log(key)
+            self.logs[key] = log
+        return log
 
-    def list_logs(self):
-        return self.logs.items()
+    def iter_logs(self, start=None, end=None):
+        """
+        Yield (key, log) in date order for the keys between start and end (inclusive)
+        without holding on to them, for going over long ranges
+        """
+        for key, log in self.storage.iter_logs(start, end):
+            yield key, self.logs.get(key, log)
+
+    def iter_columns(self, start=None, end=None):
+        """iter_logs as ColumnarLogs, read straight from the archive for archived days"""
+        for key, columns in self.storage.iter_columns(start, end):
+            log = self.logs.get(key)
+            yield key, columns if log is None else ColumnarLog.from_tim(log)
+
+    def list_dates(self, start=None, end=None):
+        """The date keys, only those between start and end (inclusive) when given"""
+        return sorted(
+            key
+            for key in self.index
+            if (start is None or key >= start) and (end is None or key <= end)
+        )
 
-    def start(self):
-        log = Tim.start()
-        self.logs[log.start_date.strftime("%Y-%m-%d")] = log
+    def list_logs(self):
+        # loads everything, prefer list_dates when the contents aren't needed
+        return [(key, self.get_log(key)) for key in self.list_dates()]
+
+    def start(self, id=None):
+        log = Tim.start(id)
+        key = log.start_date.strftime("%Y-%m-%d")
+        self.logs[key] = log
+        self.index.add(key)
         return log
 
+    def add(self, log):
+        """Put a day made elsewhere (e.g. synced from another machine) in place of its date's"""
+        key = log.start_date.strftime("%Y-%m-%d")
+        self.logs[key] = log
+        self.index.add(key)
+        return key
+
     def delete(self, key):
-        log = self.get_log(key)
-        if log is not None:
-            log.delete()
+        if self.forget(key):
+            self.storage.delete_log(key)
+
+    def forget(self, key):
+        """Drop a day without deleting it from the storage, False when there's no such day"""
+        if key not in self.index:
+            return False
+        self.logs.pop(key, None)
+        self.index.discard(key)
+        return True
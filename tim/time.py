@@ -1,7 +1,13 @@
 from abc import ABC, abstractmethod
 from datetime import datetime, timezone
 from dataclasses import dataclass, field
-from dateutil import tz
+
+
+def local_tz():
+    # dateutil is only imported once a time is actually needed
+    from dateutil import tz
+
+    return tz.tzlocal()
 
 
 class Time(ABC):
@@ -10,13 +16,13 @@ class Time(ABC):
         pass
 
     def show(self):
-        return f"{self.get_time().strftime("%Y-%m-%d %H:%M")}"
+        return self.get_time().strftime("%Y-%m-%d %H:%M")
 
 
 @dataclass
 class TimeSet(Time):
     time: datetime = field(
-        default_factory=lambda: datetime.now(tz.tzlocal()).replace(second=0)
+        default_factory=lambda: datetime.now(local_tz()).replace(second=0)
     )
 
     def get_time(self):
@@ -42,7 +48,7 @@ class TimeSet(Time):
 @dataclass
 class TimeFloat(Time):
     def get_time(self):
-        return datetime.now(tz.tzlocal()).replace(second=0)
+        return datetime.now(local_tz()).replace(second=0)
 
     def update(self, **kwargs):
         pass
@@ -50,3 +56,16 @@ class TimeFloat(Time):
     def set(self):
         # convert to a set time using the current time
         return TimeSet()
+
+
+def dump_time(time: Time):
+    """Plain value for a time, the isoformat for a set time and None for a floating one"""
+    if isinstance(time, TimeSet):
+        return time.time.isoformat()
+    return None
+
+
+def load_time(value) -> Time:
+    if value is None:
+        return TimeFloat()
+    return TimeSet(datetime.fromisoformat(value).astimezone(local_tz()))
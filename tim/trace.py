@@ -0,0 +1,129 @@
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+import builtins
+import json
+import os
+import sys
+
+"""
+Timing of where a command spends its time, off unless asked for (--timings or TIM_TRACE).
+
+span() is left around the expensive phases, when recording isn't enabled it hands back a
+shared do nothing context manager so all it costs is checking a global.
+"""
+
+# (name, start, end, depth) of the finished spans, None when not recording
+_spans = None
+_depth = 0
+_NOTHING = nullcontext()
+
+
+def enable():
+    global _spans, _depth
+    _spans = []
+    _depth = 0
+
+
+def disable():
+    global _spans
+    _spans = None
+
+
+def spans():
+    return [] if _spans is None else _spans
+
+
+@contextmanager
+def recording():
+    """Record the spans of the block, yielding the list they end up in"""
+    enable()
+    try:
+        yield _spans
+    finally:
+        disable()
+
+
+class _Span:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        global _depth
+        self.depth = _depth
+        _depth += 1
+        self.start = perf_counter()
+
+    def __exit__(self, *exc):
+        global _depth
+        end = perf_counter()
+        _depth = self.depth
+        if _spans is not None:
+            _spans.append((self.name, self.start, end, self.depth))
+
+
+def span(name):
+    if _spans is None:
+        return _NOTHING
+    return _Span(name)
+
+
+def breakdown(spans):
+    """The spans as lines in the order they started, indented by how nested they are"""
+    lines = []
+    for name, start, end, depth in sorted(spans, key=lambda s: (s[1], s[3])):
+        lines.append(f"{(end - start) * 1000:9.2f} ms  {'  ' * depth}{name}")
+    return "\n".join(lines)
+
+
+def write_chrome_trace(spans, path):
+    """The spans in the Chrome trace event format, for chrome://tracing or Perfetto"""
+    origin = min((start for _, start, _, _ in spans), default=0)
+    events = [
+        {
+            "name": name,
+            "ph": "X",
+            "ts": (start - origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": 0,
+        }
+        for name, start, end, _ in spans
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def from_environment(argv, environ=os.environ):
+    """
+    argv with the flags TIM_TRACE asks for, 1 for the breakdown or a file to also write the
+    trace (.json) or profile (anything else) to
+    """
+    value = environ.get("TIM_TRACE", "")
+    if value in ("", "0") or "--timings" in argv or "--timings-output" in argv:
+        return argv
+    if value == "1":
+        return ["--timings", *argv]
+    return ["--timings", "--timings-output", value, *argv]
+
+
+class ImportTimer:
+    """Cumulative time of each module imported while active, like -X importtime"""
+
+    def __init__(self):
+        self.times = {}
+
+    def __enter__(self):
+        self._import = builtins.__import__
+        builtins.__import__ = self.timed_import
+        return self
+
+    def __exit__(self, *exc):
+        builtins.__import__ = self._import
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level != 0 or name in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        start = perf_counter()
+        module = self._import(name, globals, locals, fromlist, level)
+        self.times[name] = perf_counter() - start
+        return module